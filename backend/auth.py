@@ -1,15 +1,35 @@
+import asyncio
+import hashlib
+import heapq
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
+try:
+    import jwt as pyjwt  # PyJWT, optional faster decoder (JWT_BACKEND=pyjwt)
+except ImportError:
+    pyjwt = None
+
 SECRET_KEY = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 256))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login", auto_error=False)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -17,18 +37,167 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+class PasswordHasher:
+    # Runs bcrypt on a dedicated thread pool (bcrypt releases the GIL while
+    # hashing) so a burst of logins never blocks the event loop. At most
+    # `workers` hashes run at once; callers beyond that wait in a queue, and
+    # once `max_queue` are waiting new callers are turned away with a 503.
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(workers)
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many authentication requests",
+                                headers={"Retry-After": "1"})
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+password_hasher = PasswordHasher()
+
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.run(hash_password, password)
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+def decode_token(token: str) -> dict:
+    if JWT_BACKEND == "pyjwt" and pyjwt is not None:
+        try:
+            return pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except pyjwt.PyJWTError as e:
+            raise JWTError(str(e))
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+class TokenCache:
+    # Bounded LRU of tokens whose signature has already been verified, keyed by
+    # a digest of the token and holding (subject, exp). An entry is good until
+    # the token's own exp, so caching never extends a token's lifetime.
+    # Revoked digests are remembered until their exp, after which the token
+    # would be rejected anyway; a heap ordered by exp lets each revoke drop
+    # the ones that have run out.
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._revoked: dict = {}
+        self._revoked_by_exp: list = []
+        # Set in multi-worker mode, so a logout holds in every worker.
+        self.relay = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: bytes, now: float):
+        entry = self._entries.get(digest)
+        if entry is None or entry[1] <= now:
+            if entry is not None:
+                del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, digest: bytes, subject: str, exp: float):
+        self._entries[digest] = (subject, exp)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def revoke(self, digest: bytes, exp: float, now: Optional[float] = None, relay: bool = True):
+        now = time.time() if now is None else now
+        while self._revoked_by_exp and self._revoked_by_exp[0][0] <= now:
+            _, expired = heapq.heappop(self._revoked_by_exp)
+            # Skips digests already dropped or revoked again with a later exp.
+            if expired in self._revoked and self._revoked[expired] <= now:
+                del self._revoked[expired]
+        self._entries.pop(digest, None)
+        self._revoked[digest] = exp
+        heapq.heappush(self._revoked_by_exp, (exp, digest))
+        if relay and self.relay is not None:
+            self.relay(digest, exp)
+
+    def is_revoked(self, digest: bytes, now: float) -> bool:
+        exp = self._revoked.get(digest)
+        if exp is None:
+            return False
+        if exp <= now:
+            del self._revoked[digest]
+            return False
+        return True
+
+    def metrics(self) -> dict:
+        return {"entries": len(self._entries), "revoked": len(self._revoked),
+                "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache()
+
+def revoke_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        exp = decode_token(token).get("exp", time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    except JWTError:
+        return
+    token_cache.revoke(token_digest(token), exp)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    digest = token_digest(token)
+    now = time.time()
+    if token_cache.is_revoked(digest, now):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    email = token_cache.get(digest, now)
+    if email is not None:
+        return email
+    try:
+        payload = decode_token(token)
         email = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid token")
+        if payload.get("exp") is not None:
+            token_cache.put(digest, email, payload["exp"])
         return email
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+async def get_optional_user(token: str = Depends(optional_oauth2_scheme)):
+    if token is None:
+        return None
+    try:
+        return await get_current_user(token)
+    except HTTPException:
+        return None
@@ -0,0 +1,103 @@
+# Set-based batch updates and deletes.
+#
+# A batch names its rows either by id (optionally with the version the client
+# last saw) or, for products, by a filter. The current id and version of every
+# target are read once, then each chunk is changed with a single
+#
+#     UPDATE/DELETE ... WHERE (id, version) IN ((1, 3), (2, 7), ...) RETURNING ...
+#
+# so a row that changed after it was read is left alone and reported as a
+# conflict, exactly like the single-row endpoints' version check. Everything
+# runs in one transaction; product summaries are adjusted from the values
+# read before and returned after.
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, select, tuple_, update
+
+import summary
+from model import Product
+
+MAX_BATCH_ITEMS = 1000
+# Two bound parameters per row keeps every chunk far below SQLite's limit.
+BATCH_CHUNK_ROWS = 1000
+
+SUMMARY_COLUMNS = ("category", "supplier_id", "stock")
+
+
+@dataclass
+class BatchResult:
+    # Compact per-id outcome: every requested id lands in exactly one list.
+    done: List[int] = field(default_factory=list)
+    conflicts: List[int] = field(default_factory=list)
+    missing: List[int] = field(default_factory=list)
+    # Version of each done row after the change (its last version if deleted).
+    versions: Dict[int, int] = field(default_factory=dict)
+
+    def as_dict(self, verb: str) -> dict:
+        return {verb: self.done, "conflicts": self.conflicts, "missing": self.missing}
+
+
+def _chunks(items):
+    for start in range(0, len(items), BATCH_CHUNK_ROWS):
+        yield items[start:start + BATCH_CHUNK_ROWS]
+
+
+def _tracked(table) -> list:
+    # Columns whose before/after values feed the product summaries.
+    return [table.c[name] for name in SUMMARY_COLUMNS] if table is Product.__table__ else []
+
+
+async def read_targets(db, model, expected: Optional[Dict[int, Optional[int]]] = None, where=()):
+    # Returns (result, {id: (version, summary values)}) for the rows that may
+    # be changed: those named in `expected` (id -> version, or None for any)
+    # or matching `where`. Missing ids and stale versions are recorded in the
+    # result and left out.
+    result = BatchResult()
+    table = model.__table__
+    query = select(table.c.id, table.c.version, *_tracked(table))
+    rows = []
+    if expected is not None:
+        for chunk in _chunks(list(expected)):
+            rows += (await db.execute(query.where(table.c.id.in_(chunk)))).all()
+    else:
+        rows = (await db.execute(query.where(*where).order_by(table.c.id))).all()
+    current = {row[0]: (row[1], tuple(row[2:])) for row in rows}
+    for entity_id, version in (expected or {}).items():
+        if entity_id not in current:
+            result.missing.append(entity_id)
+        elif version is not None and version != current[entity_id][0]:
+            result.conflicts.append(entity_id)
+            del current[entity_id]
+    return result, current
+
+
+async def apply(db, model, result: BatchResult, current: dict, values: Optional[dict] = None) -> BatchResult:
+    # Updates the rows in `current` with `values`, or deletes them when values
+    # is None. The caller commits.
+    table = model.__table__
+    tracked = _tracked(table)
+    deltas = summary.Deltas()
+    for chunk in _chunks(list(current.items())):
+        matches = tuple_(table.c.id, table.c.version).in_([(i, version) for i, (version, _) in chunk])
+        if values is None:
+            stmt = delete(table).where(matches).returning(table.c.id, table.c.version)
+        else:
+            stmt = (update(table).where(matches)
+                    .values(**values, version=table.c.version + 1)
+                    .returning(table.c.id, table.c.version, *tracked))
+        changed = {row[0]: (row[1], tuple(row[2:])) for row in (await db.execute(stmt)).all()}
+        for entity_id, (_, before) in chunk:
+            if entity_id not in changed:
+                result.conflicts.append(entity_id)
+                continue
+            version, after = changed[entity_id]
+            result.done.append(entity_id)
+            result.versions[entity_id] = version
+            if tracked:
+                deltas.add(*before, sign=-1)
+                if values is not None:
+                    deltas.add(*after)
+    await deltas.apply(db)
+    return result
@@ -0,0 +1,45 @@
+"""Micro-benchmark of the per-request cost of authenticating a bearer token.
+
+Compares a full verify on every call (the old get_current_user) with the
+verified-token cache, for the configured JWT_BACKEND:
+
+    cd backend && python -m benchmarks.auth_overhead --calls 100000
+"""
+
+import argparse
+import asyncio
+import time
+
+import auth
+
+
+async def full_verify(token):
+    return auth.decode_token(token)["sub"]
+
+
+async def measure(fn, token, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        await fn(token)
+    return (time.perf_counter() - start) / calls
+
+
+async def run(calls):
+    token = auth.create_access_token({"sub": "bench@example.com"})
+    backend = auth.JWT_BACKEND if auth.pyjwt is not None or auth.JWT_BACKEND == "jose" else "jose (pyjwt missing)"
+    print(f"JWT_BACKEND={backend}")
+    print(f"{'path':>14} {'us/request':>11}")
+    for label, fn in (("full verify", full_verify), ("cached", auth.get_current_user)):
+        per_call = await measure(fn, token, calls)
+        print(f"{label:>14} {per_call * 1e6:>11.2f}")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(run(args.calls))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,128 @@
+"""Fan-out latency of the change feed with many concurrent SSE subscribers.
+
+Starts the API on a local port, opens --subscribers streams on
+/changes/stream, then updates products over HTTP and measures how long each
+event takes from publish to arrival at every subscriber. For comparison it
+also times what the same clients would do without the feed: each refetching
+the product list once.
+
+    cd backend && python -m benchmarks.change_feed --subscribers 1000 --writes 200
+"""
+
+import argparse
+import asyncio
+import socket
+import time
+
+import httpx
+import uvicorn
+
+import changes
+import main
+from benchmarks.common import percentile, seed_products, temp_database_url, use_database
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def subscriber(client, ready, received):
+    async with client.stream("GET", "/changes/stream") as res:
+        res.raise_for_status()
+        ready.release()
+        async for line in res.aiter_lines():
+            if line.startswith("id: "):
+                received.append((int(line.rpartition(".")[2]), time.perf_counter()))
+
+
+async def run(subscribers, writes, products, interval):
+    engine = await use_database(temp_database_url())
+    await seed_products(engine, products)
+    changes.feed = changes.ChangeFeed(max_subscribers=subscribers)
+    published = {}
+    publish = changes.feed.publish
+
+    def timed_publish(*args, **kwargs):
+        event = publish(*args, **kwargs)
+        published[event.seq] = time.perf_counter()
+        return event
+
+    changes.feed.publish = timed_publish
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, lifespan="off",
+                                           log_level="warning", backlog=subscribers + 64))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=subscribers + 8, max_keepalive_connections=subscribers + 8)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as streams, \
+            httpx.AsyncClient(base_url=base_url, timeout=None) as writer:
+        ready = asyncio.Semaphore(0)
+        inboxes = [[] for _ in range(subscribers)]
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(subscriber(streams, ready, inbox)) for inbox in inboxes]
+        for _ in range(subscribers):
+            await ready.acquire()
+        connect_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(writes):
+            product_id = i % products + 1
+            res = await writer.get(f"/products/{product_id}")
+            body = {key: value for key, value in res.json().items() if key not in ("id", "version")}
+            body["stock"] += 1
+            (await writer.put(f"/updateProduct/{product_id}", json=body)).raise_for_status()
+            if interval:
+                await asyncio.sleep(interval)
+        while sum(map(len, inboxes)) < subscribers * writes and time.perf_counter() - start < 60:
+            await asyncio.sleep(0.05)
+        feed_seconds = time.perf_counter() - start
+        stats = changes.feed.metrics()
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        start = time.perf_counter()
+        sem = asyncio.Semaphore(64)
+
+        async def poll():
+            async with sem:
+                res = await writer.get("/products", params={"limit": 1000, "format": "columns"})
+                return len(res.content)
+
+        polled_bytes = sum(await asyncio.gather(*(poll() for _ in range(subscribers))))
+        poll_seconds = time.perf_counter() - start
+
+    latencies = [(arrived - published[seq]) * 1000 for inbox in inboxes for seq, arrived in inbox]
+    print(f"subscribers {subscribers}, writes {writes}, connected in {connect_seconds:.2f}s")
+    print(f"delivered {len(latencies)} of {subscribers * writes} events in {feed_seconds:.2f}s "
+          f"({len(latencies) / feed_seconds:,.0f} events/s); lagged {stats['lagged']}")
+    print(f"publish -> arrival ms: p50 {percentile(latencies, 50):.1f}  p95 {percentile(latencies, 95):.1f}  "
+          f"p99 {percentile(latencies, 99):.1f}  max {max(latencies):.1f}")
+    print(f"one refetch of the first 1000 products by every subscriber: {poll_seconds:.2f}s, "
+          f"{polled_bytes / 2**20:.1f} MiB")
+
+    server.should_exit = True
+    await serving
+    await main.shutdown()
+    await engine.dispose()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between writes")
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.writes, args.products, args.interval))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,95 @@
+# Shared helpers for the benchmark scripts. Run them from ``backend/`` with
+# ``python -m benchmarks.<name>`` so the bare-name backend imports resolve.
+
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import auth
+import database
+import logs
+import main
+import model
+
+BENCH_USER = "bench@example.com"
+
+
+def temp_database_url():
+    path = os.path.join(tempfile.mkdtemp(prefix="pms-bench-"), "bench.db")
+    return f"sqlite+aiosqlite:///{path}"
+
+
+async def use_database(url):
+    engine = database.build_engine(url)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_bench_db():
+        async with session_factory() as db:
+            yield db
+
+    main.engine = engine
+    await main.create_tables()
+    main.app.dependency_overrides[main.get_db] = get_bench_db
+    main.app.dependency_overrides[main.get_read_db] = get_bench_db
+    main.app.dependency_overrides[auth.get_current_user] = lambda: BENCH_USER
+    await main.startup()
+    # Per-request access lines would drown the result tables.
+    logs.logger.setLevel(logging.WARNING)
+    return engine
+
+
+async def seed_products(engine, count, start=0, batch_size=10000):
+    async with engine.begin() as conn:
+        for offset in range(start, start + count, batch_size):
+            rows = [
+                {
+                    "name": f"Product {i}",
+                    "category": f"Category {i % 50}",
+                    "price": float(i % 1000) + 0.99,
+                    "stock": i % 1000 + 1,
+                    "sku": f"SKU{i:08d}",
+                    "supplier_id": i % 100 + 1,
+                    "status": "available",
+                }
+                for i in range(offset, min(offset + batch_size, start + count))
+            ]
+            await conn.execute(insert(model.Product), rows)
+
+
+async def seed_suppliers(engine, count, batch_size=10000):
+    async with engine.begin() as conn:
+        for offset in range(0, count, batch_size):
+            rows = [
+                {
+                    "name": f"Supplier {i}",
+                    "contact_info": f"contact{i}@example.com",
+                    "address": f"{i} Supply Street",
+                    "phone_number": f"555-{i:07d}",
+                    "email": f"supplier{i}@example.com",
+                }
+                for i in range(offset, min(offset + batch_size, count))
+            ]
+            await conn.execute(insert(model.Supplier), rows)
+
+
+def api_client():
+    transport = httpx.ASGITransport(app=main.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
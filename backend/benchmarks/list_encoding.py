@@ -0,0 +1,114 @@
+"""Time reading and encoding a large product list, old path against new.
+
+Loads the same rows as ORM instances and as column tuples, then encodes them
+every way the list endpoints can: the previous jsonable_encoder + json path,
+records with the json module and with orjson, the columnar shape and an Arrow
+IPC stream. Decode times are what the frontend pays to get a DataFrame:
+
+    cd backend && python -m benchmarks.list_encoding --rows 100000 --repeat 5
+"""
+
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import time
+
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import serialization
+from benchmarks.common import seed_products, temp_database_url, use_database
+from model import Product
+
+
+def best_of(repeat, fn):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+async def best_of_async(repeat, fn):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def old_encode(products):
+    return json.dumps(jsonable_encoder({"items": products}), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def json_module(value):
+    orjson, serialization.orjson = serialization.orjson, None
+    try:
+        return serialization.dumps(value)
+    finally:
+        serialization.orjson = orjson
+
+
+async def run(rows, repeat):
+    engine = await use_database(temp_database_url())
+    await seed_products(engine, rows)
+    keys = serialization.names(serialization.PRODUCT_COLUMNS)
+
+    async def load_orm():
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            return (await db.execute(select(Product).order_by(Product.id))).scalars().all()
+
+    async def load_tuples():
+        async with AsyncSession(engine) as db:
+            return (await db.execute(select(*serialization.PRODUCT_COLUMNS).order_by(Product.id))).all()
+
+    orm_seconds, products = await best_of_async(repeat, load_orm)
+    tuple_seconds, tuples = await best_of_async(repeat, load_tuples)
+    print(f"{rows} rows, best of {repeat}")
+    print(f"{'query':>26} {'ms':>9}")
+    print(f"{'ORM instances':>26} {orm_seconds * 1000:>9.1f}")
+    print(f"{'column tuples':>26} {tuple_seconds * 1000:>9.1f}")
+
+    def from_json(body):
+        return pd.DataFrame(json.loads(body)["items"])
+
+    def from_arrow(body):
+        return serialization.pyarrow.ipc.open_stream(io.BytesIO(body)).read_pandas()
+
+    # label -> (encode, decode)
+    encoders = {
+        "ORM + jsonable_encoder": (lambda: old_encode(products), from_json),
+        "records, json module": (lambda: json_module({"items": serialization.records(keys, tuples)}), from_json),
+        "records, dumps": (lambda: serialization.dumps({"items": serialization.records(keys, tuples)}), from_json),
+        "columns, dumps": (lambda: serialization.dumps({"items": serialization.columns(keys, tuples)}), from_json),
+    }
+    if serialization.pyarrow is not None:
+        encoders["arrow IPC"] = (lambda: serialization.arrow(keys, tuples), from_arrow)
+
+    print(f"{'encode':>26} {'ms':>9} {'MB':>7} {'gzip MB':>8} {'to pandas ms':>13}")
+    for label, (encode, decode) in encoders.items():
+        seconds, body = best_of(repeat, encode)
+        decode_seconds, frame = best_of(repeat, lambda: decode(body))
+        assert len(frame) == rows
+        print(f"{label:>26} {seconds * 1000:>9.1f} {len(body) / 1e6:>7.2f} "
+              f"{len(gzip.compress(body, 6)) / 1e6:>8.2f} {decode_seconds * 1000:>13.1f}")
+    await engine.dispose()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeat))
+
+
+if __name__ == "__main__":
+    cli()
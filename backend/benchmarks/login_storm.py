@@ -0,0 +1,69 @@
+"""Measure /products latency while a storm of logins runs in the background.
+
+Runs the same read workload twice: once with bcrypt called inline on the
+event loop (the old behaviour) and once through auth.password_hasher:
+
+    cd backend && python -m benchmarks.login_storm --logins 200 --reads 400
+"""
+
+import argparse
+import asyncio
+
+import auth
+from benchmarks.common import api_client, percentile, seed_products, temp_database_url, timed, use_database
+
+EMAIL = "storm@example.com"
+PASSWORD = "correct horse battery staple"
+
+
+async def inline_run(fn, *args):
+    return fn(*args)
+
+
+async def measure(client, logins, reads, concurrency):
+    async def login():
+        res = await client.post("/login", data={"username": EMAIL, "password": PASSWORD})
+        res.raise_for_status()
+
+    async def storm():
+        for start in range(0, logins, concurrency):
+            await asyncio.gather(*(login() for _ in range(min(concurrency, logins - start))))
+
+    storm_task = asyncio.create_task(storm())
+    samples = []
+    for n in range(reads):
+        res, elapsed = await timed(client.get("/products", params={"limit": 50, "cursor": n % 100}))
+        res.raise_for_status()
+        samples.append(elapsed)
+    await storm_task
+    return samples
+
+
+async def run(logins, reads, concurrency):
+    engine = await use_database(temp_database_url())
+    await seed_products(engine, 10000)
+    async with api_client() as client:
+        (await client.post("/register", json={"email": EMAIL, "password": PASSWORD})).raise_for_status()
+        print(f"bcrypt rounds={auth.BCRYPT_ROUNDS} workers={auth.password_hasher.workers}")
+        print(f"{'hashing':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        pooled_run = auth.password_hasher.run
+        for label, runner in (("inline", inline_run), ("pool", pooled_run)):
+            auth.password_hasher.run = runner
+            samples = await measure(client, logins, reads, concurrency)
+            print(f"{label:>10} {percentile(samples, 50) * 1000:>8.2f} {percentile(samples, 99) * 1000:>8.2f} "
+                  f"{max(samples) * 1000:>8.2f}")
+        auth.password_hasher.run = pooled_run
+    await engine.dispose()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.reads, args.concurrency))
+
+
+if __name__ == "__main__":
+    cli()
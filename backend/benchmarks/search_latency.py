@@ -0,0 +1,80 @@
+"""Measure /products/search latency on a large catalog.
+
+Seeds the catalog (the search index is filled by the products triggers),
+then times uncached searches for several query shapes. A LIKE substring scan
+over the same names is timed as the no-index baseline:
+
+    cd backend && python -m benchmarks.search_latency --products 1000000 --queries 200
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import select
+
+from benchmarks.common import api_client, percentile, seed_products, temp_database_url, timed, use_database
+from model import Product
+
+NO_STORE = {"Cache-Control": "no-store"}
+
+
+def query_shapes(products):
+    # Each shape returns a fresh q string; the seeded catalog has names
+    # "Product <i>", skus "SKU<i:08d>" and 50 categories.
+    return {
+        "sku prefix": lambda: f"SKU{random.randrange(products) // 100:06d}",
+        "name number": lambda: str(random.randrange(products)),
+        "two terms": lambda: f"product {random.randrange(products)}",
+        "category": lambda: f"category {random.randrange(50)}",
+    }
+
+
+async def like_baseline(engine, products, samples):
+    timings = []
+    async with engine.connect() as conn:
+        for _ in range(samples):
+            pattern = f"%{random.randrange(products)}%"
+            start = time.perf_counter()
+            await conn.execute(select(Product.id).where(Product.name.like(pattern)).limit(20))
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, samples):
+    print(f"{label:>14} {percentile(samples, 50) * 1000:>8.2f} {percentile(samples, 95) * 1000:>8.2f} "
+          f"{percentile(samples, 99) * 1000:>8.2f}")
+
+
+async def run(products, queries, baseline):
+    engine = await use_database(temp_database_url())
+    start = time.perf_counter()
+    await seed_products(engine, products)
+    print(f"seeded {products} products (with search index) in {time.perf_counter() - start:.1f}s")
+
+    print(f"{'query':>14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    async with api_client() as client:
+        for label, make_q in query_shapes(products).items():
+            samples = []
+            for _ in range(queries):
+                res, elapsed = await timed(client.get("/products/search", params={"q": make_q()}, headers=NO_STORE))
+                res.raise_for_status()
+                samples.append(elapsed)
+            report(label, samples)
+    if baseline:
+        report("LIKE %n% scan", await like_baseline(engine, products, baseline))
+    await engine.dispose()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--baseline", type=int, default=20, help="LIKE scans to time (0 to skip)")
+    args = parser.parse_args()
+    asyncio.run(run(args.products, args.queries, args.baseline))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,69 @@
+"""Compare cache hit rate and memory for per-user vs shared catalog keys.
+
+Simulates N users each loading the same catalog pages, first with the old
+per-user keys and then with the shared keys:
+
+    cd backend && python -m benchmarks.shared_keys --users 1000 --products 5000
+"""
+
+import argparse
+import asyncio
+
+from fastapi import Request
+from fastapi_cache import FastAPICache
+
+import auth
+import caching
+import main
+from benchmarks.common import api_client, seed_products, temp_database_url, use_database
+
+PAGES = [
+    {"limit": 100},
+    {"limit": 100, "cursor": 100},
+    {"limit": 50, "category": "Category 7"},
+]
+
+
+def user_from_header(request: Request):
+    return request.headers["X-Bench-User"]
+
+
+async def run_mode(users, per_user):
+    caching.AUTH_PARAMS = set() if per_user else {"user"}
+    caching.stats = caching.CacheStats()
+    FastAPICache.reset()
+    await main.startup()
+    async with api_client() as client:
+        for n in range(users):
+            headers = {"X-Bench-User": f"user{n}@example.com"}
+            for params in PAGES:
+                res = await client.get("/products", params=params, headers=headers)
+                res.raise_for_status()
+    backend = FastAPICache.get_backend()
+    snapshot = caching.snapshot(backend)
+    await main.shutdown()
+    return snapshot
+
+
+async def run(users, products):
+    engine = await use_database(temp_database_url())
+    await seed_products(engine, products)
+    main.app.dependency_overrides[auth.get_current_user] = user_from_header
+    print(f"{'keys':>9} {'hit rate':>9} {'entries':>8} {'cache MiB':>10}")
+    for label, per_user in (("per-user", True), ("shared", False)):
+        snapshot = await run_mode(users, per_user)
+        print(f"{label:>9} {snapshot['hit_ratio']:>9.1%} {snapshot['entries']:>8} "
+              f"{snapshot['used_bytes'] / 2**20:>10.2f}")
+    await engine.dispose()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.products))
+
+
+if __name__ == "__main__":
+    cli()
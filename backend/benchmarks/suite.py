@@ -0,0 +1,252 @@
+"""Load-test the API endpoint by endpoint and compare against a stored baseline.
+
+Seeds a fresh catalog, then drives login, list, get, search, create, update
+and delete at each concurrency level, reporting throughput and p50/p95/p99.
+By default the app runs in-process over ASGI against a temporary SQLite
+database. --url points the same workload at a running server instead, seeded
+through the API:
+
+    cd backend && python -m benchmarks.suite --products 10000 --concurrency 1 10 50 \\
+        --save baselines/local.json
+    cd backend && python -m benchmarks.suite --products 10000 --concurrency 1 10 50 \\
+        --compare baselines/local.json --tolerance 0.25
+    cd backend && python -m benchmarks.suite --url http://localhost:8000 --products 100000
+
+A comparison exits with status 1 if any endpoint's p95 grew or throughput
+fell by more than the tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import httpx
+
+import auth
+import main
+from benchmarks.common import api_client, percentile, seed_products, seed_suppliers, temp_database_url, use_database
+
+BENCH_EMAIL = "suite@example.com"
+BENCH_PASSWORD = "benchmark password"
+SCENARIOS = ["login", "list", "get", "search", "create", "update", "delete"]
+# ProductModel caps supplier_id, so seeded products reference at most this many.
+MAX_REFERENCED_SUPPLIERS = 1000
+
+
+class Workload:
+    # Builds one request per call for each scenario. Ids and skus come from a
+    # seeded RNG so two runs with the same arguments send the same requests.
+
+    def __init__(self, products, suppliers, seed):
+        self.products = products
+        self.suppliers = min(suppliers, MAX_REFERENCED_SUPPLIERS)
+        self.rng = random.Random(seed)
+        self.created = []
+        self.next_sku = 0
+
+    def product_body(self, sku):
+        return {
+            "name": f"Bench product {sku}",
+            "category": f"Category {self.rng.randrange(50)}",
+            "price": round(self.rng.uniform(1, 500), 2),
+            "stock": self.rng.randrange(1, 1000),
+            "sku": sku,
+            "supplier_id": self.rng.randrange(self.suppliers) + 1,
+            "status": "available",
+        }
+
+    def request(self, scenario):
+        if scenario == "login":
+            return "POST", "/login", {"data": {"username": BENCH_EMAIL, "password": BENCH_PASSWORD}}
+        if scenario == "list":
+            return "GET", "/products", {"params": {"limit": 100, "cursor": self.rng.randrange(self.products)}}
+        if scenario == "get":
+            return "GET", f"/products/{self.rng.randrange(self.products) + 1}", {}
+        if scenario == "search":
+            return "GET", "/products/search", {"params": {"q": f"SKU{self.rng.randrange(self.products) // 100:06d}"}}
+        if scenario == "create":
+            self.next_sku += 1
+            return "POST", "/createProduct", {"json": self.product_body(f"BENCH-{self.next_sku:08d}")}
+        if scenario == "update":
+            product_id = self.rng.randrange(self.products) + 1
+            return "PUT", f"/updateProduct/{product_id}", {"json": self.product_body(f"SKU{product_id - 1:08d}")}
+        if scenario == "delete":
+            # Deletes only rows this run created, so the seeded catalog stays intact.
+            return "DELETE", f"/deleteProduct/{self.created.pop()}", {}
+        raise ValueError(scenario)
+
+
+async def drive(client, workload, scenario, requests, concurrency, headers):
+    if scenario == "delete":
+        requests = min(requests, len(workload.created))
+    samples, errors = [], 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, path, kwargs = workload.request(scenario)
+            start = time.perf_counter()
+            try:
+                res = await client.request(method, path, headers=headers, **kwargs)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            finally:
+                samples.append(time.perf_counter() - start)
+            if res.status_code >= 400:
+                errors += 1
+            elif scenario == "create":
+                workload.created.append(res.json()["id"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    if not samples:
+        return None
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": len(samples) / wall,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+async def seed_over_api(client, products, suppliers, headers):
+    await asyncio.gather(*(
+        client.post("/createSupplier", headers=headers, json={
+            "name": f"Supplier {i}", "contact_info": "-", "address": "-",
+            "phone_number": "-", "email": f"supplier{i}@example.com"})
+        for i in range(suppliers)
+    ))
+    referenced = min(suppliers, MAX_REFERENCED_SUPPLIERS)
+    lines = (json.dumps({"name": f"Product {i}", "category": f"Category {i % 50}", "price": float(i % 1000) + 0.99,
+                         "stock": i % 1000 + 1, "sku": f"SKU{i:08d}", "supplier_id": i % referenced + 1,
+                         "status": "available"}) + "\n"
+             for i in range(products))
+
+    async def body():
+        for line in lines:
+            yield line.encode()
+
+    res = await client.post("/products/bulk", params={"batch_size": 2000}, content=body(),
+                            headers={**headers, "Content-Type": "application/x-ndjson"}, timeout=None)
+    res.raise_for_status()
+
+
+async def authenticate(client):
+    await client.post("/register", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    res = await client.post("/login", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    res.raise_for_status()
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+async def run(args):
+    engine = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        engine = await use_database(temp_database_url())
+        # Exercise real bearer-token auth rather than the benchmark override.
+        main.app.dependency_overrides.pop(auth.get_current_user, None)
+        client = api_client()
+
+    results = {}
+    async with client:
+        headers = await authenticate(client)
+        start = time.perf_counter()
+        if engine is not None:
+            await seed_suppliers(engine, args.suppliers)
+            await seed_products(engine, args.products)
+        else:
+            await seed_over_api(client, args.products, args.suppliers, headers)
+        print(f"seeded {args.products} products, {args.suppliers} suppliers in {time.perf_counter() - start:.1f}s")
+
+        workload = Workload(args.products, args.suppliers, args.seed)
+        print(f"{'endpoint':>8} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+        for concurrency in args.concurrency:
+            for scenario in args.scenarios:
+                requests = args.login_requests if scenario == "login" else args.requests
+                result = await drive(client, workload, scenario, requests, concurrency, headers)
+                if result is None:
+                    continue
+                results[f"{scenario}@{concurrency}"] = result
+                print(f"{scenario:>8} {concurrency:>5} {result['rps']:>9.1f} {result['p50_ms']:>8.2f} "
+                      f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>6}")
+    if engine is not None:
+        await main.shutdown()
+        await engine.dispose()
+    return results
+
+
+def config(args) -> dict:
+    return {
+        "target": args.url or "in-process",
+        "products": args.products,
+        "suppliers": args.suppliers,
+        "requests": args.requests,
+        "login_requests": args.login_requests,
+        "seed": args.seed,
+        "bcrypt_rounds": auth.BCRYPT_ROUNDS,
+    }
+
+
+def compare(baseline: dict, results: dict, tolerance: float):
+    regressions = []
+    for key, before in baseline["results"].items():
+        after = results.get(key)
+        if after is None:
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {before['p95_ms']:.2f} -> {after['p95_ms']:.2f} ms")
+        if after["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {before['rps']:.1f} -> {after['rps']:.1f} req/s")
+    return regressions
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--suppliers", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario and concurrency level")
+    parser.add_argument("--login-requests", type=int, default=50, help="logins are bcrypt-bound; keep this lower")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", metavar="PATH", help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="fail on regressions against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed fractional regression")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as out:
+            json.dump({"config": config(args), "python": platform.python_version(),
+                       "machine": platform.platform(), "results": results}, out, indent=2)
+        print(f"baseline written to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["config"] != config(args):
+            print(f"warning: baseline was recorded with {baseline['config']}")
+        regressions = compare(baseline, results, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    cli()
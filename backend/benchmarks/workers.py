@@ -0,0 +1,170 @@
+"""Throughput from 1 to N uvicorn workers sharing one cache.
+
+Seeds a temporary SQLite catalog, then for each worker count starts
+`uvicorn main:app --workers N` (CACHE_BACKEND=shared by default) and drives a
+read-mostly mix of cached list pages, single products and a few updates from
+--clients load processes. After each run it updates one product through one
+connection and reads it back on fresh connections, which land on different
+workers, counting reads that still see the old version:
+
+    cd backend && python -m benchmarks.workers --workers 1 2 4 --seconds 10
+    cd backend && python -m benchmarks.workers --workers 4 --backend memory   # per-process caches
+
+Load processes share the machine with the server, so leave cores for them.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+import database
+import main
+from benchmarks.common import percentile, seed_products, temp_database_url
+from benchmarks.suite import Workload, authenticate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def seed(url, products):
+    engine = database.build_engine(url)
+    main.engine = engine
+    await main.create_tables()
+    await seed_products(engine, products)
+    await engine.dispose()
+
+
+def start_server(db_url, workers, backend, port):
+    env = {**os.environ, "DATABASE_URL": db_url, "CACHE_BACKEND": backend, "BCRYPT_ROUNDS": "4",
+           "LOG_LEVEL": "WARNING", "CACHE_SHARED_PATH": f"/tmp/pms-bench-cache-{port}"}
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                             "--workers", str(workers), "--log-level", "warning"], cwd=BACKEND_DIR, env=env)
+
+
+def wait_until_up(base_url, workers, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            # Fresh connections until a few in a row succeed, so every
+            # worker has had time to finish starting.
+            if all(httpx.get(f"{base_url}/metrics").status_code == 200 for _ in range(2 * workers)):
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def drive(base_url, headers, seconds, concurrency, products, write_ratio, seed):
+    workload = Workload(products, 1, seed)
+    rng = random.Random(seed)
+    samples, errors = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            scenario = "update" if roll < write_ratio else "list" if roll < 0.5 else "get"
+            method, path, kwargs = workload.request(scenario)
+            if scenario == "list":
+                # A handful of hot pages, as a catalog UI would request.
+                kwargs = {"params": {"limit": 100, "cursor": rng.randrange(20) * 100}}
+            start = time.perf_counter()
+            try:
+                res = await client.request(method, path, headers=headers, **kwargs)
+                errors += res.status_code >= 400
+            except httpx.HTTPError:
+                errors += 1
+            samples.append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return samples, errors
+
+
+def load_process(args):
+    return asyncio.run(drive(*args))
+
+
+async def stale_reads(base_url, headers, product_id, readers=40):
+    # Each read opens its own connection, so they spread over the workers.
+    async def read():
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            return (await client.get(f"/products/{product_id}", headers=headers)).json()
+
+    current = (await asyncio.gather(*(read() for _ in range(readers))))[0]
+    body = {key: value for key, value in current.items() if key not in ("id", "version")}
+    body["stock"] += 1
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        res = await client.put(f"/updateProduct/{product_id}", json=body, headers=headers)
+        res.raise_for_status()
+    version = res.json()["data"]["version"]
+    return sum(item["version"] != version for item in await asyncio.gather(*(read() for _ in range(readers))))
+
+
+def run_once(db_url, workers, args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(db_url, workers, args.backend, port)
+    try:
+        wait_until_up(base_url, workers)
+
+        async def login():
+            async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+                return await authenticate(client)
+
+        headers = asyncio.run(login())
+        jobs = [(base_url, headers, args.seconds, args.concurrency, args.products, args.write_ratio, seed)
+                for seed in range(args.clients)]
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(load_process, jobs)
+        samples = [sample for result, _ in results for sample in result]
+        errors = sum(errors for _, errors in results)
+        stale = asyncio.run(stale_reads(base_url, headers, random.randrange(args.products) + 1))
+    finally:
+        server.terminate()
+        server.wait()
+    return {"rps": len(samples) / args.seconds, "p50_ms": percentile(samples, 50) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000, "errors": errors, "stale": stale}
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backend", choices=["shared", "memory"], default="shared")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=2, help="load-generating processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight per client process")
+    parser.add_argument("--write-ratio", type=float, default=0.02)
+    args = parser.parse_args()
+
+    db_url = temp_database_url()
+    asyncio.run(seed(db_url, args.products))
+    print(f"cpus {os.cpu_count()}, backend {args.backend}, {args.clients} x {args.concurrency} clients, "
+          f"{args.seconds:g}s per run")
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'stale reads':>12}")
+    baseline = None
+    for workers in args.workers:
+        result = run_once(db_url, workers, args)
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['rps']:>8.0f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+              f"{result['errors']:>7} {result['stale']:>8}/40   x{result['rps'] / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,60 @@
+"""Show that write latency stays flat as the products table grows.
+
+Each step grows the table and times a fixed number of updates and creates:
+
+    cd backend && python -m benchmarks.write_latency --sizes 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import statistics
+
+from benchmarks.common import api_client, percentile, seed_products, temp_database_url, timed, use_database
+
+
+def product_body(i):
+    return {
+        "name": f"Product {i} v2",
+        "category": f"Category {i % 50}",
+        "price": 19.99,
+        "stock": 5,
+        "sku": f"SKU{i:08d}",
+        "supplier_id": i % 100 + 1,
+        "status": "available",
+    }
+
+
+async def run(sizes, requests_per_size):
+    engine = await use_database(temp_database_url())
+    seeded = 0
+    async with api_client() as client:
+        print(f"{'rows':>10} {'op':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+        for size in sizes:
+            await seed_products(engine, size - seeded, start=seeded)
+            seeded = size
+            samples = {"update": [], "create": []}
+            for n in range(requests_per_size):
+                product_id = (n * 7919) % size + 1
+                res, elapsed = await timed(client.put(f"/updateProduct/{product_id}", json=product_body(product_id - 1)))
+                res.raise_for_status()
+                samples["update"].append(elapsed)
+                res, elapsed = await timed(client.post("/createProduct", json=product_body(10**7 + seeded + n)))
+                res.raise_for_status()
+                samples["create"].append(elapsed)
+            seeded += requests_per_size
+            for op, values in samples.items():
+                print(f"{size:>10} {op:>8} {percentile(values, 50) * 1000:>8.2f} "
+                      f"{percentile(values, 99) * 1000:>8.2f} {statistics.mean(values) * 1000:>8.2f}")
+    await engine.dispose()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.requests))
+
+
+if __name__ == "__main__":
+    cli()
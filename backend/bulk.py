@@ -0,0 +1,234 @@
+# Streaming bulk import/export for the products table.
+#
+# Imports are read from the request body line by line (NDJSON or CSV), so a
+# large feed never sits in memory as a whole. Valid rows are upserted on sku,
+# a batch at a time: one multi-row INSERT ... ON CONFLICT DO NOTHING for the
+# new skus, then the existing ones are locked and overwritten. Exports stream
+# rows off a server-side cursor.
+
+import asyncio
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+
+import summary
+from model import Product
+
+BULK_BATCH_SIZE = 500
+# 8 bound parameters per row keeps the largest batch under SQLite's 32766.
+BULK_MAX_BATCH_SIZE = 4000
+MAX_REPORTED_ERRORS = 1000
+EXPORT_CHUNK_ROWS = 1000
+SPOOL_CHUNK_BYTES = 1 << 16
+
+PRODUCT_FIELDS = ["name", "category", "price", "stock", "sku", "supplier_id", "status"]
+EXPORT_COLUMNS = [Product.id, *(getattr(Product, name) for name in PRODUCT_FIELDS), Product.version]
+
+INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+logger = logging.getLogger("pms.bulk")
+
+
+@dataclass
+class ImportReport:
+    received: int = 0
+    upserted: int = 0
+    failed: int = 0
+    errors: List[dict] = field(default_factory=list)
+
+    def fail(self, line: int, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+
+async def iter_lines(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+class _RecordLines:
+    # The lines csv.reader parses from, noting when it asks for one more than
+    # has arrived: the row it then returns is cut off by the end of the input
+    # so far, not complete.
+    def __init__(self, lines: List[str]):
+        self.lines = iter(lines)
+        self.starved = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.lines)
+        except StopIteration:
+            self.starved = True
+            raise
+
+
+async def iter_records(chunks, fmt: str):
+    # Yields (line number, record) pairs; a record that cannot be parsed is
+    # yielded as the exception so the caller can report it against its line.
+    # CSV lines are held back only while csv.reader is inside a quoted field
+    # that has not closed yet; the record is numbered by its first line.
+    header = None
+    number = 0
+    pending: List[str] = []
+    async for line in iter_lines(chunks):
+        number += 1
+        line = line.rstrip("\r")
+        if fmt != "csv":
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as exc:
+                    yield number, exc
+            continue
+        pending.append(line + "\n")
+        first = number - len(pending) + 1
+        source = _RecordLines(pending)
+        reader = csv.reader(source)
+        consumed = 0
+        try:
+            for values in reader:
+                if source.starved:
+                    break
+                start, consumed = first + consumed, reader.line_num
+                if not values or (len(values) == 1 and not values[0].strip()):
+                    continue
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                yield start, dict(zip(header, values))
+        except csv.Error as exc:
+            # e.g. a field over csv.field_size_limit(), which also bounds how
+            # much an unclosed quote can hold back.
+            yield first + consumed, exc
+            consumed = len(pending)
+        pending = pending[consumed:]
+    if pending:
+        yield number - len(pending) + 1, ValueError("unterminated quoted field")
+
+
+def insert_statement(dialect_name: str):
+    # Inserts the skus that do not exist yet and returns only those rows.
+    if dialect_name not in INSERTS:
+        raise NotImplementedError(f"bulk upsert is not supported on {dialect_name}")
+    stmt = INSERTS[dialect_name](Product)
+    return stmt.on_conflict_do_nothing(index_elements=[Product.sku]).returning(
+        Product.id, Product.version, Product.sku)
+
+
+def upsert_statement(dialect_name: str):
+    # Executed with a list of parameter sets: SQLAlchemy's "insertmanyvalues"
+    # turns that into multi-row VALUES batches while the statement itself is
+    # compiled once and cached.
+    if dialect_name not in INSERTS:
+        raise NotImplementedError(f"bulk upsert is not supported on {dialect_name}")
+    stmt = INSERTS[dialect_name](Product)
+    updates = {name: stmt.excluded[name] for name in PRODUCT_FIELDS if name != "sku"}
+    updates["version"] = Product.version + 1
+    return stmt.on_conflict_do_update(index_elements=[Product.sku], set_=updates).returning(
+        Product.id, Product.version, Product.sku)
+
+
+async def upsert_batch(db, batch: dict, report: ImportReport) -> List[Tuple[int, int]]:
+    # batch maps sku -> (line number, row); keying on sku keeps only the last
+    # occurrence, since one statement may not update the same row twice.
+    # Summary deltas come from what the statements did rather than from a
+    # read ahead of them, so a concurrent import of the same skus cannot get
+    # a row counted as new twice.
+    done = {}
+    try:
+        dialect_name = (await db.connection()).dialect.name
+        pending = {sku: row for sku, (_, row) in batch.items()}
+        deltas = summary.Deltas()
+        while pending:
+            # What this inserts is new. On SQLite it also takes the write lock.
+            result = await db.execute(insert_statement(dialect_name), list(pending.values()))
+            for product_id, version, sku in result.all():
+                row = pending.pop(sku)
+                deltas.add(row["category"], row["supplier_id"], row["stock"])
+                done[sku] = (product_id, version)
+            if not pending:
+                break
+            # The rest exist: lock them, then overwrite. A row deleted in
+            # between is not found and goes round again as an insert.
+            found = await summary.lock_existing(db, list(pending), deltas)
+            if found:
+                updates = [pending.pop(sku) for sku in found]
+                for row in updates:
+                    deltas.add(row["category"], row["supplier_id"], row["stock"])
+                result = await db.execute(upsert_statement(dialect_name), updates)
+                done.update((sku, (product_id, version)) for product_id, version, sku in result.all())
+        await deltas.apply(db)
+        await db.commit()
+    except SQLAlchemyError as exc:
+        await db.rollback()
+        logger.warning("bulk batch failed", extra={"rows": len(batch), "error": repr(exc)})
+        for line, _ in batch.values():
+            report.fail(line, f"database error: {exc.__class__.__name__}")
+        return []
+    report.upserted += len(done)
+    return [done[sku] for sku in batch if sku in done]
+
+
+async def spool(chunks, directory: str) -> str:
+    # Copies a request body to a file for a background import. Writes go
+    # through a thread so a slow disk does not stall the event loop.
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="import-", dir=directory)
+    with os.fdopen(fd, "wb") as out:
+        async for chunk in chunks:
+            if chunk:
+                await asyncio.to_thread(out.write, chunk)
+    return path
+
+
+async def read_spooled(path: str):
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, SPOOL_CHUNK_BYTES):
+            yield chunk
+
+
+def remove_spooled(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _encode_rows(rows, fmt: str) -> str:
+    if fmt == "csv":
+        out = io.StringIO()
+        csv.writer(out, lineterminator="\n").writerows(rows)
+        return out.getvalue()
+    names = [column.key for column in EXPORT_COLUMNS]
+    return "".join(json.dumps(dict(zip(names, row))) + "\n" for row in rows)
+
+
+async def export_products(db, fmt: str):
+    if fmt == "csv":
+        yield ",".join(column.key for column in EXPORT_COLUMNS) + "\n"
+    query = select(*EXPORT_COLUMNS).order_by(Product.id).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        yield _encode_rows(rows, fmt)
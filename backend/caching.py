@@ -0,0 +1,519 @@
+# Namespace-aware caching on top of fastapi-cache.
+#
+# Every cached read lives under a namespace ("products", "suppliers") and, for
+# single-row reads, an entity scope ("products:42"). Each scope has a
+# generation counter that is baked into the cache key, so invalidating a scope
+# is a single integer increment: entries built under the old generation are
+# simply never looked up again and age out of the backend.
+
+import asyncio
+import gzip
+import hashlib
+import os
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import asdict, dataclass
+from functools import wraps
+from inspect import Parameter, signature
+from email.utils import formatdate
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi_cache import FastAPICache
+from fastapi_cache.types import Backend
+
+import serialization
+
+try:
+    import brotli
+except ImportError:  # optional: cached bodies fall back to gzip
+    brotli = None
+
+PRODUCTS = "products"
+SUPPLIERS = "suppliers"
+STATS = "stats"
+
+# Namespaces whose entries are derived from another namespace's rows. A write
+# to the source also bumps these, so aggregates never outlive the rows they
+# were computed from.
+DERIVED_NAMESPACES = {PRODUCTS: (STATS,), SUPPLIERS: (STATS,)}
+
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_POLICY = os.getenv("CACHE_POLICY", "lru")
+# "memory" keeps entries per process; "shared" puts them, and the generation
+# counters, in a segment every worker maps (see shared.py).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_STATUS_HEADER = "X-FastAPI-Cache"
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "br" if brotli is not None else "gzip")
+COMPRESS_MIN_BYTES = 1024
+
+COMPRESSORS = {"gzip": (lambda body: gzip.compress(body, mtime=0), gzip.decompress)}
+if brotli is not None:
+    COMPRESSORS["br"] = (brotli.compress, brotli.decompress)
+
+# Dependencies that differ per request and must never become part of a key.
+UNCACHED_PARAMS = {"db"}
+# The authenticated identity. Catalog data looks the same to every user, so it
+# is left out of the key unless an endpoint opts in with per_user=True.
+AUTH_PARAMS = {"user"}
+
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    coalesced: int = 0
+
+
+stats = CacheStats()
+
+
+class Generations:
+    # Generation counters and last-modified times of this process. In shared
+    # mode shared.SharedGenerations takes its place, so an invalidation in
+    # one worker changes the keys every worker builds.
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._counts: Dict[str, int] = {}
+        self._modified_at: Dict[str, float] = {}
+
+    def get(self, scope: str) -> int:
+        return self._counts.get(scope, 0)
+
+    def modified_at(self, namespace: str) -> float:
+        return self._modified_at.get(namespace, self.started_at)
+
+    def bump(self, scopes: Iterable[str], modified_at: Optional[float] = None):
+        for scope in scopes:
+            self._counts[scope] = self.get(scope) + 1
+            if modified_at is not None:
+                self._modified_at[scope] = modified_at
+
+
+generations = Generations()
+
+
+def generation(scope: str) -> int:
+    return generations.get(scope)
+
+
+def version(namespace: str) -> str:
+    # Changes whenever the namespace is invalidated; the start time keeps a
+    # restarted process from reusing an old value.
+    return f"{int(generations.started_at * 1000):x}.{generation(namespace)}"
+
+
+def last_modified_at(namespace: str) -> float:
+    return generations.modified_at(namespace)
+
+
+def entity_scope(namespace: str, entity_id) -> str:
+    return f"{namespace}:{entity_id}"
+
+
+def _bump(namespace: str):
+    generations.bump((namespace, *DERIVED_NAMESPACES.get(namespace, ())), time.time())
+    stats.invalidations += 1
+
+
+def invalidate(namespace: str, entity_id=None):
+    # List queries can include any row, so every write bumps the namespace;
+    # only the written row's own entry is dropped from the entity scope.
+    _bump(namespace)
+    if entity_id is not None:
+        generations.bump([entity_scope(namespace, entity_id)])
+
+
+def invalidate_many(namespace: str, entity_ids):
+    _bump(namespace)
+    generations.bump([entity_scope(namespace, entity_id) for entity_id in entity_ids])
+
+
+def _params_digest(kwargs) -> str:
+    params = sorted((k, v) for k, v in kwargs.items() if k not in UNCACHED_PARAMS)
+    return hashlib.md5(repr(params).encode()).hexdigest()
+
+
+def _split_namespace(namespace: str) -> Tuple[str, str]:
+    # fastapi-cache hands the key builder "<prefix>:<namespace>".
+    prefix, _, name = namespace.rpartition(":")
+    return prefix, name
+
+
+def query_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+    prefix, name = _split_namespace(namespace)
+    return f"{prefix}:{name}:g{generation(name)}:{func.__name__}:{_params_digest(kwargs or {})}"
+
+
+def entity_key_builder(id_param: str):
+    def build(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+        prefix, name = _split_namespace(namespace)
+        scope = entity_scope(name, kwargs[id_param])
+        return f"{prefix}:{scope}:g{generation(scope)}:{func.__name__}:{_params_digest(kwargs)}"
+    return build
+
+
+class LRUPolicy:
+    def __init__(self):
+        self._order: "OrderedDict[str, None]" = OrderedDict()
+
+    def add(self, key: str):
+        self._order[key] = None
+
+    def touch(self, key: str):
+        self._order.move_to_end(key)
+
+    def remove(self, key: str):
+        del self._order[key]
+
+    def victim(self) -> str:
+        return next(iter(self._order))
+
+
+class LFUPolicy:
+    # O(1) LFU: keys are grouped in insertion-ordered buckets by hit count,
+    # so the victim is the oldest key of the lowest non-empty bucket.
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = defaultdict(OrderedDict)
+        self._min_count = 0
+
+    def add(self, key: str):
+        self._counts[key] = 1
+        self._buckets[1][key] = None
+        self._min_count = 1
+
+    def _unlink(self, key: str, count: int):
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+
+    def touch(self, key: str):
+        count = self._counts[key]
+        self._unlink(key, count)
+        if self._min_count == count and count not in self._buckets:
+            self._min_count = count + 1
+        self._counts[key] = count + 1
+        self._buckets[count + 1][key] = None
+
+    def remove(self, key: str):
+        self._unlink(key, self._counts.pop(key))
+
+    def victim(self) -> str:
+        if self._min_count not in self._buckets:
+            self._min_count = min(self._buckets)
+        return next(iter(self._buckets[self._min_count]))
+
+
+POLICIES = {"lru": LRUPolicy, "lfu": LFUPolicy}
+
+
+class TimerWheel:
+    # Hashed timer wheel: a key lands in the slot of the tick at which it
+    # expires, and advancing the wheel only visits the slots that came due.
+    # Deadlines more than one revolution away stay put until a later pass.
+
+    def __init__(self, slots: int = 512, tick: float = 1.0, now: Optional[float] = None):
+        self._slots: List[Dict[str, float]] = [{} for _ in range(slots)]
+        self._tick = tick
+        self._current = int((time.monotonic() if now is None else now) // tick)
+
+    def _slot(self, deadline: float) -> Dict[str, float]:
+        tick = max(-int(-deadline // self._tick), self._current + 1)
+        return self._slots[tick % len(self._slots)]
+
+    def schedule(self, key: str, deadline: float):
+        self._slot(deadline)[key] = deadline
+
+    def cancel(self, key: str, deadline: float):
+        slot = self._slot(deadline)
+        if slot.get(key) == deadline:
+            del slot[key]
+
+    def advance(self, now: float) -> List[Tuple[str, float]]:
+        target = int(now // self._tick)
+        due = []
+        for tick in range(self._current + 1, min(target, self._current + len(self._slots)) + 1):
+            slot = self._slots[tick % len(self._slots)]
+            for key, deadline in list(slot.items()):
+                if deadline <= now:
+                    del slot[key]
+                    due.append((key, deadline))
+        self._current = max(self._current, target)
+        return due
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: bytes, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class MemoryBackend(Backend):
+    # Per-process backend bounded by a byte budget. Entries are evicted in
+    # LRU or LFU order once the budget is exceeded, and expire through a timer
+    # wheel ticked in the background (and on writes) rather than by comparing
+    # timestamps on each lookup.
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, policy: str = CACHE_POLICY, tick: float = 1.0):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._entries: Dict[str, _Entry] = {}
+        self._policy = POLICIES[policy]()
+        self._tick = tick
+        self._wheel = TimerWheel(tick=tick)
+        self._ticker: Optional[asyncio.Task] = None
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+    def start(self):
+        if self._ticker is None:
+            self._ticker = asyncio.get_running_loop().create_task(self._run_ticker())
+
+    async def stop(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+
+    async def _run_ticker(self):
+        while True:
+            await asyncio.sleep(self._tick)
+            self.expire(time.monotonic())
+
+    def expire(self, now: float):
+        for key, deadline in self._wheel.advance(now):
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at == deadline:
+                self._remove(key)
+                stats.expirations += 1
+
+    def _remove(self, key: str) -> _Entry:
+        entry = self._entries.pop(key)
+        self._policy.remove(key)
+        self.used_bytes -= entry.size
+        return entry
+
+    def _lookup(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            stats.misses += 1
+            return None
+        self._policy.touch(key)
+        stats.hits += 1
+        return entry
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        entry = self._lookup(key)
+        if entry is None:
+            return 0, None
+        return max(0, int(entry.expires_at - time.monotonic())), entry.value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._lookup(key)
+        return entry.value if entry else None
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        now = time.monotonic()
+        self.expire(now)
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._wheel.cancel(key, self._remove(key).expires_at)
+        while self.used_bytes + size > self.max_bytes:
+            victim = self._policy.victim()
+            self._wheel.cancel(victim, self._remove(victim).expires_at)
+            stats.evictions += 1
+        entry = _Entry(value, now + (expire or CACHE_TTL_SECONDS), size)
+        self._entries[key] = entry
+        self._policy.add(key)
+        self.used_bytes += size
+        self._wheel.schedule(key, entry.expires_at)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if key is not None:
+            keys = [key] if key in self._entries else []
+        else:
+            keys = [k for k in self._entries if namespace is None or k.startswith(namespace)]
+        for k in keys:
+            self._wheel.cancel(k, self._remove(k).expires_at)
+        return len(keys)
+
+
+class SingleFlight:
+    # Coalesces concurrent loads of the same key: the first caller runs the
+    # load, everyone who arrives while it is in flight awaits its result.
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, load):
+        future = self._calls.get(key)
+        if future is not None:
+            stats.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await load()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+flights = SingleFlight()
+
+
+def encode(value) -> Tuple[str, bytes]:
+    # Produced once per cache fill. An endpoint that builds its own Response
+    # (Arrow streams) is cached with that body and media type.
+    if isinstance(value, Response):
+        return value.media_type, bytes(value.body)
+    return "application/json", serialization.dumps(value)
+
+
+def _compress(body: bytes) -> Tuple[str, bytes]:
+    if CACHE_COMPRESSION not in COMPRESSORS or len(body) < COMPRESS_MIN_BYTES:
+        return "identity", body
+    return CACHE_COMPRESSION, COMPRESSORS[CACHE_COMPRESSION][0](body)
+
+
+def _pack(etag: str, last_modified: str, media_type: str, encoding: str, body: bytes) -> bytes:
+    return f"{etag}\n{last_modified}\n{media_type}\n{encoding}\n".encode() + body
+
+
+def _unpack(payload: bytes) -> Tuple[str, str, str, str, bytes]:
+    etag, last_modified, media_type, encoding, body = payload.split(b"\n", 4)
+    return etag.decode(), last_modified.decode(), media_type.decode(), encoding.decode(), body
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+
+def _accepts(request: Request, encoding: str) -> bool:
+    # Accept-Encoding with q-values: "gzip;q=0" refuses gzip, and "*" stands
+    # for every coding not named on its own.
+    wildcard = None
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        coding = coding.lower()
+        if coding == encoding or (encoding == "gzip" and coding == "x-gzip"):
+            return q > 0
+        if coding == "*":
+            wildcard = q > 0
+    return bool(wildcard)
+
+
+def _serve(request: Request, payload: bytes, status: str) -> Response:
+    etag, last_modified, media_type, encoding, body = _unpack(payload)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding",
+        CACHE_STATUS_HEADER: status,
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        if _accepts(request, encoding):
+            headers["Content-Encoding"] = encoding
+        else:
+            body = COMPRESSORS[encoding][1](body)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def cached(namespace: str, key_builder=query_key_builder, expire: int = CACHE_TTL_SECONDS, per_user: bool = False):
+    # Replacement for fastapi-cache's @cache. Entries hold the response body
+    # already encoded (and compressed when large) together with its
+    # validators, so a hit is served as raw bytes and a matching If-None-Match
+    # becomes a body-less 304. Misses for the same key go through one load,
+    # so a cold key under a burst runs a single query. The backend and prefix
+    # still come from FastAPICache.init.
+    #
+    # Auth dependencies are resolved by FastAPI before this wrapper runs, so a
+    # shared entry is only ever served to a caller that already passed them.
+    def decorator(func):
+        @wraps(func)
+        async def inner(*args, _cache_request: Request, **kwargs):
+            if _cache_request.headers.get("Cache-Control") == "no-store":
+                return await func(*args, **kwargs)
+
+            backend = FastAPICache.get_backend()
+            key_kwargs = kwargs if per_user else {k: v for k, v in kwargs.items() if k not in AUTH_PARAMS}
+            key = key_builder(func, f"{FastAPICache.get_prefix()}:{namespace}",
+                              request=_cache_request, args=args, kwargs=key_kwargs)
+
+            payload = await backend.get(key)
+            if payload is not None:
+                return _serve(_cache_request, payload, "HIT")
+
+            async def load():
+                modified_at = last_modified_at(namespace)
+                if "db" in kwargs:
+                    # Lets the session router avoid replicas that may not
+                    # have caught up with the write that emptied this entry.
+                    kwargs["db"].info["modified_at"] = modified_at
+                last_modified = formatdate(modified_at, usegmt=True)
+                media_type, body = encode(await func(*args, **kwargs))
+                etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+                encoded = _pack(etag, last_modified, media_type, *_compress(body))
+                await backend.set(key, encoded, expire)
+                return encoded
+
+            return _serve(_cache_request, await flights.do(key, load), "MISS")
+
+        params = list(signature(func).parameters.values())
+        params.append(Parameter("_cache_request", Parameter.KEYWORD_ONLY, annotation=Request))
+        inner.__signature__ = signature(func).replace(parameters=params)
+        return inner
+
+    return decorator
+
+
+def snapshot(backend: Optional[Backend] = None) -> dict:
+    data = asdict(stats)
+    lookups = stats.hits + stats.misses
+    data["hit_ratio"] = stats.hits / lookups if lookups else 0.0
+    if isinstance(backend, MemoryBackend):
+        data["entries"] = backend.size
+    if hasattr(backend, "used_bytes"):
+        data["used_bytes"] = backend.used_bytes
+        data["max_bytes"] = backend.max_bytes
+    return data
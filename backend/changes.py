@@ -0,0 +1,265 @@
+# Change feed: one compact event per committed write, fanned out to clients.
+#
+# Write endpoints publish {entity, id, op, version} after they commit. Every
+# event gets a sequence number and is kept in a ring buffer of
+# CHANGE_BUFFER_SIZE, so a client that reconnects with the last id it saw
+# (SSE Last-Event-ID, or ?since=) gets what it missed before the live tail.
+# Ids look like "<process start>.<seq>"; an id from another process run, or
+# one older than the buffer, gets a "reset" event instead and the client
+# reloads its copy.
+#
+# Publishing never waits on a subscriber. Each one has a bounded queue of
+# CHANGE_QUEUE_SIZE events; a subscriber that falls that far behind is sent
+# "lagged" and disconnected, and can resume from its last id like any other
+# reconnect. At most CHANGE_MAX_SUBSCRIBERS streams are open per process.
+# With several workers each keeps its own feed and ids, and the other
+# workers' events arrive through shared.py's broadcast.
+# Events are encoded once at publish time and the same text is written to
+# every subscriber.
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Iterable, List, Optional, Set, Tuple
+
+CHANGE_BUFFER_SIZE = int(os.getenv("CHANGE_BUFFER_SIZE", 10000))
+CHANGE_QUEUE_SIZE = int(os.getenv("CHANGE_QUEUE_SIZE", 1000))
+CHANGE_MAX_SUBSCRIBERS = int(os.getenv("CHANGE_MAX_SUBSCRIBERS", 5000))
+CHANGE_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_HEARTBEAT_SECONDS", 15))
+# Largest page of events GET /changes returns.
+CHANGE_PAGE_SIZE = 1000
+
+ENTITIES = ("product", "supplier")
+CREATE, UPDATE, DELETE, UPSERT = "create", "update", "delete", "upsert"
+
+RESET_SSE = "event: reset\ndata: {}\n\n"
+LAGGED_SSE = "event: lagged\ndata: {}\n\n"
+KEEPALIVE_SSE = ": keepalive\n\n"
+RESET_TEXT = json.dumps({"type": "reset"})
+LAGGED_TEXT = json.dumps({"type": "lagged"})
+# Queued after a subscriber's last event when it is dropped, so a get()
+# already waiting on an empty queue wakes up.
+_LAGGED = object()
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Lagged(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    seq: int
+    entity: str
+    data: dict
+    # Pre-encoded forms, shared by every subscriber.
+    sse: str
+    text: str
+
+
+class Subscription:
+    def __init__(self, feed: "ChangeFeed", entities: Optional[Set[str]], maxsize: int):
+        self.feed = feed
+        self.entities = entities
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.lagged = False
+        # Filled in by ChangeFeed.subscribe: what the client missed, or
+        # reset=True when that can no longer be told.
+        self.backlog: List[ChangeEvent] = []
+        self.reset = False
+
+    def offer(self, event: ChangeEvent):
+        if self.lagged or (self.entities and event.entity not in self.entities):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.drop()
+            self.feed.lagged += 1
+
+    def drop(self):
+        # Ends the stream as lagged once what is already queued is delivered.
+        if self.lagged:
+            return
+        self.lagged = True
+        try:
+            self.queue.put_nowait(_LAGGED)
+        except asyncio.QueueFull:
+            # Nobody is waiting on a full queue; get() notices once it drains.
+            pass
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[ChangeEvent]:
+        # The next event, or None after `timeout` seconds without one. Raises
+        # Lagged once the events queued before falling behind are delivered.
+        if self.lagged and self.queue.empty():
+            raise Lagged()
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is _LAGGED:
+            raise Lagged()
+        return event
+
+    def close(self):
+        self.feed.subscribers.discard(self)
+
+
+class ChangeFeed:
+    def __init__(self, buffer_size: int = CHANGE_BUFFER_SIZE, queue_size: int = CHANGE_QUEUE_SIZE,
+                 max_subscribers: int = CHANGE_MAX_SUBSCRIBERS):
+        self.epoch = f"{int(time.time() * 1000):x}"
+        self.seq = 0
+        self.buffer: Deque[ChangeEvent] = deque(maxlen=buffer_size)
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.subscribers: Set[Subscription] = set()
+        self.published = 0
+        self.lagged = 0
+        self.rejected = 0
+        # Set in multi-worker mode to pass local events to the other workers.
+        self.relay: Optional[Callable[[list], None]] = None
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}.{seq}"
+
+    @property
+    def last_id(self) -> str:
+        return self.event_id(self.seq)
+
+    def publish(self, entity: str, entity_id: int, op: str, version: Optional[int] = None) -> ChangeEvent:
+        event = self._append(entity, entity_id, op, version)
+        if self.relay is not None:
+            self.relay([[entity, entity_id, op, version]])
+        return event
+
+    def publish_many(self, entity: str, rows: Iterable[Tuple[int, Optional[int]]], op: str):
+        rows = [[entity, entity_id, op, version] for entity_id, version in rows]
+        for row in rows:
+            self._append(*row)
+        if self.relay is not None and rows:
+            self.relay(rows)
+
+    def receive(self, rows: Iterable[list]):
+        # Events another worker published; delivered here without relaying.
+        for row in rows:
+            self._append(*row)
+
+    def restart(self):
+        # Events may have been lost. A new epoch makes every resume a reset,
+        # and open streams end as lagged after what they already queued.
+        self.epoch = f"{max(int(time.time() * 1000), int(self.epoch, 16) + 1):x}"
+        self.buffer.clear()
+        for subscription in self.subscribers:
+            subscription.drop()
+
+    def _append(self, entity: str, entity_id: int, op: str, version: Optional[int]) -> ChangeEvent:
+        self.seq += 1
+        event_id = self.event_id(self.seq)
+        data = {"entity": entity, "id": entity_id, "op": op, "version": version}
+        encoded = json.dumps(data, separators=(",", ":"))
+        event = ChangeEvent(self.seq, entity, data,
+                            sse=f"id: {event_id}\nevent: change\ndata: {encoded}\n\n",
+                            text=json.dumps({"type": "change", "event_id": event_id, **data}, separators=(",", ":")))
+        self.buffer.append(event)
+        self.published += 1
+        for subscription in self.subscribers:
+            subscription.offer(event)
+        return event
+
+    def _position(self, last_id: Optional[str]) -> Optional[int]:
+        # The sequence number in last_id, or None when it is not from this
+        # process run or is too old for the buffer to cover.
+        epoch, _, seq = (last_id or "").partition(".")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        oldest = self.buffer[0].seq if self.buffer else self.seq + 1
+        if seq > self.seq or seq < oldest - 1:
+            return None
+        return seq
+
+    def since(self, last_id: Optional[str], entities: Optional[Set[str]] = None,
+              limit: Optional[int] = None) -> Tuple[List[ChangeEvent], bool]:
+        # (events after last_id, reset). No last_id means "from now on".
+        if last_id is None:
+            return [], False
+        seq = self._position(last_id)
+        if seq is None:
+            return [], True
+        events = []
+        # The buffer is in seq order, so the start is found by offset.
+        start = len(self.buffer) - (self.seq - seq)
+        for index in range(start, len(self.buffer)):
+            event = self.buffer[index]
+            if entities and event.entity not in entities:
+                continue
+            events.append(event)
+            if limit is not None and len(events) >= limit:
+                break
+        return events, False
+
+    def subscribe(self, last_id: Optional[str] = None, entities: Optional[Set[str]] = None) -> Subscription:
+        if len(self.subscribers) >= self.max_subscribers:
+            self.rejected += 1
+            raise TooManySubscribers()
+        subscription = Subscription(self, entities, self.queue_size)
+        # No await between reading the backlog and registering, so no event
+        # falls between the two.
+        subscription.backlog, subscription.reset = self.since(last_id, entities)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def metrics(self) -> dict:
+        return {"last_id": self.last_id, "buffered": len(self.buffer), "subscribers": len(self.subscribers),
+                "published": self.published, "lagged": self.lagged, "rejected": self.rejected}
+
+
+async def sse(subscription: Subscription):
+    # Body of a text/event-stream response. Starlette cancels it when the
+    # client goes away, which unregisters the subscription.
+    try:
+        if subscription.reset:
+            yield RESET_SSE
+        for event in subscription.backlog:
+            yield event.sse
+        while True:
+            event = await subscription.get(CHANGE_HEARTBEAT_SECONDS)
+            yield KEEPALIVE_SSE if event is None else event.sse
+    except Lagged:
+        yield LAGGED_SSE
+    finally:
+        subscription.close()
+
+
+async def websocket_session(websocket, subscription: Subscription):
+    # Events are sent from a task while this one reads, which is only how
+    # the disconnect is noticed; clients are not expected to send anything.
+    async def forward():
+        try:
+            if subscription.reset:
+                await websocket.send_text(RESET_TEXT)
+            for event in subscription.backlog:
+                await websocket.send_text(event.text)
+            while True:
+                await websocket.send_text((await subscription.get()).text)
+        except Lagged:
+            await websocket.send_text(LAGGED_TEXT)
+            await websocket.close(code=1013)
+
+    sender = asyncio.create_task(forward())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        subscription.close()
+
+
+feed = ChangeFeed()
@@ -1,15 +1,263 @@
-# This file contains the database connection string for the Product Management System.
+# This file builds the database engines for the Product Management System from
+# environment configuration (DATABASE_URL, DATABASE_REPLICA_URLS and the
+# DB_POOL_* settings) and routes read-only sessions to replicas.
 
-from requests import Session
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import asyncio
+import os
+import time
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import metrics
+
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./product_management.db")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# How long a user's reads stay on the primary after their own write.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 10))
+# Lag beyond which a replica is taken out of rotation; also the lag assumed
+# for replicas that cannot report it (e.g. SQLite copies).
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", 5))
+
+# Applied to every new SQLite connection. WAL lets readers proceed while a
+# write is in progress; NORMAL sync is durable across app crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,
+}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    # Queue pool that records how long callers wait to check a connection out.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+def normalize_url(url: str) -> str:
+    # Hosting providers hand out postgres:// URLs; the async engine needs the
+    # asyncpg driver spelled out.
+    for prefix in ("postgres://", "postgresql://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    metrics.record_query(time.perf_counter() - context._query_started)
+
+
+def build_engine(url: str = SQLALCHEMY_DATABASE_URL, **overrides):
+    url = make_url(normalize_url(url))
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    if url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:"):
+        options.update(
+            poolclass=InstrumentedPool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    options.update(overrides)
+    new_engine = create_async_engine(url, **options)
+    event.listen(new_engine.sync_engine, "before_cursor_execute", _start_query_timer)
+    event.listen(new_engine.sync_engine, "after_cursor_execute", _stop_query_timer)
+    if url.get_backend_name() == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
+
+def pool_metrics(async_engine) -> dict:
+    pool = async_engine.sync_engine.pool
+    if not isinstance(pool, InstrumentedPool):
+        return {"pool": pool.__class__.__name__}
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    return {
+        "pool": pool.__class__.__name__,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "utilization": pool.checkedout() / capacity if capacity else 0.0,
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "wait_seconds_total": pool.wait_seconds_total,
+        "wait_seconds_max": pool.wait_seconds_max,
+        "wait_seconds_avg": pool.wait_seconds_total / pool.checkouts if pool.checkouts else 0.0,
+    }
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = make_url(normalize_url(url)).render_as_string(hide_password=True)
+        self.engine = build_engine(url)
+        self.healthy = True
+        self.lag_seconds = None
+        self.reads = 0
+        self.last_error = None
+
+    async def check(self):
+        try:
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                if conn.dialect.name == "postgresql":
+                    lag = await conn.execute(text(
+                        "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"))
+                    self.lag_seconds = float(lag.scalar())
+        except Exception as e:
+            self.healthy, self.last_error = False, repr(e)
+            return
+        self.last_error = None
+        self.healthy = self.lag_seconds is None or self.lag_seconds <= REPLICA_MAX_LAG_SECONDS
+
+
+class SessionRouter:
+    # Chooses the engine for read-only sessions. Reads go round-robin to
+    # healthy replicas, except when
+    #   * the user wrote within REPLICA_STICKY_SECONDS (read-your-writes), or
+    #   * the data being read changed more recently than the replica's lag,
+    #     so a shared cache entry is never refilled from a stale replica.
+
+    def __init__(self, primary, replica_urls=()):
+        self.primary = primary
+        self.replicas = [Replica(url) for url in replica_urls]
+        self.primary_reads = 0
+        self._turn = 0
+        self._sticky_until = {}
+        self._checker = None
+        # Set in multi-worker mode, so the user's next read stays on the
+        # primary whichever worker serves it.
+        self.relay = None
+
+    def mark_write(self, user, relay=True):
+        now = time.monotonic()
+        if len(self._sticky_until) > 1024:
+            self._sticky_until = {u: t for u, t in self._sticky_until.items() if t > now}
+        self._sticky_until[user] = now + REPLICA_STICKY_SECONDS
+        if relay and self.relay is not None and self.replicas:
+            self.relay(user)
+
+    def is_sticky(self, user) -> bool:
+        return user is not None and self._sticky_until.get(user, 0) > time.monotonic()
+
+    def pick(self, user=None, modified_at=None):
+        candidates = [r for r in self.replicas if r.healthy]
+        if modified_at is not None:
+            age = time.time() - modified_at
+            candidates = [r for r in candidates
+                          if (REPLICA_MAX_LAG_SECONDS if r.lag_seconds is None else r.lag_seconds) < age]
+        if not candidates or self.is_sticky(user):
+            self.primary_reads += 1
+            return self.primary
+        replica = candidates[self._turn % len(candidates)]
+        self._turn += 1
+        replica.reads += 1
+        return replica.engine
+
+    async def check_replicas(self):
+        await asyncio.gather(*(replica.check() for replica in self.replicas))
+
+    async def _run_checks(self):
+        while True:
+            await self.check_replicas()
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+    def start(self):
+        if self.replicas and self._checker is None:
+            self._checker = asyncio.get_running_loop().create_task(self._run_checks())
+
+    async def stop(self):
+        if self._checker is not None:
+            self._checker.cancel()
+            self._checker = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def metrics(self) -> dict:
+        return {
+            "primary_reads": self.primary_reads,
+            "sticky_users": sum(1 for t in self._sticky_until.values() if t > time.monotonic()),
+            "replicas": [
+                {"url": r.url, "healthy": r.healthy, "lag_seconds": r.lag_seconds,
+                 "reads": r.reads, "last_error": r.last_error, "pool": pool_metrics(r.engine)}
+                for r in self.replicas
+            ],
+        }
+
+
+class ReadSession(Session):
+    # Session used by read-only endpoints. The engine is chosen by the router
+    # on the first query, so callers can still set info["modified_at"] after
+    # the session is created. Flushing is refused: writes belong on the
+    # primary session.
+
+    def get_bind(self, mapper=None, **kw):
+        if self._flushing:
+            raise RuntimeError("ReadSession is read-only; use the primary session for writes")
+        if "bind" not in self.info:
+            router = self.info["router"]
+            self.info["bind"] = router.pick(self.info.get("user"), self.info.get("modified_at")).sync_engine
+        return self.info["bind"]
+
 
+@event.listens_for(Session, "after_commit")
+def _stick_to_primary(session):
+    if session.info.get("user") is not None and "router" in session.info:
+        session.info["router"].mark_write(session.info["user"])
 
-SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./product_management.db"
 
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL, connect_args={'check_same_thread': False})
+engine = build_engine()
+router = SessionRouter(engine, DATABASE_REPLICA_URLS)
 
 AsyncSessionLocal = sessionmaker(autocommit= False, autoflush= False,bind=engine, class_=AsyncSession, expire_on_commit=False)
+ReadSessionLocal = sessionmaker(autoflush=False, class_=AsyncSession, sync_session_class=ReadSession, expire_on_commit=False)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,293 @@
+# In-process background jobs with their state kept in the jobs table.
+#
+# Handlers are registered by kind with @handler and run on a fixed pool of
+# JOB_WORKERS asyncio tasks, so a long import or rebuild never holds up a
+# request. Every state change is written to the database, which makes
+# GET /jobs/{id} answerable from any process and lets a restarted process pick
+# up queued work. A worker claims a job with a conditional UPDATE, so two
+# processes never run the same job.
+#
+# A failing job is retried up to its max_attempts with exponential backoff
+# (JOB_RETRY_BACKOFF * 2 ** (attempt - 1) seconds). Cancelling a queued job
+# stops it from starting; a running job stops at its next progress report.
+# Cancellation is cooperative on purpose: interrupting a handler in the middle
+# of a statement can leave its connection holding SQLite's write lock.
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from model import Job
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", 100))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 2.0))
+# A running job not heard from for this long is assumed lost with its process.
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", 300))
+# How often a process touches updated_at of the jobs it is running, so a long
+# handler that never reports progress is not taken for lost.
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", JOB_STALE_SECONDS / 5))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+JOB_FIELDS = ("id", "kind", "status", "progress", "total", "result", "error", "attempts", "max_attempts",
+              "cancel_requested", "created_by", "created_at", "updated_at", "started_at", "finished_at")
+
+logger = logging.getLogger("pms.jobs")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Handler:
+    run: Callable
+    # Called once the job is finished for good (not between retries), e.g. to
+    # remove an uploaded file.
+    cleanup: Optional[Callable] = None
+
+
+HANDLERS: Dict[str, Handler] = {}
+
+
+def handler(kind: str, cleanup: Optional[Callable] = None):
+    def register(func):
+        HANDLERS[kind] = Handler(func, cleanup)
+        return func
+    return register
+
+
+def describe(job: Job) -> dict:
+    return {name: getattr(job, name) for name in JOB_FIELDS}
+
+
+class JobContext:
+    # Handed to every handler: the engine and sessions to work with, and
+    # progress reporting, which is also where cancellation is noticed.
+
+    def __init__(self, runner: "JobRunner", job_id: int, attempt: int):
+        self.runner = runner
+        self.job_id = job_id
+        self.attempt = attempt
+
+    @property
+    def engine(self):
+        return self.runner.engine
+
+    def session(self) -> AsyncSession:
+        return self.runner.sessions()
+
+    async def progress(self, done: int, total: Optional[int] = None):
+        if self.job_id in self.runner._cancelled:
+            raise JobCancelled()
+        values = {"progress": done, "updated_at": time.time()}
+        if total is not None:
+            values["total"] = total
+        async with self.session() as db:
+            cancel = await db.scalar(update(Job).where(Job.id == self.job_id).values(**values)
+                                     .returning(Job.cancel_requested))
+            await db.commit()
+        if cancel:
+            raise JobCancelled()
+
+
+class JobRunner:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_MAX_QUEUED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.engine = None
+        self.sessions = None
+        self.queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._running = set()
+        # Running here with a cancel requested, so progress() need not ask
+        # the database.
+        self._cancelled = set()
+        self._timers = []
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self, engine):
+        self.engine = engine
+        self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+        self.queue = asyncio.Queue()
+        await self._recover()
+        self._workers = [asyncio.create_task(self._work(), name=f"job-worker-{i}") for i in range(self.workers)]
+        self._heartbeat = asyncio.create_task(self._beat(), name="job-heartbeat")
+
+    async def stop(self):
+        # Running jobs are put back in the queue for the next start.
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        tasks = [*self._workers, self._heartbeat] if self._heartbeat else self._workers
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+
+    async def _update(self, job_id: int, where=(), **values) -> bool:
+        values.setdefault("updated_at", time.time())
+        async with self.sessions() as db:
+            result = await db.execute(update(Job).where(Job.id == job_id, *where).values(**values))
+            await db.commit()
+        return result.rowcount == 1
+
+    async def _recover(self):
+        now = time.time()
+        async with self.sessions() as db:
+            await db.execute(update(Job)
+                             .where(Job.status == RUNNING, Job.updated_at < now - JOB_STALE_SECONDS)
+                             .values(status=QUEUED, updated_at=now, run_after=now))
+            await db.commit()
+            queued = (await db.execute(select(Job.id, Job.run_after).where(Job.status == QUEUED)
+                                       .order_by(Job.id))).all()
+        for job_id, run_after in queued:
+            self._enqueue_later(job_id, max(0.0, run_after - now))
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            if not self._running:
+                continue
+            try:
+                async with self.sessions() as db:
+                    await db.execute(update(Job).where(Job.id.in_(list(self._running)), Job.status == RUNNING)
+                                     .values(updated_at=time.time()))
+                    await db.commit()
+            except Exception:
+                # A missed beat is retried on the next one.
+                logger.exception("job heartbeat failed")
+
+    def _enqueue_later(self, job_id: int, delay: float):
+        loop = asyncio.get_running_loop()
+        self._timers = [timer for timer in self._timers if not timer.cancelled() and timer.when() > loop.time()]
+        self._timers.append(loop.call_later(delay, self.queue.put_nowait, job_id))
+
+    async def submit(self, kind: str, params: Optional[dict] = None, user: Optional[str] = None,
+                     max_attempts: int = JOB_MAX_ATTEMPTS) -> dict:
+        if kind not in HANDLERS:
+            raise KeyError(kind)
+        if self.queue.qsize() >= self.max_queued:
+            raise QueueFull()
+        now = time.time()
+        job = Job(kind=kind, status=QUEUED, params=params or {}, max_attempts=max_attempts, created_by=user,
+                  created_at=now, updated_at=now, run_after=now)
+        async with self.sessions() as db:
+            db.add(job)
+            await db.commit()
+        self.queue.put_nowait(job.id)
+        return describe(job)
+
+    async def get(self, job_id: int) -> Optional[dict]:
+        async with self.sessions() as db:
+            job = await db.get(Job, job_id)
+            return describe(job) if job else None
+
+    async def list(self, limit: int = 50, status: Optional[str] = None) -> list:
+        query = select(Job).order_by(Job.id.desc()).limit(limit)
+        if status is not None:
+            query = query.where(Job.status == status)
+        async with self.sessions() as db:
+            return [describe(job) for job in (await db.scalars(query)).all()]
+
+    async def cancel(self, job_id: int) -> Optional[dict]:
+        now = time.time()
+        # A queued job is cancelled outright; a running one is flagged and
+        # stops when it next reports progress.
+        if await self._update(job_id, where=[Job.status == QUEUED], status=CANCELLED, cancel_requested=True,
+                              finished_at=now):
+            await self._cleanup(job_id)
+        elif await self._update(job_id, where=[Job.status == RUNNING], cancel_requested=True):
+            if job_id in self._running:
+                self._cancelled.add(job_id)
+        return await self.get(job_id)
+
+    async def _work(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("job runner error", extra={"job_id": job_id})
+
+    async def _claim(self, job_id: int):
+        now = time.time()
+        async with self.sessions() as db:
+            row = (await db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == QUEUED, Job.run_after <= now, Job.cancel_requested.is_(False))
+                .values(status=RUNNING, attempts=Job.attempts + 1, started_at=now, updated_at=now, error=None)
+                .returning(Job.kind, Job.params, Job.attempts, Job.max_attempts))).first()
+            await db.commit()
+        return row
+
+    async def _run(self, job_id: int):
+        claimed = await self._claim(job_id)
+        if claimed is None:
+            return
+        kind, params, attempt, max_attempts = claimed
+        context = JobContext(self, job_id, attempt)
+        task = asyncio.create_task(HANDLERS[kind].run(context, params))
+        self._running.add(job_id)
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                # The worker itself is stopping: interrupt the job and leave
+                # it queued, without counting the attempt.
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await self._update(job_id, status=QUEUED, attempts=attempt - 1, run_after=time.time())
+                raise
+            await self._finish(job_id, CANCELLED)
+        except JobCancelled:
+            await self._finish(job_id, CANCELLED)
+        except Exception as exc:
+            if attempt < max_attempts:
+                delay = JOB_RETRY_BACKOFF * 2 ** (attempt - 1)
+                logger.warning("job failed, retrying", extra={"job_id": job_id, "kind": kind, "attempt": attempt,
+                                                               "retry_in": delay, "error": repr(exc)})
+                await self._update(job_id, status=QUEUED, error=repr(exc), run_after=time.time() + delay)
+                self._enqueue_later(job_id, delay)
+            else:
+                logger.error("job failed", extra={"job_id": job_id, "kind": kind, "attempt": attempt,
+                                                  "error": repr(exc)})
+                await self._finish(job_id, FAILED, error=repr(exc))
+        else:
+            await self._finish(job_id, SUCCEEDED, result=result)
+        finally:
+            self._running.discard(job_id)
+            self._cancelled.discard(job_id)
+
+    async def _finish(self, job_id: int, status: str, **values):
+        await self._update(job_id, status=status, finished_at=time.time(), **values)
+        await self._cleanup(job_id)
+
+    async def _cleanup(self, job_id: int):
+        async with self.sessions() as db:
+            job = await db.get(Job, job_id)
+        cleanup = HANDLERS[job.kind].cleanup if job.kind in HANDLERS else None
+        if cleanup is not None:
+            try:
+                await cleanup(job.params)
+            except Exception:
+                logger.exception("job cleanup failed", extra={"job_id": job_id})
+
+
+runner = JobRunner()
@@ -0,0 +1,109 @@
+# Structured, non-blocking logging.
+#
+# Records are formatted as one JSON object per line on the calling thread
+# (cheap CPU work) and handed to a QueueHandler; a QueueListener thread does
+# the actual writes, so a slow stdout or log collector never stalls the event
+# loop. Each record carries the id of the request it was logged under.
+
+import json
+import logging
+import os
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+logger = logging.getLogger("pms")
+
+# Attributes every LogRecord has; anything else was passed via extra=.
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": request_id.get(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup(stream=None, level: str = LOG_LEVEL):
+    # Idempotent: startup may run more than once per process (tests, reloads).
+    global _listener
+    if _listener is not None:
+        return
+    records = queue.SimpleQueue()
+    handler = QueueHandler(records)
+    handler.setFormatter(JsonFormatter())
+    writer = logging.StreamHandler(stream or sys.stdout)
+    _listener = QueueListener(records, writer)
+    _listener.start()
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def shutdown():
+    # Flushes whatever is still queued before the process exits.
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    for handler in [h for h in logger.handlers if isinstance(h, QueueHandler)]:
+        logger.removeHandler(handler)
+
+
+class RequestContextMiddleware:
+    # Plain ASGI middleware (no response buffering): assigns the request id,
+    # echoes it in X-Request-ID and logs one access record per request.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = dict(scope["headers"]).get(REQUEST_ID_HEADER.lower().encode())
+        rid = incoming.decode("latin-1")[:64] if incoming else uuid.uuid4().hex
+        token = request_id.set(rid)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER.encode(), rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        except Exception:
+            logger.exception("unhandled error", extra={"method": scope["method"], "path": scope["path"]})
+            raise
+        finally:
+            logger.info("request", extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            })
+            request_id.reset(token)
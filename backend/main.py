@@ -2,45 +2,148 @@ from hmac import new
 from random import sample
 from re import A
 import stat
-from typing import Annotated, Optional
+import os
+import tempfile
+from dataclasses import asdict
+from typing import Annotated, List, Literal, Optional
 import model
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel
-from model import Product, Supplier, User
-from database import engine, AsyncSessionLocal
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, ValidationError, model_validator
+from model import CategorySummary, Product, Supplier, SupplierSummary, User
+import database
+from database import engine, AsyncSessionLocal, ReadSessionLocal
 from sqlalchemy.orm import Session
 from starlette import status
 from pydantic import Field
 import auth
-from auth import hash_password
+import batch
+import bulk
+import caching
+import changes
+import jobs
+import logs
+import metrics
+import search
+import serialization
+import shared
+import summary
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import inspect, text
 from sqlalchemy.future import select
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
-from fastapi_cache.decorator import cache
 
 app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(logs.RequestContextMiddleware)
+logger = logs.logger
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 import asyncio
 
+# Columns added to tables that older databases already have; create_all only
+# creates missing tables, so these are added in place at startup.
+ADDED_COLUMNS = {
+    "products": {"version": "INTEGER NOT NULL DEFAULT 1"},
+    "suppliers": {"version": "INTEGER NOT NULL DEFAULT 1"},
+}
+
+def add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+def create_missing_indexes(conn):
+    # create_all skips the indexes of tables that already exist.
+    for table in model.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(model.Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+        await conn.run_sync(create_missing_indexes)
+        await summary.ensure(conn)
+        await search.install(conn)
 
 @app.on_event("startup")
 async def on_startup():
     await create_tables()
 
-async def get_db():
+async def get_db(user: Annotated[Optional[str], Depends(auth.get_optional_user)]):
     async with AsyncSessionLocal() as db:
+        db.info.update(router=database.router, user=user)
+        try:
+            yield db
+        except Exception:
+            # Hand the connection back to the pool without an open transaction.
+            await db.rollback()
+            raise
+
+async def get_read_db(user: Annotated[Optional[str], Depends(auth.get_optional_user)]):
+    # Read-only endpoints: the router sends the first query to a replica
+    # unless this user just wrote or the data changed too recently.
+    async with ReadSessionLocal() as db:
+        db.info.update(router=database.router, user=user)
         yield db
 
 
 user_dependency = Annotated[str, Depends(auth.get_current_user)]
 db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+SEARCH_PAGE_SIZE = 20
+# Ranked results page by offset; deep pages cost as much as all those before.
+MAX_SEARCH_OFFSET = 10000
+# Where background imports keep the uploaded body until their job finishes.
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "pms-jobs"))
+
+limit_query = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)]
+cursor_query = Annotated[Optional[int], Query(description="id of the last row of the previous page")]
+order_query = Annotated[Literal["asc", "desc"], Query()]
+format_query = Annotated[Literal[serialization.FORMATS], Query(
+    alias="format", description="records (list of objects), columns (one list per column) or arrow (IPC stream)")]
+
+def paginate(query, id_column, cursor, limit, order):
+    # Keyset pagination: seek past the cursor on the primary key and fetch one
+    # extra row to know whether another page exists.
+    if order == "asc":
+        if cursor is not None:
+            query = query.where(id_column > cursor)
+        query = query.order_by(id_column.asc())
+    else:
+        if cursor is not None:
+            query = query.where(id_column < cursor)
+        query = query.order_by(id_column.desc())
+    return query.limit(limit + 1)
+
+def page_response(columns, rows, limit, fmt="records"):
+    items = rows[:limit]
+    next_cursor = items[-1].id if len(rows) > limit else None
+    return serialization.page(serialization.names(columns), items, fmt, next_cursor=next_cursor)
+
+def entity_etag(kind, entity):
+    return f'W/"{kind}-{entity.id}-{entity.version}"'
+
+async def commit_or_conflict(db):
+    # The version column makes an UPDATE/DELETE of a row that changed since
+    # it was loaded match nothing; report that as a conflict, not a 500.
+    try:
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Modified concurrently; reload and retry")
 
 class UserLogin(BaseModel):
     email: str
@@ -50,26 +153,6 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-class ProductData():
-    id: Optional[int] = None
-    name: str
-    price: float
-    category: str
-    stock: int
-    sku: str
-    supplier_id: int
-    status: str
-
-    def __init__(self, id: Optional[int], name, category, price, stock=0, sku=None, supplier_id=None, status=None):
-        self.id = id
-        self.name = name
-        self.price = price
-        self.category = category
-        self.stock = stock
-        self.sku = sku
-        self.supplier_id = supplier_id
-        self.status = status
-
 class ProductModel(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
     category: str = Field(..., min_length=1, max_length=100)
@@ -93,22 +176,6 @@ class ProductModel(BaseModel):
         }
     }
 
-class SupplierData():
-    id: Optional[int] = None
-    name: str
-    contact_info: str
-    address: str
-    phone_number: str
-    email: str
-
-    def __init__(self, id, name, contact_info, address, phone_number, email):
-        self.id = id
-        self.name = name
-        self.contact_info = contact_info
-        self.address = address
-        self.phone_number = phone_number
-        self.email = email
-
 class SupplierModel(BaseModel):
     name: str
     contact_info: str
@@ -128,67 +195,519 @@ class SupplierModel(BaseModel):
         }
     }
 
+class JobRequest(BaseModel):
+    # Jobs that need no input; imports are queued by POST /products/bulk?background=true.
+    kind: Literal["summary.rebuild", "search.reindex"]
+
+class BatchTarget(BaseModel):
+    id: int
+    # The version the client last saw; omit it to change the row regardless.
+    version: Optional[int] = None
+
+class ProductFilter(BaseModel):
+    category: Optional[str] = None
+    status: Optional[str] = None
+    supplier_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def not_empty(self):
+        if not self.model_dump(exclude_none=True):
+            raise ValueError("filter needs at least one of category, status, supplier_id")
+        return self
+
+class ProductChanges(BaseModel):
+    # ProductModel's fields minus sku, which is unique per product.
+    name: Optional[str] = Field(None, min_length=1, max_length=100)
+    category: Optional[str] = Field(None, min_length=1, max_length=100)
+    price: Optional[float] = None
+    stock: Optional[int] = Field(None, gt=0, le=1000)
+    supplier_id: Optional[int] = Field(None, gt=0, le=1000)
+    status: Optional[str] = Field(None, min_length=1, max_length=100)
+
+    @model_validator(mode="after")
+    def not_empty(self):
+        if not self.model_dump(exclude_none=True):
+            raise ValueError("set at least one field")
+        return self
+
+class ProductBatch(BaseModel):
+    items: Optional[List[BatchTarget]] = Field(None, min_length=1, max_length=batch.MAX_BATCH_ITEMS)
+    filter: Optional[ProductFilter] = None
+    # All or nothing: any missing or conflicting row fails the whole batch.
+    atomic: bool = False
+
+    @model_validator(mode="after")
+    def one_selector(self):
+        if (self.items is None) == (self.filter is None):
+            raise ValueError("give either items or filter")
+        return self
+
+class ProductBatchUpdate(ProductBatch):
+    set: ProductChanges
+
+class SupplierChanges(BaseModel):
+    name: Optional[str] = None
+    contact_info: Optional[str] = None
+    address: Optional[str] = None
+    phone_number: Optional[str] = None
+    email: Optional[str] = None
+
+    @model_validator(mode="after")
+    def not_empty(self):
+        if not self.model_dump(exclude_none=True):
+            raise ValueError("set at least one field")
+        return self
+
+class SupplierBatch(BaseModel):
+    items: List[BatchTarget] = Field(..., min_length=1, max_length=batch.MAX_BATCH_ITEMS)
+    atomic: bool = False
+
+class SupplierBatchUpdate(SupplierBatch):
+    set: SupplierChanges
+
 @app.on_event("startup")
 async def startup():
-    FastAPICache.init(InMemoryBackend())
+    logs.setup()
+    backend = shared.start() if caching.CACHE_BACKEND == "shared" else caching.MemoryBackend()
+    backend.start()
+    FastAPICache.init(backend)
+    database.router.start()
+    await jobs.runner.start(engine)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await jobs.runner.stop()
+    await FastAPICache.get_backend().stop()
+    await database.router.stop()
+    logs.shutdown()
 
 @app.post("/register")
 async def register(user: UserLogin, db: db_dependency):
+    hashed_pw = await auth.hash_password_async(user.password)
     try:
-        hashed_pw = hash_password(user.password)
-        db_user = User(email=user.email, hashed_password=hashed_pw)
-        db.add(db_user)
+        db.add(User(email=user.email, hashed_password=hashed_pw))
         await db.commit()
-        return {"message": "User registered successfully"}
-    except Exception as e:
-        db.rollback()
-        print("DB Error:", e)  # You can replace with proper logging
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered")
+    except SQLAlchemyError:
+        await db.rollback()
+        logger.exception("register failed")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    return {"message": "User registered successfully"}
 
 @app.get("/users", status_code=status.HTTP_200_OK)
-async def get_users(db: db_dependency):
+async def get_users(db: read_db_dependency):
     result = await db.execute(select(User))
     users = result.scalars().all()
     return users
 
 @app.post("/login", response_model=Token)
 async def login(db: db_dependency, form_data: OAuth2PasswordRequestForm = Depends()):
-    result = await db.execute(select(User))
     result = await db.execute(select(User).where(User.email == form_data.username))
     db_user = result.scalars().first()
-    if not db_user or not auth.verify_password(form_data.password, db_user.hashed_password):
+    if not db_user or not await auth.verify_password_async(form_data.password, db_user.hashed_password):
         raise HTTPException(status_code=400, detail="Invalid credentials")
     token = auth.create_access_token({"sub": db_user.email})
     return {"access_token": token, "token_type": "bearer"}
 
+@app.post("/logout")
+async def logout(token: Annotated[str, Depends(auth.oauth2_scheme)], user: user_dependency):
+    auth.revoke_token(token)
+    return {"message": "Logged out"}
+
 @app.get("/products", status_code=status.HTTP_200_OK)
-@cache(expire=60)
-async def get_products(db: db_dependency, user: user_dependency):
-    result = await db.execute(select(Product))
-    products = result.scalars().all()
-    return products
+@caching.cached(caching.PRODUCTS)
+async def get_products(db: read_db_dependency, user: user_dependency,
+                       limit: limit_query = DEFAULT_PAGE_SIZE,
+                       cursor: cursor_query = None,
+                       order: order_query = "asc",
+                       category: Optional[str] = None,
+                       product_status: Annotated[Optional[str], Query(alias="status")] = None,
+                       supplier_id: Optional[int] = None,
+                       min_price: Annotated[Optional[float], Query(ge=0)] = None,
+                       max_price: Annotated[Optional[float], Query(ge=0)] = None,
+                       q: Annotated[Optional[str], Query(min_length=1, max_length=200,
+                                                         description="search terms, see /products/search")] = None,
+                       fmt: format_query = "records"):
+    # Column tuples rather than Product instances: no identity map, no
+    # per-object encoding.
+    query = select(*serialization.PRODUCT_COLUMNS)
+    if q is not None:
+        # Through the search index; a LIKE on name or sku would scan.
+        match = search.matches((await db.connection()).dialect.name, q)
+        if match is None:
+            return page_response(serialization.PRODUCT_COLUMNS, [], limit, fmt)
+        query = query.where(match)
+    if category is not None:
+        query = query.where(Product.category == category)
+    if product_status is not None:
+        query = query.where(Product.status == product_status)
+    if supplier_id is not None:
+        query = query.where(Product.supplier_id == supplier_id)
+    if min_price is not None:
+        query = query.where(Product.price >= min_price)
+    if max_price is not None:
+        query = query.where(Product.price <= max_price)
+    result = await db.execute(paginate(query, Product.id, cursor, limit, order))
+    return page_response(serialization.PRODUCT_COLUMNS, result.all(), limit, fmt)
 
 @app.get("/suppliers")
-@cache(expire=60)
-async def get_suppliers(db: db_dependency, user: user_dependency):
-    result = await db.execute(select(Supplier))
-    suppliers = result.scalars().all()
-    return suppliers
+@caching.cached(caching.SUPPLIERS)
+async def get_suppliers(db: read_db_dependency, user: user_dependency,
+                        limit: limit_query = DEFAULT_PAGE_SIZE,
+                        cursor: cursor_query = None,
+                        order: order_query = "asc",
+                        fmt: format_query = "records"):
+    query = select(*serialization.SUPPLIER_COLUMNS)
+    result = await db.execute(paginate(query, Supplier.id, cursor, limit, order))
+    return page_response(serialization.SUPPLIER_COLUMNS, result.all(), limit, fmt)
+
+async def import_products(db, chunks, fmt, batch_size, on_batch=None):
+    report = bulk.ImportReport()
+    pending = {}
+    async for line, record in bulk.iter_records(chunks, fmt):
+        report.received += 1
+        if isinstance(record, Exception):
+            report.fail(line, f"unparseable row: {record}")
+            continue
+        try:
+            product = ProductModel.model_validate(record)
+        except ValidationError as e:
+            report.fail(line, e.errors(include_url=False, include_context=False))
+            continue
+        pending[product.sku] = (line, product.model_dump())
+        if len(pending) >= batch_size:
+            await upsert_products(db, pending, report)
+            pending = {}
+            if on_batch is not None:
+                await on_batch(report)
+    if pending:
+        await upsert_products(db, pending, report)
+    return report
+
+async def upsert_products(db, pending, report):
+    rows = await bulk.upsert_batch(db, pending, report)
+    caching.invalidate_many(caching.PRODUCTS, [product_id for product_id, _ in rows])
+    changes.feed.publish_many("product", rows, changes.UPSERT)
+
+@app.post("/products/bulk")
+async def bulk_import_products(request: Request, response: Response, db: db_dependency, user: user_dependency,
+                               batch_size: Annotated[int, Query(ge=1, le=bulk.BULK_MAX_BATCH_SIZE)] = bulk.BULK_BATCH_SIZE,
+                               fmt: Annotated[Optional[Literal["ndjson", "csv"]], Query(alias="format")] = None,
+                               background: Annotated[bool, Query(description="queue as a job; poll /jobs/{id}")] = False):
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if not background:
+        return await import_products(db, request.stream(), fmt, batch_size)
+    # The body is spooled to disk first, so the job outlives this request.
+    path = await bulk.spool(request.stream(), JOB_SPOOL_DIR)
+    try:
+        job = await submit_job(response, "products.import", {"path": path, "format": fmt, "batch_size": batch_size}, user)
+    except HTTPException:
+        await remove_upload({"path": path})
+        raise
+    return job
+
+async def submit_job(response, kind, params=None, user=None):
+    try:
+        job = await jobs.runner.submit(kind, params, user)
+    except jobs.QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full; try again later")
+    response.status_code = status.HTTP_202_ACCEPTED
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return job
+
+async def remove_upload(params):
+    await asyncio.to_thread(bulk.remove_spooled, params["path"])
+
+@jobs.handler("products.import", cleanup=remove_upload)
+async def import_products_job(ctx, params):
+    path = params["path"]
+    size = await asyncio.to_thread(os.path.getsize, path)
+    read = 0
+
+    async def chunks():
+        nonlocal read
+        async for chunk in bulk.read_spooled(path):
+            read += len(chunk)
+            yield chunk
+
+    async def report_progress(report):
+        await ctx.progress(read, size)
+
+    async with ctx.session() as db:
+        report = await import_products(db, chunks(), params["format"], params["batch_size"], report_progress)
+    await ctx.progress(size, size)
+    return asdict(report)
+
+@jobs.handler("summary.rebuild")
+async def rebuild_summaries_job(ctx, params):
+    async with ctx.engine.begin() as conn:
+        await summary.rebuild(conn)
+    caching.invalidate(caching.STATS)
+
+@jobs.handler("search.reindex")
+async def reindex_search_job(ctx, params):
+    async with ctx.engine.begin() as conn:
+        await search.rebuild(conn)
+    caching.invalidate(caching.PRODUCTS)
+
+@app.post("/jobs")
+async def create_job(body: JobRequest, response: Response, user: user_dependency):
+    return await submit_job(response, body.kind, user=user)
+
+@app.get("/jobs")
+async def list_jobs(user: user_dependency, limit: Annotated[int, Query(ge=1, le=500)] = 50,
+                    job_status: Annotated[Optional[str], Query(alias="status")] = None):
+    return await jobs.runner.list(limit, job_status)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: int, user: user_dependency):
+    job = await jobs.runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int, user: user_dependency):
+    job = await jobs.runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in jobs.FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return await jobs.runner.cancel(job_id)
+
+@app.get("/products/export")
+async def export_products(db: read_db_dependency, user: user_dependency,
+                          fmt: Annotated[Literal["ndjson", "csv"], Query(alias="format")] = "ndjson"):
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(bulk.export_products(db, fmt), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename=products.{fmt}"})
+
+@app.get("/products/search")
+@caching.cached(caching.PRODUCTS)
+async def search_products(db: read_db_dependency, user: user_dependency,
+                          q: Annotated[str, Query(min_length=1, max_length=200)],
+                          limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = SEARCH_PAGE_SIZE,
+                          offset: Annotated[int, Query(ge=0, le=MAX_SEARCH_OFFSET)] = 0,
+                          fmt: format_query = "records"):
+    keys = serialization.names(serialization.PRODUCT_COLUMNS)
+    query = search.search_query((await db.connection()).dialect.name, q, serialization.PRODUCT_COLUMNS)
+    if query is None:
+        return serialization.page(keys, [], fmt, next_offset=None)
+    result = await db.execute(query.limit(limit + 1).offset(offset))
+    products = result.all()
+    next_offset = offset + limit if len(products) > limit and offset + limit <= MAX_SEARCH_OFFSET else None
+    return serialization.page(keys, products[:limit], fmt, next_offset=next_offset)
+
+async def run_batch(db, entity, namespace, kind, body, verb, values=None, where=()):
+    # One transaction for the whole batch; see batch.py for the version check.
+    expected = {item.id: item.version for item in body.items} if body.items is not None else None
+    try:
+        result, current = await batch.read_targets(db, entity, expected, where)
+        await batch.apply(db, entity, result, current, values)
+        if body.atomic and (result.conflicts or result.missing):
+            await db.rollback()
+            raise HTTPException(status_code=409, detail={
+                "message": "Batch not applied", "conflicts": result.conflicts, "missing": result.missing})
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Batch violates a constraint; nothing was changed")
+    caching.invalidate_many(namespace, result.done)
+    changes.feed.publish_many(kind, result.versions.items(), changes.UPDATE if values is not None else changes.DELETE)
+    return result.as_dict(verb)
+
+def product_filter(body: ProductBatch):
+    if body.filter is None:
+        return ()
+    return [getattr(Product, key) == value for key, value in body.filter.model_dump(exclude_none=True).items()]
+
+@app.patch("/products/batch")
+async def update_products_batch(body: ProductBatchUpdate, db: db_dependency, user: user_dependency):
+    return await run_batch(db, Product, caching.PRODUCTS, "product", body, "updated",
+                           values=body.set.model_dump(exclude_none=True), where=product_filter(body))
+
+@app.delete("/products/batch")
+async def delete_products_batch(body: ProductBatch, db: db_dependency, user: user_dependency):
+    return await run_batch(db, Product, caching.PRODUCTS, "product", body, "deleted", where=product_filter(body))
+
+@app.patch("/suppliers/batch")
+async def update_suppliers_batch(body: SupplierBatchUpdate, db: db_dependency, user: user_dependency):
+    return await run_batch(db, Supplier, caching.SUPPLIERS, "supplier", body, "updated",
+                           values=body.set.model_dump(exclude_none=True))
+
+@app.delete("/suppliers/batch")
+async def delete_suppliers_batch(body: SupplierBatch, db: db_dependency, user: user_dependency):
+    return await run_batch(db, Supplier, caching.SUPPLIERS, "supplier", body, "deleted")
+
+@app.get("/products/{product_id}")
+@caching.cached(caching.PRODUCTS, key_builder=caching.entity_key_builder("product_id"))
+async def get_product(product_id: int, db: read_db_dependency, user: user_dependency):
+    product = await db.get(Product, product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
+
+@app.get("/suppliers/{supplier_id}")
+@caching.cached(caching.SUPPLIERS, key_builder=caching.entity_key_builder("supplier_id"))
+async def get_supplier(supplier_id: int, db: read_db_dependency, user: user_dependency):
+    supplier = await db.get(Supplier, supplier_id)
+    if supplier is None:
+        raise HTTPException(status_code=404, detail="Supplier not found")
+    return supplier
+
+@app.get("/stats/category-counts")
+@caching.cached(caching.STATS)
+async def get_category_counts(db: read_db_dependency, user: user_dependency):
+    # Served from category_summary, so the cost follows the number of
+    # categories rather than the number of products.
+    result = await db.execute(
+        select(CategorySummary.category, CategorySummary.product_count)
+        .where(CategorySummary.product_count > 0)
+        .order_by(CategorySummary.product_count.desc(), CategorySummary.category))
+    return [{"category": category, "count": n} for category, n in result.all()]
+
+@app.get("/stats/stock-by-supplier")
+@caching.cached(caching.STATS)
+async def get_stock_by_supplier(db: read_db_dependency, user: user_dependency):
+    result = await db.execute(
+        select(Supplier.id, Supplier.name, SupplierSummary.stock)
+        .join(SupplierSummary, SupplierSummary.supplier_id == Supplier.id)
+        .where(SupplierSummary.product_count > 0)
+        .order_by(Supplier.name))
+    return [{"supplier_id": supplier_id, "supplier_name": name, "stock": total}
+            for supplier_id, name, total in result.all()]
+
+@app.get("/version")
+async def get_version(user: user_dependency):
+    # Cheap change detector for clients that keep their own copies.
+    return {namespace: caching.version(namespace)
+            for namespace in (caching.PRODUCTS, caching.SUPPLIERS, caching.STATS)}
+
+entity_query = Annotated[Optional[List[Literal[changes.ENTITIES]]], Query(
+    alias="entity", description="only these entities; repeat for several")]
+
+@app.get("/changes")
+async def get_changes(user: user_dependency, since: Optional[str] = None, entity: entity_query = None,
+                      limit: Annotated[int, Query(ge=1, le=changes.CHANGE_PAGE_SIZE)] = changes.CHANGE_PAGE_SIZE):
+    # Polling form of the feed. Without `since` it only returns the id to
+    # start from; a page cut short by `limit` ends at its last event.
+    events, reset = changes.feed.since(since, set(entity or ()), limit)
+    last_id = changes.feed.event_id(events[-1].seq) if len(events) == limit else changes.feed.last_id
+    return {"events": [{"event_id": changes.feed.event_id(event.seq), **event.data} for event in events],
+            "last_id": last_id, "reset": reset}
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request, user: user_dependency, since: Optional[str] = None,
+                         entity: entity_query = None):
+    # Server-Sent Events; browsers resume with Last-Event-ID on their own.
+    try:
+        subscription = changes.feed.subscribe(since or request.headers.get("Last-Event-ID"), set(entity or ()))
+    except changes.TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many change subscribers; try again later")
+    # The background task also frees the slot when the client leaves before
+    # the stream starts.
+    return StreamingResponse(changes.sse(subscription), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(subscription.close))
+
+async def websocket_user(token: Optional[str] = None):
+    # Browsers cannot set headers on a WebSocket, so the bearer token comes
+    # as ?token=.
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+    try:
+        return await auth.get_current_user(token)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
+
+@app.websocket("/changes/ws")
+async def changes_websocket(websocket: WebSocket, user: Annotated[str, Depends(websocket_user)],
+                            since: Optional[str] = None, entity: entity_query = None):
+    try:
+        subscription = changes.feed.subscribe(since, set(entity or ()))
+    except changes.TooManySubscribers:
+        raise WebSocketException(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many change subscribers")
+    await websocket.accept()
+    await changes.websocket_session(websocket, subscription)
+
+@app.get("/cache/stats")
+async def get_cache_stats(user: user_dependency):
+    return caching.snapshot(FastAPICache.get_backend())
+
+@app.get("/db/stats")
+async def get_db_stats(user: user_dependency):
+    return {"primary": database.pool_metrics(engine), "routing": database.router.metrics()}
+
+@app.get("/metrics")
+async def get_metrics():
+    # Unauthenticated, like most scrape targets; nothing here identifies users
+    # or rows.
+    cache = caching.snapshot(FastAPICache.get_backend())
+    hasher = auth.password_hasher.metrics()
+    tokens = auth.token_cache.metrics()
+    feed = changes.feed.metrics()
+    pools = [("primary", database.pool_metrics(engine))]
+    pools += [(replica.url, database.pool_metrics(replica.engine)) for replica in database.router.replicas]
+    pools = [(name, pool) for name, pool in pools if "checkouts" in pool]
+
+    def per_pool(key):
+        return [({"pool": name}, pool[key]) for name, pool in pools]
+
+    body = metrics.render(
+        metrics.family("pms_cache_lookups_total", "counter", "Cached endpoint lookups by result.",
+                       [({"result": result}, cache[result]) for result in ("hits", "misses", "coalesced")]),
+        metrics.family("pms_cache_evictions_total", "counter", "Entries evicted for space.", cache["evictions"]),
+        metrics.family("pms_cache_expirations_total", "counter", "Entries expired by TTL.", cache["expirations"]),
+        metrics.family("pms_cache_invalidations_total", "counter", "Namespace invalidations.", cache["invalidations"]),
+        metrics.family("pms_cache_entries", "gauge", "Entries in the response cache.", cache.get("entries", 0)),
+        metrics.family("pms_cache_bytes", "gauge", "Bytes held by the response cache.", cache.get("used_bytes", 0)),
+        metrics.family("pms_password_hash_queue_depth", "gauge", "Hash jobs waiting for a worker.", hasher["queue_depth"]),
+        metrics.family("pms_password_hash_in_flight", "gauge", "Hash jobs running.", hasher["in_flight"]),
+        metrics.family("pms_password_hash_completed_total", "counter", "Hash jobs finished.", hasher["completed"]),
+        metrics.family("pms_password_hash_rejected_total", "counter", "Hash jobs refused with 503.", hasher["rejected"]),
+        metrics.family("pms_change_subscribers", "gauge", "Open change feed streams.", feed["subscribers"]),
+        metrics.family("pms_change_events_total", "counter", "Change events published.", feed["published"]),
+        metrics.family("pms_change_lagged_total", "counter", "Subscribers dropped for falling behind.", feed["lagged"]),
+        metrics.family("pms_change_rejected_total", "counter", "Subscriptions refused at the limit.", feed["rejected"]),
+        metrics.family("pms_token_cache_lookups_total", "counter", "Bearer token verifications by result.",
+                       [({"result": "hit"}, tokens["hits"]), ({"result": "miss"}, tokens["misses"])]),
+        metrics.family("pms_db_pool_checked_out", "gauge", "Connections in use.", per_pool("checked_out")),
+        metrics.family("pms_db_pool_idle", "gauge", "Idle connections in the pool.", per_pool("idle")),
+        metrics.family("pms_db_pool_overflow", "gauge", "Connections open beyond pool_size.", per_pool("overflow")),
+        metrics.family("pms_db_pool_checkouts_total", "counter", "Connection checkouts.", per_pool("checkouts")),
+        metrics.family("pms_db_pool_timeouts_total", "counter", "Checkouts that timed out.", per_pool("timeouts")),
+        metrics.family("pms_db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection.",
+                       per_pool("wait_seconds_total")),
+    )
+    return Response(body, media_type=metrics.CONTENT_TYPE)
+
+@app.get("/auth/stats")
+async def get_auth_stats(user: user_dependency):
+    return {"password_hasher": auth.password_hasher.metrics(), "token_cache": auth.token_cache.metrics()}
 
 @app.post("/createProduct", status_code=status.HTTP_201_CREATED)
-async def create_product(product: ProductModel, db: db_dependency, user: user_dependency):
+async def create_product(product: ProductModel, response: Response, db: db_dependency, user: user_dependency):
+    new_product = Product(**product.model_dump())
     try:
-        new_product = Product(**product.model_dump())
         db.add(new_product)
         await db.commit()
-        await db.refresh(new_product)
-        return new_product
-    except Exception as e:
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="A product with this SKU already exists")
+    except SQLAlchemyError:
         await db.rollback()
-        print("DB Error:", e)  # You can replace with proper logging
+        logger.exception("create product failed", extra={"sku": product.sku})
         raise HTTPException(status_code=500, detail="Internal Server Error")
+    caching.invalidate(caching.PRODUCTS, new_product.id)
+    changes.feed.publish("product", new_product.id, changes.CREATE, new_product.version)
+    response.headers["ETag"] = entity_etag("product", new_product)
+    return new_product
 
-@app.post("/createSupplier", response_model=SupplierModel)
-async def create_supplier(supplier: SupplierModel, db: db_dependency, user: user_dependency):
+@app.post("/createSupplier")
+async def create_supplier(supplier: SupplierModel, response: Response, db: db_dependency, user: user_dependency):
     new_supplier = Supplier(
         name=supplier.name,
         contact_info=supplier.contact_info,
@@ -198,16 +717,14 @@ async def create_supplier(supplier: SupplierModel, db: db_dependency, user: user
     )
     db.add(new_supplier)
     await db.commit()
-    await db.refresh(new_supplier)
-    result = await db.execute(select(Supplier))
-    supplierData = result.scalars().all()
-    if supplierData is not None:
-        return {"update": "Data inserted successfully", "data" : supplierData}
-
-@app.put("/updateProduct/{product_id}", response_model=ProductModel)
-async def update_product(product_id: int, updated_product: ProductModel, db: db_dependency, user: user_dependency):
-    result = await db.execute(select(Product).where(Product.id == product_id))
-    product_model = result.scalars().first()
+    caching.invalidate(caching.SUPPLIERS, new_supplier.id)
+    changes.feed.publish("supplier", new_supplier.id, changes.CREATE, new_supplier.version)
+    response.headers["ETag"] = entity_etag("supplier", new_supplier)
+    return {"update": "Data inserted successfully", "data": new_supplier}
+
+@app.put("/updateProduct/{product_id}")
+async def update_product(product_id: int, updated_product: ProductModel, response: Response, db: db_dependency, user: user_dependency):
+    product_model = await db.get(Product, product_id)
     if product_model is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
@@ -215,51 +732,47 @@ async def update_product(product_id: int, updated_product: ProductModel, db: db_
         if value is not None:
             setattr(product_model, key, value)
 
-    await db.commit()
-    await db.refresh(product_model)
-    result = await db.execute(select(Product))
-    productData = result.scalars().all()
-    return {"update": "Data updated successfully", "data" : productData}
+    await commit_or_conflict(db)
+    caching.invalidate(caching.PRODUCTS, product_id)
+    changes.feed.publish("product", product_id, changes.UPDATE, product_model.version)
+    response.headers["ETag"] = entity_etag("product", product_model)
+    return {"update": "Data updated successfully", "data": product_model}
 
 @app.put("/updateSupplier/{supplier_id}")
-async def update_supplier(supplier_id: int, updated_supplier: SupplierModel, db: db_dependency, user: user_dependency):
-    result = await db.execute(select(Supplier).where(Supplier.id == supplier_id))
-    supplier_model = result.scalars().first()
+async def update_supplier(supplier_id: int, updated_supplier: SupplierModel, response: Response, db: db_dependency, user: user_dependency):
+    supplier_model = await db.get(Supplier, supplier_id)
     if supplier_model is None:
         raise HTTPException(status_code=404, detail= "Supplier not found")
 
     for key, value in updated_supplier.model_dump(exclude_unset=True).items():
         setattr(supplier_model, key, value)
 
-    await db.commit()
-    await db.refresh(supplier_model)
-    result = await db.execute(select(Supplier))
-    supplier_data = result.scalars().all()
-    return {"update": "Data updated successfully", "data" : supplier_data}
+    await commit_or_conflict(db)
+    caching.invalidate(caching.SUPPLIERS, supplier_id)
+    changes.feed.publish("supplier", supplier_id, changes.UPDATE, supplier_model.version)
+    response.headers["ETag"] = entity_etag("supplier", supplier_model)
+    return {"update": "Data updated successfully", "data": supplier_model}
 
 @app.delete("/deleteProduct/{product_id}")
 async def delete_product(product_id: int, db: db_dependency, user: user_dependency):
-    result = await db.execute(select(Product).where(Product.id == product_id))
-    product_model = result.scalars().first()
+    product_model = await db.get(Product, product_id)
     if product_model is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
     await db.delete(product_model)
-    await db.commit()
-    result = await db.execute(select(Product))
-    productData = result.scalars().all()
-    return  {"update": "Data deleted successfully", "data" : productData}
+    await commit_or_conflict(db)
+    caching.invalidate(caching.PRODUCTS, product_id)
+    changes.feed.publish("product", product_id, changes.DELETE, product_model.version)
+    return {"update": "Data deleted successfully", "data": product_model}
 
 @app.delete("/deleteSupplier/{supplier_id}")
 async def delete_supplier(supplier_id: int, db: db_dependency, user: user_dependency):
-    result = await db.execute(select(Supplier).where(Supplier.id == supplier_id))
-    supplier_model = result.scalars().first()
+    supplier_model = await db.get(Supplier, supplier_id)
     if supplier_model is None:
         raise HTTPException(status_code=404, detail="Supplier not found")
 
     await db.delete(supplier_model)
-    await db.commit()
-    result = await db.execute(select(Supplier))
-    supplierData = result.scalars().all()
-    return  {"update": "Data deleted successfully", "data" : supplierData}
-
+    await commit_or_conflict(db)
+    caching.invalidate(caching.SUPPLIERS, supplier_id)
+    changes.feed.publish("supplier", supplier_id, changes.DELETE, supplier_model.version)
+    return {"update": "Data deleted successfully", "data": supplier_model}
@@ -0,0 +1,234 @@
+# Request, query and runtime metrics in the Prometheus text format.
+#
+# A small in-process registry stands in for prometheus_client: histograms and
+# counters keyed by label values, rendered on demand by GET /metrics. The
+# middleware times each request under its route template and counts the SQL
+# statements it ran (database.py feeds record_query from engine events).
+#
+# With PROFILING_ENABLED set, a request carrying "X-Profile: 1" is sampled by a
+# background thread; when it runs longer than PROFILE_MIN_SECONDS its stacks
+# are written in folded format (flamegraph.pl, speedscope, inferno) to
+# PROFILE_DIR/<request id>.folded.
+
+import asyncio
+import bisect
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import logs
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MIN_SECONDS = float(os.getenv("PROFILE_MIN_SECONDS", 0.1))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.001))
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n") for v in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: Dict[tuple, float] = {}
+
+    def clear(self):
+        self._values.clear()
+
+    def inc(self, amount: float = 1, *labels):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last slot is +Inf), sum, count]
+        self._series: Dict[tuple, list] = {}
+
+    def clear(self):
+        self._series.clear()
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = (*self.labelnames, "le")
+        for labels, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(names, (*labels, bound))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+def family(name: str, kind: str, help: str, samples):
+    # One metric family from values read at scrape time. samples is a number
+    # or an iterable of (labels dict, value) pairs.
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} {kind}"
+    if isinstance(samples, (int, float)):
+        samples = [({}, samples)]
+    for labels, value in samples:
+        yield f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}"
+
+
+REQUEST_LATENCY = Histogram("pms_http_request_duration_seconds", "Request latency by route.",
+                            LATENCY_BUCKETS, ("method", "route", "status"))
+REQUEST_QUERIES = Histogram("pms_http_request_db_queries", "SQL statements executed per request.",
+                            QUERY_COUNT_BUCKETS, ("method", "route"))
+REQUEST_DB_SECONDS = Counter("pms_http_request_db_seconds_total", "Time spent in SQL statements by route.",
+                             ("method", "route"))
+QUERY_LATENCY = Histogram("pms_db_query_duration_seconds", "SQL statement execution time.", QUERY_BUCKETS)
+
+REGISTRY = [REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_SECONDS, QUERY_LATENCY]
+
+
+def render(*families) -> str:
+    lines = [line for metric in REGISTRY for line in metric.render()]
+    lines.extend(line for lines_ in families for line in lines_)
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+current_queries: ContextVar[Optional[QueryStats]] = ContextVar("current_queries", default=None)
+
+
+def record_query(seconds: float):
+    QUERY_LATENCY.observe(seconds)
+    stats = current_queries.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += seconds
+
+
+class SamplingProfiler:
+    # Samples one thread's Python stack every `interval` seconds. On the event
+    # loop thread that includes other requests interleaved with this one,
+    # which is usually what a slow request is waiting on anyway.
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if names:
+            self.stacks[";".join(reversed(names))] += 1
+
+    def _run(self):
+        # Sample before the first wait so even a very short request has one.
+        self._sample()
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _write_profile(profiler: SamplingProfiler, route: str, elapsed: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    # The request id may come from the client; keep it to a safe file name.
+    name = re.sub(r"[^\w-]", "_", logs.request_id.get())
+    path = os.path.join(PROFILE_DIR, f"{name}.folded")
+    with open(path, "w") as out:
+        out.write(profiler.folded())
+    logs.logger.info("profile written", extra={"route": route, "path": path, "duration_ms": round(elapsed * 1000, 2),
+                                               "samples": sum(profiler.stacks.values())})
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware. Register it before RequestContextMiddleware
+    # (Starlette wraps later additions around earlier ones) so it runs inside
+    # the request id scope.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        profiler = None
+        if PROFILING_ENABLED and dict(scope["headers"]).get(PROFILE_HEADER.lower().encode()) == b"1":
+            profiler = SamplingProfiler(threading.get_ident()).start()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries"'
+                message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            # The router records the matched route in the scope; label by its
+            # template so /products/1 and /products/2 share a series.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_LATENCY.observe(elapsed, method, route, str(status))
+            REQUEST_QUERIES.observe(stats.count, method, route)
+            REQUEST_DB_SECONDS.inc(stats.seconds, method, route)
+            current_queries.reset(token)
+            if profiler is not None:
+                profiler.stop()
+                if elapsed >= PROFILE_MIN_SECONDS:
+                    await asyncio.to_thread(_write_profile, profiler, route, elapsed)
@@ -1,5 +1,5 @@
 from operator import index
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import JSON, Boolean, Column, Integer, String, Float, ForeignKey, Index
 from database import Base
 
 class User(Base):
@@ -18,6 +18,17 @@ class Product(Base):
     sku = Column(String, unique=True)
     supplier_id = Column(Integer, ForeignKey('suppliers.id'), nullable=True)
     status = Column(String)
+    version = Column(Integer, nullable=False, default=1)
+
+    # Composite (filter, id) indexes let a filtered keyset page seek straight
+    # to the cursor instead of scanning every matching row.
+    __table_args__ = (
+        Index('ix_products_category_id', 'category', 'id'),
+        Index('ix_products_status_id', 'status', 'id'),
+        Index('ix_products_supplier_id_id', 'supplier_id', 'id'),
+        Index('ix_products_price', 'price'),
+    )
+    __mapper_args__ = {'version_id_col': version}
 
 class Supplier(Base):
     __tablename__ = 'suppliers'
@@ -27,4 +38,42 @@ class Supplier(Base):
     address = Column(String)
     phone_number = Column(String)
     email = Column(String)
+    version = Column(Integer, nullable=False, default=1)
+
+    __mapper_args__ = {'version_id_col': version}
+
+
+# Running totals kept in step with the products table by summary.py, so the
+# dashboard stats never scan products.
+class CategorySummary(Base):
+    __tablename__ = 'category_summary'
+    category = Column(String, primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
 
+class SupplierSummary(Base):
+    __tablename__ = 'supplier_summary'
+    supplier_id = Column(Integer, primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    stock = Column(Integer, nullable=False, default=0)
+
+
+# Background jobs run by jobs.py. Times are epoch seconds.
+class Job(Base):
+    __tablename__ = 'jobs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, index=True)
+    params = Column(JSON, nullable=False, default=dict)
+    progress = Column(Integer, nullable=False, default=0)
+    total = Column(Integer)
+    result = Column(JSON)
+    error = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=1)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_by = Column(String)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+    run_after = Column(Float, nullable=False)
+    started_at = Column(Float)
+    finished_at = Column(Float)
@@ -0,0 +1,132 @@
+# Full-text and prefix search over products.
+#
+# SQLite: an external-content FTS5 table (products_fts) indexes sku, name and
+# category. Triggers on products keep it current, so ORM writes, bulk upserts
+# and raw inserts are all covered without application code.
+# PostgreSQL: a stored, generated tsvector column with a GIN index.
+#
+# Every search term is matched as a prefix ("lam" finds "Lamp", "SKU00012"
+# finds "SKU000123"), all terms must match, and results are ranked with SKU
+# hits above name hits above category hits.
+
+import re
+
+from sqlalchemy import column, func, literal_column, select, table, text
+
+from model import Product
+
+MAX_SEARCH_TERMS = 8
+# bm25 weights for the products_fts columns, in declaration order.
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        sku, name, category,
+        content='products', content_rowid='id',
+        tokenize="unicode61 tokenchars '-_'", prefix='2 3 4')""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, sku, name, category) VALUES (new.id, new.sku, new.name, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, sku, name, category)
+        VALUES ('delete', old.id, old.sku, old.name, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF sku, name, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, sku, name, category)
+        VALUES ('delete', old.id, old.sku, old.name, old.category);
+        INSERT INTO products_fts(rowid, sku, name, category) VALUES (new.id, new.sku, new.name, new.category);
+    END""",
+]
+
+POSTGRES_DDL = [
+    """ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'C')) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+]
+
+products_fts = table("products_fts", column("rowid"))
+search_vector = literal_column("products.search_vector")
+
+
+async def install(conn):
+    dialect_name = conn.dialect.name
+    if dialect_name == "sqlite":
+        existed = await conn.scalar(text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'"))
+        for ddl in SQLITE_DDL:
+            await conn.execute(text(ddl))
+        if not existed:
+            # Index rows written before the search table existed.
+            await conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+    elif dialect_name == "postgresql":
+        for ddl in POSTGRES_DDL:
+            await conn.execute(text(ddl))
+    else:
+        raise NotImplementedError(f"product search is not supported on {dialect_name}")
+
+
+async def rebuild(conn):
+    # Rebuilds the index from the products table, e.g. after rows were
+    # written with the triggers missing.
+    dialect_name = conn.dialect.name
+    if dialect_name == "sqlite":
+        await conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+    elif dialect_name == "postgresql":
+        await conn.execute(text("REINDEX INDEX ix_products_search_vector"))
+    else:
+        raise NotImplementedError(f"product search is not supported on {dialect_name}")
+
+
+def terms(q: str):
+    return re.findall(r"[\w-]+", q.lower())[:MAX_SEARCH_TERMS]
+
+
+def _fts_match(words) -> str:
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+
+def _tsquery(words):
+    # The 'simple' parser splits on '-', so each piece becomes its own
+    # prefix term.
+    pieces = [piece for word in words for piece in re.split(r"[-_]", word) if piece]
+    if not pieces:
+        return None
+    return func.to_tsquery("simple", " & ".join(f"{piece}:*" for piece in pieces))
+
+
+def search_query(dialect_name: str, q: str, columns=(Product,)):
+    # Returns a select of `columns` for the matching products, best match
+    # first, or None when q has nothing searchable in it.
+    words = terms(q)
+    if not words:
+        return None
+    if dialect_name == "sqlite":
+        fts = literal_column("products_fts")
+        return (select(*columns)
+                .join(products_fts, products_fts.c.rowid == Product.id)
+                .where(fts.op("MATCH")(_fts_match(words)))
+                .order_by(func.bm25(fts, *FTS_WEIGHTS), Product.id))
+    if dialect_name == "postgresql":
+        query = _tsquery(words)
+        if query is None:
+            return None
+        return (select(*columns)
+                .where(search_vector.op("@@")(query))
+                .order_by(func.ts_rank(search_vector, query).desc(), Product.id))
+    raise NotImplementedError(f"product search is not supported on {dialect_name}")
+
+
+def matches(dialect_name: str, q: str):
+    # The same match as a where clause, for lists that keep their own order
+    # (GET /products?q= pages by id); None when q has nothing searchable.
+    words = terms(q)
+    if not words:
+        return None
+    if dialect_name == "sqlite":
+        fts = literal_column("products_fts")
+        return Product.id.in_(select(products_fts.c.rowid).where(fts.op("MATCH")(_fts_match(words))))
+    if dialect_name == "postgresql":
+        query = _tsquery(words)
+        return None if query is None else search_vector.op("@@")(query)
+    raise NotImplementedError(f"product search is not supported on {dialect_name}")
@@ -0,0 +1,87 @@
+# Response encoding for the list endpoints.
+#
+# Lists are read as plain column tuples (no ORM instances, no identity map)
+# and turned into JSON bytes in one call: orjson when it is installed, the
+# standard json module otherwise. Three shapes are offered:
+#
+#   records  [{"id": 1, "name": "Lamp", ...}, ...]          the default
+#   columns  {"id": [1, 2, ...], "name": ["Lamp", ...]}      pandas.DataFrame(data)
+#   arrow    an Arrow IPC stream (needs pyarrow, else 501)   pyarrow.ipc.open_stream
+#
+# The columnar shape writes every key once per page instead of once per row.
+
+import io
+import json
+from typing import Sequence
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+
+from model import Product, Supplier
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the json module
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # optional: only needed for format=arrow
+    pyarrow = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+FORMATS = ("records", "columns", "arrow")
+
+PRODUCT_COLUMNS = (Product.id, Product.name, Product.category, Product.price, Product.stock,
+                   Product.sku, Product.supplier_id, Product.status, Product.version)
+SUPPLIER_COLUMNS = (Supplier.id, Supplier.name, Supplier.contact_info, Supplier.address,
+                    Supplier.phone_number, Supplier.email, Supplier.version)
+
+
+def names(columns) -> list:
+    return [column.key for column in columns]
+
+
+def dumps(value) -> bytes:
+    # Same output as FastAPI's JSONResponse. Plain dicts, lists, tuples and
+    # scalars are encoded natively; anything else (ORM objects, models) goes
+    # through jsonable_encoder first.
+    if orjson is not None:
+        return orjson.dumps(value, default=jsonable_encoder)
+    return json.dumps(value, default=jsonable_encoder, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def records(keys: Sequence[str], rows) -> list:
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def columns(keys: Sequence[str], rows) -> dict:
+    if not rows:
+        return {key: [] for key in keys}
+    return dict(zip(keys, zip(*rows)))
+
+
+def arrow(keys: Sequence[str], rows, **metadata) -> bytes:
+    if pyarrow is None:
+        raise RuntimeError("format=arrow needs pyarrow installed")
+    data = columns(keys, rows)
+    table = pyarrow.table({key: list(values) for key, values in data.items()})
+    table = table.replace_schema_metadata({key: json.dumps(value) for key, value in metadata.items()})
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def page(keys: Sequence[str], rows, fmt: str, **extra):
+    # One page of a list endpoint. extra carries the paging fields
+    # (next_cursor, next_offset); Arrow streams keep them in the schema
+    # metadata, JSON shapes next to "items".
+    if fmt == "arrow":
+        if pyarrow is None:
+            raise HTTPException(status_code=501, detail="format=arrow needs pyarrow installed on the server")
+        return Response(arrow(keys, rows, **extra), media_type=ARROW_MEDIA_TYPE)
+    items = columns(keys, rows) if fmt == "columns" else records(keys, rows)
+    return {"items": items, **extra}
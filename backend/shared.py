@@ -0,0 +1,389 @@
+# Multi-worker mode (CACHE_BACKEND=shared): one cache for every worker of a
+# server started with `uvicorn --workers N` or gunicorn.
+#
+# All workers map the same file, under /dev/shm by default. It holds
+#   * the response cache, a ring of records of CACHE_MAX_BYTES. A write
+#     appends at the head and overwrites the oldest records once the ring is
+#     full, so eviction is FIFO whatever CACHE_POLICY says;
+#   * an index from key hash to ring position, direct-mapped: a colliding key
+#     replaces the older entry;
+#   * the generation counters and modification times that caching.py bakes
+#     into keys, hashed into fixed slots (a collision only costs a spurious
+#     miss). An invalidation in one worker is an increment here, which every
+#     other worker sees on its next lookup; there is no delivery delay.
+# Writers serialise on an flock; readers take no lock. A reader checks the
+# head before and after copying a record and drops the copy if a writer may
+# have reached it in between.
+#
+# State that stays per process travels on a broadcast. Each worker binds a
+# datagram socket in <file>.peers/ and sends the others its change-feed
+# events, token revocations from /logout and, with replicas, the users who
+# just wrote. Sends never block, so a busy peer can miss a datagram; the
+# numbering per sender and peer shows the gap, and that peer restarts its
+# change feed so subscribers reload. A missed revocation is only logged: that
+# token keeps working on that peer until its exp.
+#
+# The file name includes the parent pid, so every server run starts empty.
+# The last worker to stop removes it.
+
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import time
+import zlib
+from typing import Iterable, Optional, Tuple
+
+from fastapi_cache.types import Backend
+
+import auth
+import caching
+import changes
+import database
+
+CACHE_SHARED_PATH = os.getenv("CACHE_SHARED_PATH", os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), f"pms-cache-{os.getppid()}"))
+CACHE_SHARED_SLOTS = int(os.getenv("CACHE_SHARED_SLOTS", 1 << 16))
+GENERATION_SLOTS = 1 << 16
+# Events per datagram; keeps each well under the socket buffer.
+BROADCAST_BATCH = 500
+
+MAGIC = b"PMSCACH1"
+HEADER = struct.Struct("<8sdQQQ")  # magic, created_at, capacity, index slots, generation slots
+HEAD = struct.Struct("<Q")  # ring head: bytes ever written, right after the header
+HEADER_BYTES = 64
+SLOT = struct.Struct("<Qd")  # generation count, modified_at
+INDEX = struct.Struct("<QQ")  # key hash, ring position
+RECORD = struct.Struct("<IId")  # key length, value length, expires_at
+
+logger = logging.getLogger("pms.shared")
+
+
+def _key_hash(key: bytes) -> int:
+    # 0 marks an empty index slot.
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+class Segment:
+    def __init__(self, path: str, capacity: int = caching.CACHE_MAX_BYTES, slots: int = CACHE_SHARED_SLOTS,
+                 generation_slots: int = GENERATION_SLOTS):
+        self.path = path
+        self.generations_at = HEADER_BYTES
+        self.index_at = self.generations_at + generation_slots * SLOT.size
+        self.data_at = self.index_at + slots * INDEX.size
+        size = self.data_at + capacity
+        self._lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Every worker holds a shared lock while it runs; see close().
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        with self.locked():
+            # The first worker lays the file out; the others check they were
+            # started with the same sizes.
+            header = os.pread(self._fd, HEADER.size, 0)
+            if header[:len(MAGIC)] == MAGIC:
+                if HEADER.unpack(header)[2:] != (capacity, slots, generation_slots):
+                    raise RuntimeError(f"{path} was created with other CACHE_MAX_BYTES or CACHE_SHARED_SLOTS")
+            else:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, time.time(), capacity, slots, generation_slots), 0)
+        self.map = mmap.mmap(self._fd, size)
+        _, self.created_at, self.capacity, self.slots, self.generation_slots = HEADER.unpack_from(self.map, 0)
+
+    @contextlib.contextmanager
+    def locked(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def close(self):
+        # Removes the files when no other worker has them open.
+        self.map.close()
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            pass
+        else:
+            for path in (self.path, self.path + ".lock"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+        os.close(self._fd)
+        os.close(self._lock_fd)
+
+    @property
+    def head(self) -> int:
+        return HEAD.unpack_from(self.map, HEADER.size)[0]
+
+    def _index_slot(self, key_hash: int) -> int:
+        return self.index_at + key_hash % self.slots * INDEX.size
+
+    def _intact(self, pos: int) -> bool:
+        head = self.head
+        return head - self.capacity <= pos < head
+
+    def read(self, key: str) -> Optional[Tuple[float, bytes]]:
+        raw = key.encode()
+        key_hash = _key_hash(raw)
+        stored, pos = INDEX.unpack_from(self.map, self._index_slot(key_hash))
+        if stored != key_hash or not self._intact(pos):
+            return None
+        at = self.data_at + pos % self.capacity
+        key_len, value_len, expires_at = RECORD.unpack_from(self.map, at)
+        start = at + RECORD.size + key_len
+        if key_len != len(raw) or self.map[at + RECORD.size:start] != raw:
+            return None
+        value = self.map[start:start + value_len]
+        if not self._intact(pos) or len(value) != value_len:
+            return None
+        return expires_at, value
+
+    def write(self, key: str, value: bytes, expires_at: float) -> bool:
+        raw = key.encode()
+        size = RECORD.size + len(raw) + len(value)
+        if size > self.capacity:
+            return False
+        key_hash = _key_hash(raw)
+        with self.locked():
+            pos = self.head
+            offset = pos % self.capacity
+            if offset + size > self.capacity:
+                # Records never wrap; the tail of the ring is skipped.
+                pos += self.capacity - offset
+                offset = 0
+            # The head moves first, so readers of what is overwritten next
+            # notice.
+            HEAD.pack_into(self.map, HEADER.size, pos + size)
+            at = self.data_at + offset
+            RECORD.pack_into(self.map, at, len(raw), len(value), expires_at)
+            self.map[at + RECORD.size:at + RECORD.size + len(raw)] = raw
+            self.map[at + RECORD.size + len(raw):at + size] = value
+            INDEX.pack_into(self.map, self._index_slot(key_hash), key_hash, pos)
+        return True
+
+    def remove(self, key: str) -> bool:
+        key_hash = _key_hash(key.encode())
+        with self.locked():
+            if INDEX.unpack_from(self.map, self._index_slot(key_hash))[0] != key_hash:
+                return False
+            INDEX.pack_into(self.map, self._index_slot(key_hash), 0, 0)
+        return True
+
+    def clear(self):
+        with self.locked():
+            self.map[self.index_at:self.data_at] = bytes(self.data_at - self.index_at)
+
+    def _generation_slot(self, scope: str) -> int:
+        return self.generations_at + zlib.crc32(scope.encode()) % self.generation_slots * SLOT.size
+
+    def generation(self, scope: str) -> Tuple[int, float]:
+        return SLOT.unpack_from(self.map, self._generation_slot(scope))
+
+    def bump(self, scopes: Iterable[str], modified_at: Optional[float] = None):
+        with self.locked():
+            for scope in scopes:
+                at = self._generation_slot(scope)
+                count, previous = SLOT.unpack_from(self.map, at)
+                SLOT.pack_into(self.map, at, count + 1, previous if modified_at is None else modified_at)
+
+
+class SharedGenerations:
+    # caching.Generations backed by the segment. started_at is the segment's
+    # creation, so every worker reports the same /version.
+
+    def __init__(self, segment: Segment):
+        self.segment = segment
+        self.started_at = segment.created_at
+
+    def get(self, scope: str) -> int:
+        return self.segment.generation(scope)[0]
+
+    def modified_at(self, namespace: str) -> float:
+        return self.segment.generation(namespace)[1] or self.started_at
+
+    def bump(self, scopes: Iterable[str], modified_at: Optional[float] = None):
+        self.segment.bump(scopes, modified_at)
+
+
+class Broadcast:
+    def __init__(self, directory: str, name: Optional[str] = None):
+        self.directory = directory
+        self.name = name or str(os.getpid())
+        self.address = os.path.join(directory, f"{self.name}.sock")
+        self.sock: Optional[socket.socket] = None
+        self.handler = None
+        self.sent = self.dropped = self.received = self.gaps = 0
+        # Datagrams numbered per peer, in each direction.
+        self._sent_to = {}
+        self._seen_from = {}
+
+    def start(self, handler):
+        # handler(kind, data, gap) runs on the event loop for every datagram;
+        # gap is True when something from that sender went missing.
+        os.makedirs(self.directory, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.address)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.address)
+        self.sock.setblocking(False)
+        self.handler = handler
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._drain)
+
+    def stop(self):
+        if self.sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.address)
+        with contextlib.suppress(OSError):
+            os.rmdir(self.directory)
+
+    def send(self, kind: str, data):
+        body = json.dumps({"kind": kind, "data": data}, separators=(",", ":")).encode()
+        for entry in os.scandir(self.directory):
+            if entry.path == self.address:
+                continue
+            n = self._sent_to.get(entry.name, 0) + 1
+            self._sent_to[entry.name] = n
+            try:
+                self.sock.sendto(f"{self.name} {n}\n".encode() + body, entry.path)
+                self.sent += 1
+            except BlockingIOError:
+                self.dropped += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # A worker that exited without cleaning up.
+                self._sent_to.pop(entry.name, None)
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(entry.path)
+
+    def _drain(self):
+        while True:
+            try:
+                datagram = self.sock.recv(1 << 20)
+            except BlockingIOError:
+                return
+            header, _, body = datagram.partition(b"\n")
+            sender, n = header.decode().split()
+            gap = int(n) != self._seen_from.get(sender, 0) + 1
+            self._seen_from[sender] = int(n)
+            self.received += 1
+            self.gaps += gap
+            message = json.loads(body)
+            try:
+                self.handler(message["kind"], message["data"], gap)
+            except Exception:
+                logger.exception("broadcast handler failed", extra={"kind": message["kind"]})
+
+    def metrics(self) -> dict:
+        return {"sent": self.sent, "dropped": self.dropped, "received": self.received, "gaps": self.gaps}
+
+
+class SharedMemoryBackend(Backend):
+    # fastapi-cache backend over the segment. Expiry is checked on lookup, so
+    # there is no ticker.
+
+    def __init__(self, segment: Segment, broadcast: Optional[Broadcast] = None):
+        self.segment = segment
+        self.broadcast = broadcast
+
+    @property
+    def used_bytes(self) -> int:
+        return min(self.segment.head, self.segment.capacity)
+
+    @property
+    def max_bytes(self) -> int:
+        return self.segment.capacity
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        stop()
+
+    def _lookup(self, key: str) -> Optional[Tuple[float, bytes]]:
+        found = self.segment.read(key)
+        if found is None or found[0] <= time.time():
+            caching.stats.misses += 1
+            return None
+        caching.stats.hits += 1
+        return found
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        found = self._lookup(key)
+        if found is None:
+            return 0, None
+        return max(0, int(found[0] - time.time())), found[1]
+
+    async def get(self, key: str) -> Optional[bytes]:
+        found = self._lookup(key)
+        return found[1] if found else None
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        self.segment.write(key, value, time.time() + (expire or caching.CACHE_TTL_SECONDS))
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        # Keys are not listed anywhere, so clearing a namespace clears all.
+        if key is not None:
+            return int(self.segment.remove(key))
+        self.segment.clear()
+        return 0
+
+
+def _receive(kind: str, data, gap: bool):
+    if gap:
+        logger.warning("broadcast datagrams were lost")
+        changes.feed.restart()
+    if kind == "changes":
+        changes.feed.receive(data)
+    elif kind == "write":
+        database.router.mark_write(data, relay=False)
+    elif kind == "revoke":
+        digest, exp = data
+        auth.token_cache.revoke(bytes.fromhex(digest), exp, relay=False)
+
+
+def _relay_changes(broadcast: Broadcast, rows: list):
+    for start in range(0, len(rows), BROADCAST_BATCH):
+        broadcast.send("changes", rows[start:start + BROADCAST_BATCH])
+
+
+_backend: Optional[SharedMemoryBackend] = None
+
+
+def start(path: Optional[str] = None) -> SharedMemoryBackend:
+    # Maps the segment, points caching's generations at it and joins the
+    # broadcast. Called from main.startup in each worker.
+    global _backend
+    path = path or CACHE_SHARED_PATH
+    segment = Segment(path)
+    broadcast = Broadcast(path + ".peers")
+    broadcast.start(_receive)
+    caching.generations = SharedGenerations(segment)
+    changes.feed.relay = lambda rows: _relay_changes(broadcast, rows)
+    database.router.relay = lambda user: broadcast.send("write", user)
+    auth.token_cache.relay = lambda digest, exp: broadcast.send("revoke", [digest.hex(), exp])
+    _backend = SharedMemoryBackend(segment, broadcast)
+    return _backend
+
+
+def stop():
+    global _backend
+    if _backend is None:
+        return
+    changes.feed.relay = None
+    database.router.relay = None
+    auth.token_cache.relay = None
+    caching.generations = caching.Generations()
+    _backend.broadcast.stop()
+    _backend.segment.close()
+    _backend = None
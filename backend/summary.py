@@ -0,0 +1,199 @@
+# Incrementally maintained inventory aggregates.
+#
+# category_summary and supplier_summary hold per-category product counts and
+# per-supplier product counts and stock. Every ORM flush that touches products
+# applies the matching deltas on the same connection, so the totals commit or
+# roll back together with the rows they describe. Core statements (bulk
+# upserts) bypass the flush and call Deltas directly.
+#
+#     cd backend && python -m summary verify    # report drift, exit 1 if any
+#     cd backend && python -m summary rebuild   # recompute from products
+
+import argparse
+import asyncio
+import sys
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from model import CategorySummary, Product, SupplierSummary
+
+INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class Deltas:
+    def __init__(self):
+        self.categories = Counter()
+        self.supplier_counts = Counter()
+        self.supplier_stock = Counter()
+
+    def add(self, category, supplier_id, stock, sign: int = 1):
+        if category is not None:
+            self.categories[category] += sign
+        if supplier_id is not None:
+            self.supplier_counts[supplier_id] += sign
+            self.supplier_stock[supplier_id] += sign * (stock or 0)
+
+    def statements(self, dialect_name: str) -> List[Tuple[object, List[dict]]]:
+        # Each delta becomes "insert or add to the existing total", so rows
+        # are created on first use and never read back before writing.
+        if dialect_name not in INSERTS:
+            raise NotImplementedError(f"summary maintenance is not supported on {dialect_name}")
+        insert = INSERTS[dialect_name]
+        statements = []
+        categories = [{"category": c, "product_count": n} for c, n in self.categories.items() if n]
+        if categories:
+            stmt = insert(CategorySummary)
+            statements.append((stmt.on_conflict_do_update(
+                index_elements=[CategorySummary.category],
+                set_={"product_count": CategorySummary.product_count + stmt.excluded.product_count},
+            ), categories))
+        suppliers = [
+            {"supplier_id": s, "product_count": self.supplier_counts[s], "stock": self.supplier_stock[s]}
+            for s in self.supplier_counts
+            if self.supplier_counts[s] or self.supplier_stock[s]
+        ]
+        if suppliers:
+            stmt = insert(SupplierSummary)
+            statements.append((stmt.on_conflict_do_update(
+                index_elements=[SupplierSummary.supplier_id],
+                set_={"product_count": SupplierSummary.product_count + stmt.excluded.product_count,
+                      "stock": SupplierSummary.stock + stmt.excluded.stock},
+            ), suppliers))
+        return statements
+
+    async def apply(self, db):
+        dialect_name = (await db.connection()).dialect.name
+        for stmt, params in self.statements(dialect_name):
+            await db.execute(stmt, params)
+
+
+def _before(state, key):
+    history = state.attrs[key].history
+    return (history.deleted or history.unchanged or [None])[0]
+
+
+def _product(deltas: Deltas, obj, sign: int, before: bool):
+    if before:
+        state = inspect(obj)
+        deltas.add(_before(state, "category"), _before(state, "supplier_id"), _before(state, "stock"), sign)
+    else:
+        deltas.add(obj.category, obj.supplier_id, obj.stock, sign)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_product_deltas(session, flush_context):
+    # Runs inside the flush, while session.new/dirty/deleted and attribute
+    # history still describe what was just written.
+    deltas = Deltas()
+    for obj in session.new:
+        if isinstance(obj, Product):
+            _product(deltas, obj, 1, before=False)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            _product(deltas, obj, -1, before=True)
+    for obj in session.dirty:
+        if isinstance(obj, Product) and session.is_modified(obj):
+            _product(deltas, obj, -1, before=True)
+            _product(deltas, obj, 1, before=False)
+    connection = session.connection()
+    for stmt, params in deltas.statements(connection.dialect.name):
+        connection.execute(stmt, params)
+
+
+async def lock_existing(db, skus, deltas: Deltas) -> List[str]:
+    # Takes away the totals of the rows an upsert is about to overwrite and
+    # returns their skus. The rows stay locked until commit (FOR UPDATE on
+    # PostgreSQL; on SQLite the caller already holds the write lock), so the
+    # totals cannot change before they are replaced.
+    result = await db.execute(
+        select(Product.sku, Product.category, Product.supplier_id, Product.stock)
+        .where(Product.sku.in_(skus)).with_for_update())
+    found = []
+    for sku, category, supplier_id, stock in result.all():
+        deltas.add(category, supplier_id, stock, -1)
+        found.append(sku)
+    return found
+
+
+def expected_queries():
+    categories = (select(Product.category, func.count(Product.id))
+                  .where(Product.category.is_not(None))
+                  .group_by(Product.category))
+    suppliers = (select(Product.supplier_id, func.count(Product.id), func.coalesce(func.sum(Product.stock), 0))
+                 .where(Product.supplier_id.is_not(None))
+                 .group_by(Product.supplier_id))
+    return categories, suppliers
+
+
+async def rebuild(conn):
+    categories, suppliers = expected_queries()
+    await conn.execute(delete(CategorySummary))
+    await conn.execute(delete(SupplierSummary))
+    await conn.execute(CategorySummary.__table__.insert().from_select(["category", "product_count"], categories))
+    await conn.execute(SupplierSummary.__table__.insert().from_select(
+        ["supplier_id", "product_count", "stock"], suppliers))
+
+
+async def ensure(conn):
+    # Databases created before the summary tables existed start with empty
+    # totals; fill them once rather than reporting zeros.
+    if await conn.scalar(select(func.count()).select_from(CategorySummary)):
+        return
+    if await conn.scalar(select(func.count()).select_from(Product)):
+        await rebuild(conn)
+
+
+async def verify(conn) -> Dict[str, list]:
+    # Recomputes the totals from products and lists every key whose stored
+    # value differs. Rows that net out to zero count as absent.
+    categories, suppliers = expected_queries()
+    expected = {c: n for c, n in (await conn.execute(categories)).all()}
+    stored = {c: n for c, n in (await conn.execute(
+        select(CategorySummary.category, CategorySummary.product_count))).all() if n}
+    drift = {"categories": [], "suppliers": []}
+    for key in sorted(expected.keys() | stored.keys()):
+        if expected.get(key) != stored.get(key):
+            drift["categories"].append({"category": key, "expected": expected.get(key), "stored": stored.get(key)})
+
+    expected = {s: (n, stock) for s, n, stock in (await conn.execute(suppliers)).all()}
+    stored = {s: (n, stock) for s, n, stock in (await conn.execute(select(
+        SupplierSummary.supplier_id, SupplierSummary.product_count, SupplierSummary.stock))).all() if n or stock}
+    for key in sorted(expected.keys() | stored.keys()):
+        if expected.get(key) != stored.get(key):
+            drift["suppliers"].append({"supplier_id": key, "expected": expected.get(key), "stored": stored.get(key)})
+    return drift
+
+
+async def run(command: str) -> int:
+    import database
+    try:
+        async with database.engine.begin() as conn:
+            if command == "rebuild":
+                await rebuild(conn)
+                print("summary tables rebuilt")
+                return 0
+            drift = await verify(conn)
+    finally:
+        await database.engine.dispose()
+    for kind, rows in drift.items():
+        for row in rows:
+            print(f"{kind}: {row}")
+    if any(drift.values()):
+        return 1
+    print("summary tables match products")
+    return 0
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Verify or rebuild the inventory summary tables.")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.command)))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from fastapi_cache import FastAPICache
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+# The backend modules import each other by bare name (``import model``), the
+# same way they do when uvicorn is started from inside ``backend/``.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Minimum bcrypt cost keeps the auth tests fast.
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import auth
+import database
+import caching
+import main
+import metrics
+
+TEST_USER = "tester@example.com"
+
+
+@pytest.fixture(autouse=True)
+def cache_stats(monkeypatch):
+    stats = caching.CacheStats()
+    monkeypatch.setattr(caching, "stats", stats)
+    FastAPICache.reset()
+    return stats
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    for metric in metrics.REGISTRY:
+        metric.clear()
+
+
+@pytest.fixture
+def app_engine(tmp_path, monkeypatch):
+    engine = database.build_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_test_db():
+        async with session_factory() as db:
+            yield db
+
+    monkeypatch.setattr(main, "engine", engine)
+    main.app.dependency_overrides[main.get_db] = get_test_db
+    main.app.dependency_overrides[main.get_read_db] = get_test_db
+    main.app.dependency_overrides[auth.get_current_user] = lambda: TEST_USER
+    yield engine
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def client(app_engine):
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def product_payload(**overrides):
+    payload = {
+        "name": "Sample Product",
+        "category": "Electronics",
+        "price": 99.99,
+        "stock": 10,
+        "sku": "SP12345",
+        "supplier_id": 1,
+        "status": "available",
+    }
+    payload.update(overrides)
+    return payload
+
+
+def supplier_payload(**overrides):
+    payload = {
+        "name": "Sample Supplier",
+        "contact_info": "123-456-7890",
+        "address": "123 Sample St, Sample City, SC 12345",
+        "phone_number": "123-456-7890",
+        "email": "abc@gmail.com",
+    }
+    payload.update(overrides)
+    return payload
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+import auth
+import main
+
+
+def test_register_and_login(client):
+    del main.app.dependency_overrides[auth.get_current_user]
+    res = client.post("/register", json={"email": "a@example.com", "password": "s3cret"})
+    assert res.status_code == 200
+
+    assert client.post("/login", data={"username": "a@example.com", "password": "wrong"}).status_code == 400
+    res = client.post("/login", data={"username": "a@example.com", "password": "s3cret"})
+    assert res.status_code == 200
+    token = res.json()["access_token"]
+    assert client.get("/products", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+
+def test_hashing_does_not_block_the_event_loop():
+    hasher = auth.PasswordHasher(workers=2, max_queue=10)
+
+    def slow_hash(password):
+        time.sleep(0.2)
+        return password
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await asyncio.gather(*(hasher.run(slow_hash, "pw") for _ in range(4)))
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) >= 20
+    assert hasher.metrics()["completed"] == 4
+
+
+def test_hash_queue_is_bounded():
+    hasher = auth.PasswordHasher(workers=1, max_queue=2)
+
+    async def scenario():
+        calls = [hasher.run(time.sleep, 0.05) for _ in range(4)]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert [r.status_code for r in rejected] == [503]
+    assert hasher.metrics()["rejected"] == 1
+
+
+def test_verified_tokens_are_cached_until_logout(client, monkeypatch):
+    del main.app.dependency_overrides[auth.get_current_user]
+    monkeypatch.setattr(auth, "token_cache", auth.TokenCache())
+    token = auth.create_access_token({"sub": "cached@example.com"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/products", headers=headers).status_code == 200
+    assert client.get("/products", headers=headers).status_code == 200
+    assert auth.token_cache.metrics()["hits"] == 1
+
+    assert client.post("/logout", headers=headers).status_code == 200
+    assert client.get("/products", headers=headers).status_code == 401
+
+
+def test_token_cache_entries_expire_with_the_token():
+    cache = auth.TokenCache(max_entries=2)
+    cache.put(b"a", "a@example.com", exp=100)
+    cache.put(b"b", "b@example.com", exp=200)
+    cache.put(b"c", "c@example.com", exp=300)
+
+    assert cache.get(b"a", now=50) is None  # evicted, cache holds two tokens
+    assert cache.get(b"b", now=150) == "b@example.com"
+    assert cache.get(b"b", now=200) is None
+    assert cache.get(b"c", now=250) == "c@example.com"
+
+    cache.revoke(b"c", exp=300)
+    assert cache.is_revoked(b"c", now=250)
+    assert not cache.is_revoked(b"c", now=300)
+
+
+def test_revocations_are_dropped_once_the_tokens_expire():
+    cache = auth.TokenCache()
+    for i in range(100):
+        cache.revoke(bytes([i]), exp=100 + i, now=0)
+    cache.revoke(b"late", exp=500, now=150)
+
+    # Everything that expired by 150 is gone without ever being looked up.
+    assert cache.metrics()["revoked"] == 50
+    assert cache.is_revoked(bytes([99]), now=160) and cache.is_revoked(b"late", now=160)
+    assert not cache.is_revoked(bytes([10]), now=160)
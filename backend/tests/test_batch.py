@@ -0,0 +1,102 @@
+from sqlalchemy import event
+
+import batch
+import summary
+from tests.conftest import product_payload, supplier_payload
+
+
+def seed(client, *categories):
+    for i, category in enumerate(categories):
+        res = client.post("/createProduct", json=product_payload(sku=f"SKU{i:05d}", category=category, stock=10))
+        assert res.status_code == 201
+
+
+def products(client):
+    return {p["id"]: p for p in client.get("/products").json()["items"]}
+
+
+def summary_drift(client, app_engine):
+    async def check():
+        async with app_engine.connect() as conn:
+            return await summary.verify(conn)
+    return client.portal.call(check)
+
+
+def test_batch_update_by_id_checks_versions(client, app_engine):
+    seed(client, "Books", "Books", "Games")
+    client.put("/updateProduct/2", json=product_payload(sku="SKU00001", category="Books", stock=10, price=20.0))
+
+    res = client.patch("/products/batch", json={
+        "items": [{"id": 1, "version": 1}, {"id": 2, "version": 1}, {"id": 3}, {"id": 99}],
+        "set": {"price": 5.0, "category": "Toys"},
+    })
+    assert res.status_code == 200
+    assert res.json() == {"updated": [1, 3], "conflicts": [2], "missing": [99]}
+
+    rows = products(client)
+    assert [(rows[i]["price"], rows[i]["category"], rows[i]["version"]) for i in (1, 2, 3)] == [
+        (5.0, "Toys", 2), (20.0, "Books", 2), (5.0, "Toys", 2)]
+    assert summary_drift(client, app_engine) == {"categories": [], "suppliers": []}
+
+
+def test_batch_update_by_filter_moves_summary_totals(client, app_engine):
+    for i in range(2):
+        client.post("/createSupplier", json=supplier_payload(email=f"s{i}@example.com"))
+    seed(client, "Books", "Books", "Games")
+
+    res = client.patch("/products/batch", json={"filter": {"category": "Books"}, "set": {"stock": 50, "supplier_id": 2}})
+    assert res.json() == {"updated": [1, 2], "conflicts": [], "missing": []}
+
+    stock = {row["supplier_id"]: row["stock"] for row in client.get("/stats/stock-by-supplier").json()}
+    assert stock == {1: 10, 2: 100}
+    assert summary_drift(client, app_engine) == {"categories": [], "suppliers": []}
+
+
+def test_atomic_batch_changes_nothing_on_conflict(client):
+    seed(client, "Books", "Books")
+
+    res = client.patch("/products/batch", json={
+        "items": [{"id": 1, "version": 1}, {"id": 2, "version": 7}], "set": {"price": 1.0}, "atomic": True})
+    assert res.status_code == 409
+    assert res.json()["detail"]["conflicts"] == [2]
+    assert {p["price"] for p in products(client).values()} == {99.99}
+
+
+def test_batch_delete_products_and_suppliers(client, app_engine):
+    seed(client, "Books", "Books", "Games")
+    for i in range(2):
+        client.post("/createSupplier", json=supplier_payload(email=f"s{i}@example.com"))
+
+    res = client.request("DELETE", "/products/batch", json={"filter": {"category": "Books"}})
+    assert res.json() == {"deleted": [1, 2], "conflicts": [], "missing": []}
+    assert list(products(client)) == [3]
+    assert client.get("/stats/category-counts").json() == [{"category": "Games", "count": 1}]
+    assert summary_drift(client, app_engine) == {"categories": [], "suppliers": []}
+
+    res = client.request("DELETE", "/suppliers/batch", json={"items": [{"id": 1, "version": 2}, {"id": 2}]})
+    assert res.json() == {"deleted": [2], "conflicts": [1], "missing": []}
+    assert [s["id"] for s in client.get("/suppliers").json()["items"]] == [1]
+
+
+def test_batch_requests_are_validated(client):
+    assert client.patch("/products/batch", json={"set": {"price": 1.0}}).status_code == 422
+    assert client.patch("/products/batch", json={"items": [{"id": 1}], "set": {}}).status_code == 422
+    assert client.patch("/products/batch", json={"filter": {}, "set": {"price": 1.0}}).status_code == 422
+    assert client.patch("/suppliers/batch", json={"items": [], "set": {"name": "X"}}).status_code == 422
+
+
+def test_batch_runs_one_update_per_chunk(client, app_engine, monkeypatch):
+    seed(client, *["Books"] * 30)
+    monkeypatch.setattr(batch, "BATCH_CHUNK_ROWS", 8)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    event.listen(app_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        res = client.patch("/products/batch", json={"filter": {"category": "Books"}, "set": {"price": 2.0}})
+    finally:
+        event.remove(app_engine.sync_engine, "before_cursor_execute", record)
+    assert len(res.json()["updated"]) == 30
+    assert statements.count("UPDATE") == 4
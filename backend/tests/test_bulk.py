@@ -0,0 +1,91 @@
+import json
+
+from tests.conftest import product_payload
+
+
+def ndjson(*rows):
+    return "".join((row if isinstance(row, str) else json.dumps(row)) + "\n" for row in rows)
+
+
+def test_ndjson_import_upserts_on_sku_and_reports_bad_rows(client):
+    client.post("/createProduct", json=product_payload(sku="A", name="Old"))
+    client.get("/products/1")
+
+    body = ndjson(
+        product_payload(sku="A", name="New"),
+        product_payload(sku="B"),
+        "{not json",
+        product_payload(sku="C", stock=0),
+        product_payload(sku="D"),
+    )
+    res = client.post("/products/bulk", params={"batch_size": 2}, content=body,
+                      headers={"Content-Type": "application/x-ndjson"})
+
+    report = res.json()
+    assert report["received"] == 5
+    assert report["upserted"] == 3
+    assert [error["line"] for error in report["errors"]] == [3, 4]
+    assert report["errors"][1]["error"][0]["loc"] == ["stock"]
+
+    product = client.get("/products/1").json()
+    assert product["name"] == "New"
+    assert product["version"] == 2
+    assert [p["sku"] for p in client.get("/products").json()["items"]] == ["A", "B", "D"]
+
+
+def test_csv_import(client):
+    body = (
+        "name,category,price,stock,sku,supplier_id,status\n"
+        "Lamp,Home,19.5,3,L1,1,available\n"
+        "\"Desk, oak\",Home,120,2,D1,1,available\n"
+    )
+    res = client.post("/products/bulk", content=body, headers={"Content-Type": "text/csv"})
+
+    assert res.json()["upserted"] == 2
+    names = [p["name"] for p in client.get("/products").json()["items"]]
+    assert names == ["Lamp", "Desk, oak"]
+
+
+def test_csv_import_keeps_quoted_line_breaks(client):
+    body = (
+        "name,category,price,stock,sku,supplier_id,status\r\n"
+        "\"Lamp\r\nwith \"\"shade\"\"\",Home,19.5,3,L1,1,available\r\n"
+        "Desk,Home,120,2,D1,1,available\r\n"
+        "\"Chair,Home,40,1,C1,1,available\r\n"
+    )
+    res = client.post("/products/bulk", content=body, headers={"Content-Type": "text/csv"}).json()
+
+    assert res["upserted"] == 2
+    assert res["errors"] == [{"line": 5, "error": "unparseable row: unterminated quoted field"}]
+    names = [p["name"] for p in client.get("/products").json()["items"]]
+    assert names == ["Lamp\nwith \"shade\"", "Desk"]
+
+
+def test_csv_import_keeps_bare_inch_marks(client):
+    body = (
+        "name,category,price,stock,sku,supplier_id,status\n"
+        "Monitor 12\" wide,Home,150,1,M1,1,available\n"
+        "Lamp,Home,19.5,3,L1,1,available\n"
+        "Desk,Home,120,2,D1,1,available\n"
+        "Cable 6\",Home,5,9,C1,1,available\n"
+        "Chair,Home,40,1,C2,1,available\n"
+    )
+    res = client.post("/products/bulk", content=body, headers={"Content-Type": "text/csv"}).json()
+
+    assert (res["received"], res["upserted"], res["errors"]) == (5, 5, [])
+    names = [p["name"] for p in client.get("/products").json()["items"]]
+    assert names == ["Monitor 12\" wide", "Lamp", "Desk", "Cable 6\"", "Chair"]
+
+
+def test_export_streams_every_row(client):
+    for i in range(5):
+        client.post("/createProduct", json=product_payload(sku=f"S{i}"))
+
+    res = client.get("/products/export")
+    rows = [json.loads(line) for line in res.text.splitlines()]
+    assert [row["sku"] for row in rows] == [f"S{i}" for i in range(5)]
+
+    res = client.get("/products/export", params={"format": "csv"})
+    lines = res.text.splitlines()
+    assert lines[0] == "id,name,category,price,stock,sku,supplier_id,status,version"
+    assert len(lines) == 6
@@ -0,0 +1,191 @@
+import asyncio
+
+import httpx
+from fastapi import Request
+from sqlalchemy import event
+
+import auth
+import caching
+import main
+from tests.conftest import product_payload, supplier_payload
+
+CACHE_HEADER = "X-FastAPI-Cache"
+
+
+def test_repeated_list_reads_hit_the_cache(client):
+    client.post("/createProduct", json=product_payload())
+
+    assert client.get("/products").headers[CACHE_HEADER] == "MISS"
+    assert client.get("/products").headers[CACHE_HEADER] == "HIT"
+    assert client.get("/products", params={"category": "Books"}).headers[CACHE_HEADER] == "MISS"
+
+    stats = client.get("/cache/stats").json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_product_writes_invalidate_list_and_entity(client):
+    client.post("/createProduct", json=product_payload(sku="A"))
+    client.post("/createProduct", json=product_payload(sku="B"))
+    client.get("/products")
+    client.get("/products/1")
+    client.get("/products/2")
+
+    client.put("/updateProduct/1", json=product_payload(sku="A", name="Changed"))
+
+    res = client.get("/products")
+    assert res.headers[CACHE_HEADER] == "MISS"
+    assert res.json()["items"][0]["name"] == "Changed"
+    res = client.get("/products/1")
+    assert res.headers[CACHE_HEADER] == "MISS"
+    assert res.json()["name"] == "Changed"
+    assert client.get("/products/2").headers[CACHE_HEADER] == "HIT"
+
+    client.delete("/deleteProduct/2")
+    assert [p["sku"] for p in client.get("/products").json()["items"]] == ["A"]
+    assert client.get("/products/2").status_code == 404
+
+
+def test_supplier_writes_do_not_touch_product_cache(client):
+    client.post("/createProduct", json=product_payload())
+    client.get("/products")
+    client.get("/suppliers")
+
+    client.post("/createSupplier", json=supplier_payload())
+
+    assert client.get("/products").headers[CACHE_HEADER] == "HIT"
+    res = client.get("/suppliers")
+    assert res.headers[CACHE_HEADER] == "MISS"
+    assert len(res.json()["items"]) == 1
+
+
+def test_version_changes_only_for_written_namespaces(client):
+    before = client.get("/version").json()
+    client.post("/createSupplier", json=supplier_payload())
+    after = client.get("/version").json()
+
+    assert after["products"] == before["products"]
+    assert after["suppliers"] != before["suppliers"]
+    assert after["stats"] != before["stats"]
+
+
+def test_catalog_cache_is_shared_across_users(client):
+    def user_from_header(request: Request):
+        return request.headers["X-User"]
+
+    main.app.dependency_overrides[auth.get_current_user] = user_from_header
+    client.post("/createProduct", json=product_payload(), headers={"X-User": "alice"})
+
+    assert client.get("/products", headers={"X-User": "alice"}).headers[CACHE_HEADER] == "MISS"
+    assert client.get("/products", headers={"X-User": "bob"}).headers[CACHE_HEADER] == "HIT"
+
+
+def test_warm_cache_still_requires_authentication(client):
+    client.get("/products")
+    assert client.get("/products").headers[CACHE_HEADER] == "HIT"
+
+    del main.app.dependency_overrides[auth.get_current_user]
+    assert client.get("/products").status_code == 401
+    assert client.get("/products", headers={"Authorization": "Bearer forged"}).status_code == 401
+
+
+def test_conditional_get_returns_304_until_the_table_changes(client):
+    client.post("/createProduct", json=product_payload(sku="A"))
+    first = client.get("/products")
+    etag = first.headers["ETag"]
+    assert first.headers["Last-Modified"]
+
+    res = client.get("/products", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.content == b""
+
+    client.post("/createProduct", json=product_payload(sku="B"))
+    res = client.get("/products", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert len(res.json()["items"]) == 2
+
+
+def test_large_payloads_are_stored_compressed(client, monkeypatch):
+    monkeypatch.setattr(caching, "CACHE_COMPRESSION", "gzip")
+    for i in range(30):
+        client.post("/createProduct", json=product_payload(sku=f"SKU{i}"))
+
+    gzipped = client.get("/products", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    plain = client.get("/products", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.json() == gzipped.json()
+    assert len(plain.json()["items"]) == 30
+    for refused in ("gzip;q=0, identity", "br, *;q=0", "gzip ; q=0.0"):
+        assert "Content-Encoding" not in client.get("/products", headers={"Accept-Encoding": refused}).headers
+    for accepted in ("br;q=1, gzip;q=0.5", "*", "x-gzip"):
+        assert client.get("/products", headers={"Accept-Encoding": accepted}).headers["Content-Encoding"] == "gzip"
+
+
+def test_lru_evicts_least_recently_used_within_byte_budget():
+    async def scenario():
+        backend = caching.MemoryBackend(max_bytes=30, policy="lru")
+        await backend.set("a", b"x" * 10)
+        await backend.set("b", b"x" * 10)
+        await backend.get("a")
+        await backend.set("c", b"x" * 10)
+        return backend
+
+    backend = asyncio.run(scenario())
+    assert asyncio.run(backend.get("b")) is None
+    assert asyncio.run(backend.get("a")) is not None
+    assert backend.used_bytes == 22
+    assert caching.stats.evictions == 1
+
+
+def test_lfu_evicts_least_frequently_used():
+    async def scenario():
+        backend = caching.MemoryBackend(max_bytes=30, policy="lfu")
+        await backend.set("a", b"x" * 10)
+        await backend.set("b", b"x" * 10)
+        await backend.get("a")
+        await backend.get("a")
+        await backend.get("b")
+        await backend.set("c", b"x" * 10)
+        await backend.set("d", b"x" * 10)
+        return [await backend.get(k) is not None for k in "abcd"]
+
+    # "b" (2 uses) loses to "a" (3 uses); then newcomer "c" (1 use) goes.
+    assert asyncio.run(scenario()) == [True, False, False, True]
+
+
+def test_timer_wheel_expires_only_due_keys():
+    wheel = caching.TimerWheel(slots=4, tick=1.0, now=0)
+    wheel.schedule("soon", 1.5)
+    wheel.schedule("later", 9.0)
+    wheel.schedule("cancelled", 2.0)
+    wheel.cancel("cancelled", 2.0)
+
+    assert wheel.advance(1.0) == []
+    assert wheel.advance(2.0) == [("soon", 1.5)]
+    assert wheel.advance(8.0) == []
+    assert wheel.advance(9.0) == [("later", 9.0)]
+
+
+def test_cold_key_burst_runs_one_query(app_engine):
+    statements = []
+    event.listen(app_engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    async def burst():
+        await main.create_tables()
+        statements.clear()
+        await main.startup()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*(client.get("/products") for _ in range(500)))
+        await main.shutdown()
+        return responses
+
+    responses = asyncio.run(burst())
+    assert all(res.status_code == 200 for res in responses)
+    assert len([s for s in statements if "FROM products" in s]) == 1
+    # Requests that arrived while the load was in flight share its result;
+    # the rest found it in the cache.
+    assert caching.stats.misses - caching.stats.coalesced == 1
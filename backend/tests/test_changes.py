@@ -0,0 +1,153 @@
+import asyncio
+import json
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import changes
+import main
+from tests.conftest import TEST_USER, product_payload, supplier_payload
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    fresh = changes.ChangeFeed(buffer_size=50, queue_size=4, max_subscribers=2)
+    monkeypatch.setattr(changes, "feed", fresh)
+    return fresh
+
+
+@pytest.fixture
+def ws_user():
+    main.app.dependency_overrides[main.websocket_user] = lambda: TEST_USER
+
+
+def ops(events):
+    return [(e["entity"], e["id"], e["op"], e["version"]) for e in events]
+
+
+def test_every_write_publishes_one_event(client, feed):
+    start = client.get("/changes").json()
+    assert start == {"events": [], "last_id": feed.last_id, "reset": False}
+
+    client.post("/createSupplier", json=supplier_payload())
+    client.post("/createProduct", json=product_payload(sku="SKU1"))
+    client.put("/updateProduct/1", json=product_payload(sku="SKU1", price=5.0))
+    client.patch("/products/batch", json={"items": [{"id": 1}], "set": {"stock": 3}})
+    body = "\n".join(json.dumps(product_payload(sku=sku)) for sku in ("SKU1", "SKU2"))
+    client.post("/products/bulk", content=body)
+    client.delete("/deleteProduct/2")
+    client.request("DELETE", "/suppliers/batch", json={"items": [{"id": 1}]})
+
+    page = client.get("/changes", params={"since": start["last_id"]}).json()
+    assert ops(page["events"]) == [
+        ("supplier", 1, "create", 1), ("product", 1, "create", 1), ("product", 1, "update", 2),
+        ("product", 1, "update", 3), ("product", 1, "upsert", 4), ("product", 2, "upsert", 1),
+        ("product", 2, "delete", 1), ("supplier", 1, "delete", 1)]
+    assert page["last_id"] == page["events"][-1]["event_id"] == feed.last_id
+
+
+def test_changes_page_by_limit_and_entity(client, feed):
+    start = feed.last_id
+    for i in range(3):
+        client.post("/createProduct", json=product_payload(sku=f"SKU{i}"))
+    client.post("/createSupplier", json=supplier_payload())
+
+    first = client.get("/changes", params={"since": start, "limit": 2}).json()
+    assert [e["id"] for e in first["events"]] == [1, 2]
+    rest = client.get("/changes", params={"since": first["last_id"]}).json()
+    assert ops(rest["events"]) == [("product", 3, "create", 1), ("supplier", 1, "create", 1)]
+    only = client.get("/changes", params={"since": start, "entity": "supplier"}).json()
+    assert ops(only["events"]) == [("supplier", 1, "create", 1)]
+
+
+def test_unknown_or_expired_positions_ask_for_a_reset(client, feed):
+    start = feed.last_id
+    for i in range(60):
+        feed.publish("product", i, changes.UPDATE, 2)
+
+    assert client.get("/changes", params={"since": start}).json()["reset"] is True
+    assert client.get("/changes", params={"since": "abc.3"}).json()["reset"] is True
+    assert client.get("/changes", params={"since": feed.event_id(feed.seq - 50)}).json()["reset"] is False
+    assert client.get("/changes", params={"since": feed.event_id(feed.seq - 51)}).json()["reset"] is True
+
+
+def test_sse_replays_backlog_then_follows_live_events(feed):
+    async def scenario():
+        before = feed.publish("product", 1, changes.CREATE, 1)
+        feed.publish("supplier", 7, changes.CREATE, 1)
+        subscription = feed.subscribe(feed.event_id(before.seq - 1), {"product"})
+        stream = changes.sse(subscription)
+        frames = [await anext(stream)]
+        feed.publish("product", 1, changes.UPDATE, 2)
+        frames.append(await anext(stream))
+        await stream.aclose()
+        return frames
+
+    frames = asyncio.run(scenario())
+    assert frames[0].startswith(f"id: {feed.event_id(1)}\nevent: change\n")
+    assert json.loads(frames[1].split("data: ")[1]) == {"entity": "product", "id": 1, "op": "update", "version": 2}
+    assert feed.subscribers == set()
+
+
+def test_slow_subscriber_is_dropped_without_blocking_publishers(feed):
+    async def scenario():
+        subscription = feed.subscribe()
+        stream = changes.sse(subscription)
+        for i in range(10):
+            feed.publish("product", i, changes.UPDATE, 2)
+        return [frame async for frame in stream]
+
+    frames = asyncio.run(scenario())
+    # The queue holds four events; the client resumes from the last of them.
+    assert len(frames) == 5 and frames[-1] == changes.LAGGED_SSE
+    assert feed.metrics()["lagged"] == 1 and feed.subscribers == set()
+
+
+def test_restart_wakes_idle_subscribers(feed):
+    async def scenario():
+        waiting = feed.subscribe()
+        stream = changes.sse(feed.subscribe())
+        pending = asyncio.create_task(anext(stream))
+        blocked = asyncio.create_task(waiting.get())
+        await asyncio.sleep(0.01)
+        feed.restart()
+        frame = await asyncio.wait_for(pending, 1)
+        with pytest.raises(changes.Lagged):
+            await asyncio.wait_for(blocked, 1)
+        await stream.aclose()
+        return frame
+
+    assert asyncio.run(scenario()) == changes.LAGGED_SSE
+
+
+def test_subscriber_limit_answers_503(client, feed):
+    feed.subscribe()
+    feed.subscribe()
+    assert client.get("/changes/stream").status_code == 503
+    assert feed.metrics()["rejected"] == 1
+
+
+def test_websocket_resumes_and_receives_writes(client, feed, ws_user):
+    client.post("/createProduct", json=product_payload(sku="SKU1"))
+    since = feed.event_id(0)
+
+    with client.websocket_connect(f"/changes/ws?since={since}") as ws:
+        assert ws.receive_json() == {"type": "change", "event_id": feed.event_id(1), "entity": "product",
+                                     "id": 1, "op": "create", "version": 1}
+        client.delete("/deleteProduct/1")
+        assert ws.receive_json()["op"] == "delete"
+
+    with client.websocket_connect("/changes/ws?since=old.1") as ws:
+        assert ws.receive_json() == {"type": "reset"}
+
+    with client.websocket_connect("/changes/ws") as ws:
+        client.portal.call(asyncio.sleep, 0.05)
+        client.portal.call(feed.restart)
+        assert ws.receive_json() == {"type": "lagged"}
+
+
+def test_websocket_needs_a_token(client, feed):
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/changes/ws") as ws:
+            ws.receive_json()
+    assert exc.value.code == 1008
@@ -0,0 +1,171 @@
+import asyncio
+import gc
+import time
+import warnings
+
+import httpx
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import auth
+import database
+import main
+import model
+from tests.conftest import product_payload
+
+
+def test_postgres_urls_use_asyncpg():
+    assert database.normalize_url("postgres://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert database.normalize_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert database.normalize_url("sqlite+aiosqlite:///./x.db") == "sqlite+aiosqlite:///./x.db"
+
+
+def test_sqlite_engine_uses_wal_and_reports_pool_usage(tmp_path):
+    engine = database.build_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", pool_size=2, max_overflow=0)
+
+    async def scenario():
+        async with engine.connect() as conn:
+            mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+            during = database.pool_metrics(engine)
+        await engine.dispose()
+        return mode, during
+
+    mode, during = asyncio.run(scenario())
+    assert mode == "wal"
+    assert during["checked_out"] == 1
+    assert during["utilization"] == 0.5
+    assert during["checkouts"] == 1
+
+
+def test_router_prefers_healthy_replicas_but_keeps_writers_on_primary(monkeypatch):
+    monkeypatch.setattr(database, "REPLICA_MAX_LAG_SECONDS", 1)
+    primary = object()
+    # Never connected to, so there is nothing to dispose.
+    router = database.SessionRouter(primary, ["sqlite+aiosqlite:///r1.db", "sqlite+aiosqlite:///r2.db"])
+    first, second = (replica.engine for replica in router.replicas)
+
+    assert [router.pick(), router.pick(), router.pick()] == [first, second, first]
+
+    router.mark_write("writer@example.com")
+    assert router.pick("writer@example.com") is primary
+    assert router.pick("reader@example.com") is not primary
+
+    # Data that changed more recently than the assumed replica lag.
+    assert router.pick(modified_at=time.time()) is primary
+    assert router.pick(modified_at=time.time() - 2) is not primary
+
+    router.replicas[0].healthy = router.replicas[1].healthy = False
+    assert router.pick() is primary
+
+
+def test_failed_health_check_takes_replica_out_of_rotation(tmp_path):
+    router = database.SessionRouter(object(), [f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'r.db'}"])
+
+    async def scenario():
+        try:
+            await router.check_replicas()
+        finally:
+            await router.stop()
+            # aiosqlite stops the thread of a failed connect without waiting;
+            # let it report back before the loop closes.
+            await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    replica = router.replicas[0]
+    assert not replica.healthy
+    assert replica.last_error
+
+
+def test_read_endpoints_are_routed_to_replicas(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "REPLICA_MAX_LAG_SECONDS", 0)
+    primary = database.build_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    replica_url = f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+    router = database.SessionRouter(primary, [replica_url])
+
+    async def create_schema():
+        for engine in (primary, router.replicas[0].engine):
+            async with engine.begin() as conn:
+                await conn.run_sync(model.Base.metadata.create_all)
+            # Pooled connections belong to this loop; the app opens its own.
+            await engine.dispose()
+
+    asyncio.run(create_schema())
+    monkeypatch.setattr(database, "router", router)
+    monkeypatch.setattr(main, "engine", primary)
+    monkeypatch.setattr(main, "AsyncSessionLocal",
+                        sessionmaker(bind=primary, class_=AsyncSession, expire_on_commit=False))
+
+    def user_from_header(request: Request):
+        return request.headers.get("X-User")
+
+    main.app.dependency_overrides[auth.get_current_user] = user_from_header
+    main.app.dependency_overrides[auth.get_optional_user] = user_from_header
+    try:
+        with TestClient(main.app) as client:
+            writer, reader = {"X-User": "writer"}, {"X-User": "reader"}
+            assert client.post("/createProduct", json=product_payload(), headers=writer).status_code == 201
+
+            # The replica never receives the row, standing in for lag.
+            assert client.get("/products/export", headers=writer).text.count("\n") == 1
+            assert client.get("/products/export", headers=reader).text == ""
+            assert router.replicas[0].reads == 1
+    finally:
+        main.app.dependency_overrides.clear()
+
+        async def dispose():
+            await router.stop()
+            await primary.dispose()
+        asyncio.run(dispose())
+
+
+def test_failed_writes_return_connections_clean_under_concurrency(tmp_path, monkeypatch):
+    engine = database.build_engine(f"sqlite+aiosqlite:///{tmp_path / 'writes.db'}")
+    monkeypatch.setattr(main, "engine", engine)
+    monkeypatch.setattr(main, "AsyncSessionLocal",
+                        sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False))
+    resets = []
+    event.listen(engine.sync_engine, "reset", lambda conn, record, state: resets.append(state))
+
+    async def scenario():
+        await main.create_tables()
+        await main.startup()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            user = {"email": "dup@example.com", "password": "secret"}
+            assert (await client.post("/register", json=user)).status_code == 200
+            assert (await client.post("/createProduct", json=product_payload(sku="DUP"))).status_code == 201
+            responses = await asyncio.gather(
+                *(client.post("/register", json=user) for _ in range(20)),
+                *(client.post("/createProduct", json=product_payload(sku="DUP")) for _ in range(20)),
+            )
+        await main.shutdown()
+        during = database.pool_metrics(engine)
+        async with engine.connect() as conn:
+            in_transaction = (await conn.get_raw_connection()).driver_connection._conn.in_transaction
+            counts = [await conn.scalar(select(func.count()).select_from(table))
+                      for table in (model.User, model.Product)]
+        await engine.dispose()
+        return responses, during, in_transaction, counts
+
+    main.app.dependency_overrides[auth.get_current_user] = lambda: "tester@example.com"
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            responses, during, in_transaction, counts = asyncio.run(scenario())
+            gc.collect()
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert sorted({res.status_code for res in responses}) == [400, 409]
+    assert during["checked_out"] == 0
+    # No connection had to be torn down for being left in an unknown state,
+    # and none comes back from the pool mid-transaction.
+    assert not any(state.terminate_only for state in resets)
+    assert not in_transaction
+    assert counts == [1, 1]
+    assert not [w for w in caught if "never awaited" in str(w.message)]
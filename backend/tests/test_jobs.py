@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import time
+
+import jobs
+import main
+from model import Job
+from tests.conftest import product_payload
+
+
+def wait_for(client, job_id, *statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in statuses or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def submit(client, kind, params=None, max_attempts=jobs.JOB_MAX_ATTEMPTS):
+    return client.portal.call(lambda: jobs.runner.submit(kind, params, max_attempts=max_attempts))
+
+
+def test_background_import_reports_progress_and_result(client, tmp_path, monkeypatch):
+    spool = tmp_path / "spool"
+    monkeypatch.setattr(main, "JOB_SPOOL_DIR", str(spool))
+    body = "".join(json.dumps(product_payload(sku=f"SKU{i:05d}")) + "\n" for i in range(25)) + "not json\n"
+
+    res = client.post("/products/bulk", params={"background": "true", "batch_size": 10}, content=body,
+                      headers={"Content-Type": "application/x-ndjson"})
+    assert res.status_code == 202
+    assert res.headers["Location"] == f"/jobs/{res.json()['id']}"
+
+    job = wait_for(client, res.json()["id"], *jobs.FINISHED)
+    assert job["status"] == "succeeded"
+    assert job["progress"] == job["total"] == len(body)
+    assert (job["result"]["upserted"], job["result"]["failed"]) == (25, 1)
+    assert len(client.get("/products").json()["items"]) == 25
+    assert os.listdir(spool) == []
+
+
+def test_failed_jobs_are_retried_with_backoff(client, monkeypatch):
+    calls = []
+
+    async def flaky(ctx, params):
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise RuntimeError("try again")
+        return {"attempt": ctx.attempt}
+
+    async def broken(ctx, params):
+        raise RuntimeError("always")
+
+    monkeypatch.setitem(jobs.HANDLERS, "test.flaky", jobs.Handler(flaky))
+    monkeypatch.setitem(jobs.HANDLERS, "test.broken", jobs.Handler(broken))
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 0.05)
+
+    job = wait_for(client, submit(client, "test.flaky")["id"], *jobs.FINISHED)
+    assert (job["status"], job["attempts"], job["result"]) == ("succeeded", 3, {"attempt": 3})
+    assert calls[2] - calls[1] >= calls[1] - calls[0] >= 0.05
+
+    job = wait_for(client, submit(client, "test.broken", max_attempts=2)["id"], *jobs.FINISHED)
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 2, "RuntimeError('always')")
+
+
+def test_running_and_queued_jobs_can_be_cancelled(client, monkeypatch):
+    started = []
+
+    async def endless(ctx, params):
+        started.append(ctx.job_id)
+        while True:
+            await ctx.progress(len(started))
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setitem(jobs.HANDLERS, "test.endless", jobs.Handler(endless))
+    ids = [submit(client, "test.endless")["id"] for _ in range(jobs.runner.workers + 1)]
+    wait_for(client, ids[0], "running")
+    wait_for(client, ids[1], "running")
+
+    assert client.post(f"/jobs/{ids[-1]}/cancel").json()["status"] == "cancelled"
+    for job_id in ids[:-1]:
+        assert client.post(f"/jobs/{job_id}/cancel").json()["cancel_requested"]
+        assert wait_for(client, job_id, *jobs.FINISHED)["status"] == "cancelled"
+    assert ids[-1] not in started
+    assert client.post(f"/jobs/{ids[0]}/cancel").status_code == 409
+
+
+def test_rebuild_jobs_run_from_the_api(client):
+    res = client.post("/jobs", json={"kind": "summary.rebuild"})
+    assert res.status_code == 202
+    assert wait_for(client, res.json()["id"], *jobs.FINISHED)["status"] == "succeeded"
+    res = client.post("/jobs", json={"kind": "search.reindex"})
+    assert wait_for(client, res.json()["id"], *jobs.FINISHED)["status"] == "succeeded"
+    assert client.post("/jobs", json={"kind": "rm -rf"}).status_code == 422
+    assert client.get("/jobs/999").status_code == 404
+    assert [job["kind"] for job in client.get("/jobs").json()] == ["search.reindex", "summary.rebuild"]
+
+
+def test_queued_jobs_survive_a_restart(client, app_engine):
+    now = time.time()
+
+    async def persist():
+        async with jobs.runner.sessions() as db:
+            db.add(Job(kind="summary.rebuild", status=jobs.QUEUED, params={}, created_at=now,
+                       updated_at=now, run_after=now))
+            await db.commit()
+        runner = jobs.JobRunner(workers=1)
+        await runner.start(app_engine)
+        for _ in range(500):
+            job = await runner.get(1)
+            if job["status"] in jobs.FINISHED:
+                break
+            await asyncio.sleep(0.01)
+        await runner.stop()
+        return job
+
+    assert client.portal.call(persist)["status"] == "succeeded"
+
+
+def test_running_jobs_send_heartbeats_without_progress(client, monkeypatch):
+    release = asyncio.Event()
+
+    async def silent(ctx, params):
+        await release.wait()
+
+    monkeypatch.setitem(jobs.HANDLERS, "test.silent", jobs.Handler(silent))
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.02)
+
+    async def restart():
+        # The running heartbeat is already asleep for the default interval.
+        await jobs.runner.stop()
+        await jobs.runner.start(jobs.runner.engine)
+    client.portal.call(restart)
+
+    started = wait_for(client, submit(client, "test.silent")["id"], "running")
+    time.sleep(0.2)
+    assert client.get(f"/jobs/{started['id']}").json()["updated_at"] > started["updated_at"]
+    client.portal.call(release.set)
+    assert wait_for(client, started["id"], *jobs.FINISHED)["status"] == "succeeded"
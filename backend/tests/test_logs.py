@@ -0,0 +1,42 @@
+import io
+import json
+import logging
+import sys
+
+import logs
+from tests.conftest import product_payload
+
+
+def test_requests_are_logged_as_json_with_their_request_id(client):
+    logs.shutdown()  # replace the stdout pipeline started by the app
+    stream = io.StringIO()
+    logs.setup(stream)
+    try:
+        res = client.post("/createProduct", json=product_payload(), headers={"X-Request-ID": "req-123"})
+        assert res.headers["X-Request-ID"] == "req-123"
+        assert client.post("/createProduct", json=product_payload()).status_code == 409
+    finally:
+        logs.shutdown()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    access = [r for r in records if r["message"] == "request"]
+    assert access[0]["request_id"] == "req-123"
+    assert access[0]["path"] == "/createProduct"
+    assert access[0]["status"] == 201
+    assert access[1]["status"] == 409
+    assert access[1]["request_id"] != "req-123"
+
+
+def test_exceptions_are_formatted_into_the_record():
+    record = logging.makeLogRecord({"name": "pms", "levelname": "ERROR", "msg": "boom %s", "args": (1,)})
+    try:
+        raise ValueError("bad")
+    except ValueError:
+        record.exc_info = sys.exc_info()
+    record.sku = "A1"
+
+    entry = json.loads(logs.JsonFormatter().format(record))
+    assert entry["message"] == "boom 1"
+    assert entry["sku"] == "A1"
+    assert entry["request_id"] == "-"
+    assert "ValueError: bad" in entry["exc"]
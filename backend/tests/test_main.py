@@ -0,0 +1,186 @@
+import sqlite3
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import main
+from model import Product
+from tests.conftest import product_payload, supplier_payload
+
+
+def seed_products(client, count, **overrides):
+    for i in range(count):
+        fields = {"sku": f"SKU{i:05d}"}
+        fields.update(overrides)
+        res = client.post("/createProduct", json=product_payload(**fields))
+        assert res.status_code == 201
+
+
+def test_products_are_paginated_by_cursor(client):
+    seed_products(client, 5)
+
+    first = client.get("/products", params={"limit": 2}).json()
+    assert [p["id"] for p in first["items"]] == [1, 2]
+    assert first["next_cursor"] == 2
+
+    second = client.get("/products", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [p["id"] for p in second["items"]] == [3, 4]
+
+    last = client.get("/products", params={"limit": 2, "cursor": second["next_cursor"]}).json()
+    assert [p["id"] for p in last["items"]] == [5]
+    assert last["next_cursor"] is None
+
+
+def test_products_descending_order(client):
+    seed_products(client, 3)
+
+    page = client.get("/products", params={"order": "desc", "limit": 2}).json()
+    assert [p["id"] for p in page["items"]] == [3, 2]
+    page = client.get("/products", params={"order": "desc", "cursor": page["next_cursor"]}).json()
+    assert [p["id"] for p in page["items"]] == [1]
+
+
+def test_products_filters(client):
+    client.post("/createProduct", json=product_payload(sku="A", category="Books", price=5))
+    client.post("/createProduct", json=product_payload(sku="B", category="Books", price=50, status="retired"))
+    client.post("/createProduct", json=product_payload(sku="C", category="Toys", price=20, supplier_id=2))
+
+    def skus(**params):
+        return [p["sku"] for p in client.get("/products", params=params).json()["items"]]
+
+    assert skus(category="Books") == ["A", "B"]
+    assert skus(status="retired") == ["B"]
+    assert skus(supplier_id=2) == ["C"]
+    assert skus(min_price=10, max_price=30) == ["C"]
+
+
+def test_products_prefix_search(client):
+    client.post("/createProduct", json=product_payload(sku="LMP-1", name="Desk lamp"))
+    client.post("/createProduct", json=product_payload(sku="DSK-1", name="Oak desk"))
+    client.post("/createProduct", json=product_payload(sku="D_1", name="Chair"))
+
+    def skus(q):
+        return [p["sku"] for p in client.get("/products", params={"q": q}).json()["items"]]
+
+    assert skus("Desk") == ["LMP-1", "DSK-1"]
+    assert skus("oak des") == ["DSK-1"]
+    assert skus("DSK") == ["DSK-1"]
+    assert skus("D_") == ["D_1"]
+    assert skus("%") == []
+
+
+def test_page_size_is_capped(client):
+    assert client.get("/products", params={"limit": 100000}).status_code == 422
+    assert client.get("/suppliers", params={"limit": 0}).status_code == 422
+
+
+def test_mutations_return_only_the_affected_row(client):
+    seed_products(client, 3)
+
+    res = client.put("/updateProduct/2", json=product_payload(sku="SKU00001", name="Renamed"))
+    assert res.status_code == 200
+    assert res.json()["data"]["name"] == "Renamed"
+    assert res.json()["data"]["version"] == 2
+    assert res.headers["ETag"] == 'W/"product-2-2"'
+
+    res = client.delete("/deleteProduct/3")
+    assert res.status_code == 200
+    assert res.json()["data"]["id"] == 3
+    assert client.delete("/deleteProduct/3").status_code == 404
+
+
+def test_supplier_mutations_return_only_the_affected_row(client):
+    res = client.post("/createSupplier", json=supplier_payload())
+    assert res.status_code == 200
+    assert res.json()["data"]["id"] == 1
+    assert res.headers["ETag"] == 'W/"supplier-1-1"'
+
+    res = client.put("/updateSupplier/1", json=supplier_payload(name="Acme"))
+    assert res.json()["data"] == {**supplier_payload(name="Acme"), "id": 1, "version": 2}
+
+    res = client.delete("/deleteSupplier/1")
+    assert res.json()["data"]["name"] == "Acme"
+
+
+def test_dashboard_stats_are_aggregated_in_sql(client):
+    client.post("/createSupplier", json=supplier_payload(name="Acme"))
+    client.post("/createSupplier", json=supplier_payload(name="Globex"))
+    client.post("/createProduct", json=product_payload(sku="A", category="Books", stock=5, supplier_id=1))
+    client.post("/createProduct", json=product_payload(sku="B", category="Books", stock=7, supplier_id=2))
+    client.post("/createProduct", json=product_payload(sku="C", category="Toys", stock=3, supplier_id=1))
+
+    assert client.get("/stats/category-counts").json() == [
+        {"category": "Books", "count": 2},
+        {"category": "Toys", "count": 1},
+    ]
+    assert client.get("/stats/stock-by-supplier").json() == [
+        {"supplier_id": 1, "supplier_name": "Acme", "stock": 8},
+        {"supplier_id": 2, "supplier_name": "Globex", "stock": 7},
+    ]
+
+
+def test_dashboard_stats_follow_product_and_supplier_writes(client):
+    client.post("/createSupplier", json=supplier_payload(name="Acme"))
+    client.post("/createProduct", json=product_payload(sku="A", category="Books", stock=5, supplier_id=1))
+    assert client.get("/stats/category-counts").headers["X-FastAPI-Cache"] == "MISS"
+    assert client.get("/stats/category-counts").headers["X-FastAPI-Cache"] == "HIT"
+    client.get("/stats/stock-by-supplier")
+
+    client.put("/updateProduct/1", json=product_payload(sku="A", category="Toys", stock=9, supplier_id=1))
+    assert client.get("/stats/category-counts").json() == [{"category": "Toys", "count": 1}]
+
+    client.put("/updateSupplier/1", json=supplier_payload(name="Initech"))
+    res = client.get("/stats/stock-by-supplier")
+    assert res.headers["X-FastAPI-Cache"] == "MISS"
+    assert res.json() == [{"supplier_id": 1, "supplier_name": "Initech", "stock": 9}]
+
+
+def test_update_of_a_concurrently_changed_row_is_a_conflict(client, app_engine):
+    client.post("/createProduct", json=product_payload())
+
+    async def scenario():
+        async with AsyncSession(app_engine, expire_on_commit=False) as db:
+            product = await db.get(Product, 1)
+            async with app_engine.begin() as conn:
+                await conn.execute(update(Product).values(version=Product.version + 1))
+            product.name = "Lost update"
+            try:
+                await main.commit_or_conflict(db)
+            except HTTPException as exc:
+                return exc.status_code
+
+    assert client.portal.call(scenario) == 409
+    assert client.get("/products/1").json()["name"] == "Sample Product"
+
+
+# The tables as the first release created them.
+BASELINE_SCHEMA = """
+CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, email VARCHAR NOT NULL UNIQUE, hashed_password VARCHAR NOT NULL);
+CREATE TABLE suppliers (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR, contact_info VARCHAR, address VARCHAR,
+                        phone_number VARCHAR, email VARCHAR);
+CREATE TABLE products (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR, price FLOAT, category VARCHAR,
+                       stock INTEGER, sku VARCHAR UNIQUE, supplier_id INTEGER REFERENCES suppliers (id),
+                       status VARCHAR);
+INSERT INTO suppliers (name) VALUES ('Acme');
+INSERT INTO products (name, price, category, stock, sku, supplier_id, status)
+VALUES ('Lamp', 19.5, 'Home', 3, 'L1', 1, 'available');
+"""
+
+
+def test_startup_upgrades_a_database_from_the_first_release(app_engine, tmp_path):
+    with sqlite3.connect(tmp_path / "test.db") as db:
+        db.executescript(BASELINE_SCHEMA)
+
+    with TestClient(main.app) as client:
+        assert client.get("/products/1").json()["version"] == 1
+        updated = client.put("/updateProduct/1", json=product_payload(sku="L1", stock=4)).json()
+        assert updated["data"]["version"] == 2
+        assert client.get("/suppliers").json()["items"][0]["version"] == 1
+        assert client.get("/stats/category-counts").json() == [{"category": "Electronics", "count": 1}]
+
+    with sqlite3.connect(tmp_path / "test.db") as db:
+        indexes = {name for (name,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"ix_products_category_id", "ix_products_status_id", "ix_products_supplier_id_id",
+            "ix_products_price"} <= indexes
@@ -0,0 +1,52 @@
+import metrics
+from tests.conftest import product_payload
+
+
+def sample(body, line_prefix):
+    return [float(line.rsplit(" ", 1)[1]) for line in body.splitlines() if line.startswith(line_prefix)]
+
+
+def test_metrics_expose_route_latency_queries_and_runtime_gauges(client):
+    client.post("/createProduct", json=product_payload())
+    client.get("/products/1")
+    res = client.get("/products/1")
+    assert res.headers["Server-Timing"] == 'db;dur=0.00;desc="0 queries"'
+
+    body = client.get("/metrics").text
+    route = 'method="GET",route="/products/{product_id}"'
+    assert sample(body, f'pms_http_request_duration_seconds_count{{{route},status="200"}}') == [2]
+    # One query on the miss, none on the cache hit.
+    assert sample(body, f'pms_http_request_db_queries_bucket{{{route},le="0"}}') == [1]
+    assert sample(body, f'pms_http_request_db_queries_count{{{route}}}') == [2]
+    assert sample(body, 'pms_cache_lookups_total{result="hits"}') == [1]
+    assert sample(body, "pms_password_hash_queue_depth") == [0]
+    assert sample(body, 'pms_db_pool_checked_out{pool="primary"}') == [0]
+    assert sample(body, "pms_db_query_duration_seconds_count")[0] > 0
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("h", "test", (0.1, 1.0), ("route",))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, "/x")
+
+    lines = list(histogram.render())
+    assert 'h_bucket{route="/x",le="0.1"} 2' in lines
+    assert 'h_bucket{route="/x",le="1.0"} 3' in lines
+    assert 'h_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'h_count{route="/x"} 4' in lines
+
+
+def test_profile_header_writes_folded_stacks(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(metrics, "PROFILE_MIN_SECONDS", 0)
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+
+    client.post("/register", json={"email": "p@example.com", "password": "secret"},
+                headers={"X-Profile": "1", "X-Request-ID": "../prof"})
+
+    profile = tmp_path / "___prof.folded"
+    lines = profile.read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    assert ";" in stack or "(" in stack
@@ -0,0 +1,52 @@
+from tests.conftest import product_payload
+
+
+def search(client, q, **params):
+    res = client.get("/products/search", params={"q": q, **params})
+    assert res.status_code == 200
+    return res.json()
+
+
+def skus(page):
+    return [p["sku"] for p in page["items"]]
+
+
+def test_search_matches_prefixes_and_ranks_sku_hits_first(client):
+    client.post("/createProduct", json=product_payload(sku="LMP-100", name="Desk lamp", category="Lighting"))
+    client.post("/createProduct", json=product_payload(sku="DSK-200", name="Oak desk", category="Furniture"))
+    client.post("/createProduct", json=product_payload(sku="CHR-300", name="Lamp chair", category="Desks"))
+
+    assert skus(search(client, "lmp-1")) == ["LMP-100"]
+    # Name hits outrank the category hit.
+    assert skus(search(client, "desk"))[2] == "CHR-300"
+    assert skus(search(client, "dsk")) == ["DSK-200"]
+    assert skus(search(client, "lamp desk")) == ["LMP-100", "CHR-300"]
+    assert search(client, "!!!") == {"items": [], "next_offset": None}
+
+
+def test_search_follows_writes(client):
+    client.post("/createProduct", json=product_payload(sku="A1", name="Kettle"))
+    assert skus(search(client, "kett")) == ["A1"]
+
+    client.put("/updateProduct/1", json=product_payload(sku="A1", name="Toaster"))
+    assert skus(search(client, "kett")) == []
+    assert skus(search(client, "toast")) == ["A1"]
+
+    body = '{"name": "Kettle XL", "category": "Kitchen", "price": 30, "stock": 3, "sku": "K2", "supplier_id": 1, "status": "available"}\n'
+    client.post("/products/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert skus(search(client, "kett")) == ["K2"]
+
+    client.delete("/deleteProduct/1")
+    assert skus(search(client, "toast")) == []
+
+
+def test_search_pages_by_offset(client):
+    for i in range(5):
+        client.post("/createProduct", json=product_payload(sku=f"SKU{i}", name="Widget"))
+
+    first = search(client, "widget", limit=2)
+    assert first["next_offset"] == 2
+    second = search(client, "widget", limit=2, offset=first["next_offset"])
+    last = search(client, "widget", limit=2, offset=second["next_offset"])
+    assert last["next_offset"] is None
+    assert sorted(skus(first) + skus(second) + skus(last)) == [f"SKU{i}" for i in range(5)]
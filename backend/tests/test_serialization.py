@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+import serialization
+from tests.conftest import product_payload, supplier_payload
+
+CACHE_HEADER = "X-FastAPI-Cache"
+
+
+def seed(client, count):
+    for i in range(count):
+        assert client.post("/createProduct", json=product_payload(sku=f"SKU{i:05d}", name=f"Lamp {i}")).status_code == 201
+
+
+def test_record_items_carry_every_product_column(client):
+    seed(client, 1)
+
+    item = client.get("/products").json()["items"][0]
+    assert item == {"id": 1, "version": 1, **product_payload(sku="SKU00000", name="Lamp 0")}
+
+
+def test_columns_format_holds_the_same_rows(client):
+    seed(client, 3)
+
+    records = client.get("/products", params={"limit": 2}).json()
+    page = client.get("/products", params={"limit": 2, "format": "columns"}).json()
+    assert page["next_cursor"] == records["next_cursor"] == 2
+    assert page["items"]["sku"] == ["SKU00000", "SKU00001"]
+    keys = list(page["items"])
+    assert [dict(zip(keys, row)) for row in zip(*page["items"].values())] == records["items"]
+
+
+def test_columns_format_of_an_empty_page_keeps_its_columns(client):
+    page = client.get("/products", params={"format": "columns"}).json()
+    assert page == {"items": {key: [] for key in serialization.names(serialization.PRODUCT_COLUMNS)},
+                    "next_cursor": None}
+
+
+def test_arrow_format_is_cached_with_its_media_type(client):
+    ipc = pytest.importorskip("pyarrow.ipc")
+    seed(client, 3)
+
+    first = client.get("/products", params={"limit": 2, "format": "arrow"})
+    assert first.headers["content-type"] == serialization.ARROW_MEDIA_TYPE
+    table = ipc.open_stream(io.BytesIO(first.content)).read_all()
+    assert table.column("sku").to_pylist() == ["SKU00000", "SKU00001"]
+    assert json.loads(table.schema.metadata[b"next_cursor"]) == 2
+
+    again = client.get("/products", params={"limit": 2, "format": "arrow"})
+    assert again.headers[CACHE_HEADER] == "HIT"
+    assert again.headers["content-type"] == serialization.ARROW_MEDIA_TYPE
+    assert again.content == first.content
+
+
+def test_arrow_format_without_pyarrow_says_so(client, monkeypatch):
+    monkeypatch.setattr(serialization, "pyarrow", None)
+    res = client.get("/products", params={"format": "arrow"})
+    assert res.status_code == 501
+    assert res.json()["detail"] == "format=arrow needs pyarrow installed on the server"
+
+
+def test_search_and_suppliers_accept_a_format(client):
+    seed(client, 2)
+    client.post("/createSupplier", json=supplier_payload())
+
+    found = client.get("/products/search", params={"q": "lamp", "format": "columns"}).json()
+    assert sorted(found["items"]["id"]) == [1, 2]
+    suppliers = client.get("/suppliers", params={"format": "columns"}).json()
+    assert suppliers["items"]["email"] == [supplier_payload()["email"]]
+    assert client.get("/suppliers", params={"format": "xml"}).status_code == 422
+
+
+@pytest.mark.parametrize("orjson", [serialization.orjson, None])
+def test_dumps_matches_the_json_module(monkeypatch, orjson):
+    monkeypatch.setattr(serialization, "orjson", orjson)
+    value = {"items": [{"id": 1, "name": "Lämp", "price": 9.5, "tags": ("a", "b")}], "next_cursor": None}
+    assert serialization.dumps(value) == json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
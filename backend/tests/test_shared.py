@@ -0,0 +1,177 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import auth
+import caching
+import changes
+import main
+import shared
+from tests.conftest import product_payload
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def segment_path(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def open_segment(path, capacity=1024):
+    return shared.Segment(path, capacity=capacity, slots=64, generation_slots=64)
+
+
+def test_entries_written_by_one_worker_are_read_by_another(segment_path):
+    first, second = open_segment(segment_path), open_segment(segment_path)
+    expires = time.time() + 60
+
+    assert first.write("products:g0:list", b"page one", expires)
+    assert second.read("products:g0:list") == (expires, b"page one")
+    assert second.read("products:g0:other") is None
+
+    assert second.remove("products:g0:list")
+    assert first.read("products:g0:list") is None
+    first.close()
+    second.close()
+    assert not os.path.exists(segment_path)
+
+
+def test_workers_must_agree_on_the_layout(segment_path):
+    segment = open_segment(segment_path)
+    with pytest.raises(RuntimeError):
+        open_segment(segment_path, capacity=2048)
+    segment.close()
+
+
+def test_ring_overwrites_the_oldest_records(segment_path):
+    segment = open_segment(segment_path, capacity=256)
+    expires = time.time() + 60
+    for i in range(6):
+        segment.write(f"key{i}", bytes([i]) * 40, expires)
+
+    # Each record takes 60 bytes, so only the last four fit.
+    assert [segment.read(f"key{i}") is not None for i in range(6)] == [False, False, True, True, True, True]
+    assert segment.read("key5") == (expires, bytes([5]) * 40)
+    assert not segment.write("huge", b"x" * 300, expires)
+    segment.close()
+
+
+def test_generations_are_shared_across_processes(segment_path):
+    segment = open_segment(segment_path)
+    generations = shared.SharedGenerations(segment)
+    script = (
+        "import sys, shared\n"
+        "segment = shared.Segment(sys.argv[1], capacity=1024, slots=64, generation_slots=64)\n"
+        "segment.bump(['products', 'products:7'], 1234.5)\n"
+        "segment.write('from-child', b'hello', 4e9)\n"
+        "segment.close()\n"
+    )
+    subprocess.run([sys.executable, "-c", script, segment_path], cwd=BACKEND_DIR, check=True)
+
+    assert generations.get("products") == 1 and generations.get("products:7") == 1
+    assert generations.modified_at("products") == 1234.5
+    assert generations.modified_at("suppliers") == generations.started_at == segment.created_at
+    assert segment.read("from-child") == (4e9, b"hello")
+    segment.close()
+
+
+def test_broadcast_delivers_and_notices_gaps(tmp_path):
+    async def scenario():
+        received = []
+        first = shared.Broadcast(str(tmp_path / "peers"), "a")
+        second = shared.Broadcast(str(tmp_path / "peers"), "b")
+        first.start(lambda *message: None)
+        second.start(lambda *message: received.append(message))
+        first.send("write", "someone@example.com")
+        first._sent_to["b.sock"] += 1  # as if a datagram was dropped
+        first.send("changes", [["product", 1, "update", 2]])
+        await asyncio.sleep(0.05)
+        first.stop()
+        second.stop()
+        return received
+
+    assert asyncio.run(scenario()) == [("write", "someone@example.com", False),
+                                       ("changes", [["product", 1, "update", 2]], True)]
+
+
+def test_remote_events_reach_local_subscribers(monkeypatch):
+    feed = changes.ChangeFeed()
+    monkeypatch.setattr(changes, "feed", feed)
+
+    async def scenario():
+        subscription = feed.subscribe()
+        shared._receive("changes", [["supplier", 3, "create", 1]], False)
+        event = await subscription.get(1)
+        seen = feed.last_id
+        idle = feed.subscribe()
+        waiting = asyncio.create_task(idle.get())
+        await asyncio.sleep(0.01)
+        shared._receive("changes", [["supplier", 4, "create", 1]], True)
+        with pytest.raises(changes.Lagged):
+            await asyncio.wait_for(waiting, 1)
+        return event, seen, subscription
+
+    event, seen, subscription = asyncio.run(scenario())
+    assert event.data == {"entity": "supplier", "id": 3, "op": "create", "version": 1}
+    # After a gap the feed starts a new epoch and ends open streams, waking
+    # the ones waiting for an event.
+    assert subscription.lagged and feed.since(seen) == ([], True)
+
+
+def test_logout_in_one_worker_revokes_the_token_in_the_others(monkeypatch, segment_path):
+    monkeypatch.setattr(auth, "token_cache", auth.TokenCache())
+    token = auth.create_access_token({"sub": "someone@example.com"})
+    script = (
+        "import asyncio, sys, time, auth, shared\n"
+        "async def main():\n"
+        "    shared.start(sys.argv[1])\n"
+        "    print('ready', flush=True)\n"
+        "    digest = auth.token_digest(sys.argv[2])\n"
+        "    for _ in range(300):\n"
+        "        if auth.token_cache.is_revoked(digest, time.time()):\n"
+        "            print('revoked', flush=True)\n"
+        "            break\n"
+        "        await asyncio.sleep(0.01)\n"
+        "    shared.stop()\n"
+        "asyncio.run(main())\n"
+    )
+
+    async def scenario():
+        shared.start(segment_path)
+        try:
+            worker = await asyncio.create_subprocess_exec(
+                sys.executable, "-c", script, segment_path, token, cwd=BACKEND_DIR, stdout=asyncio.subprocess.PIPE)
+            assert await worker.stdout.readline() == b"ready\n"
+            auth.revoke_token(token)
+            output = await worker.stdout.read()
+            await worker.wait()
+            return output
+        finally:
+            shared.stop()
+
+    assert asyncio.run(scenario()) == b"revoked\n"
+    assert auth.token_cache.relay is None
+
+
+def test_app_serves_from_the_shared_segment(app_engine, monkeypatch, segment_path):
+    monkeypatch.setattr(caching, "CACHE_BACKEND", "shared")
+    monkeypatch.setattr(shared, "CACHE_SHARED_PATH", segment_path)
+    with TestClient(main.app) as client:
+        assert isinstance(caching.generations, shared.SharedGenerations)
+        client.post("/createProduct", json=product_payload())
+        assert client.get("/products/1").headers["X-FastAPI-Cache"] == "MISS"
+        assert client.get("/products/1").headers["X-FastAPI-Cache"] == "HIT"
+
+        # Another worker's write bumps the shared generation.
+        peer = shared.Segment(segment_path)
+        peer.bump(["products:1"])
+        peer.close()
+        assert client.get("/products/1").headers["X-FastAPI-Cache"] == "MISS"
+        assert client.get("/cache/stats").json()["used_bytes"] > 0
+    assert isinstance(caching.generations, caching.Generations)
+    assert not os.path.exists(segment_path)
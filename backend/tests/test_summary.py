@@ -0,0 +1,89 @@
+import asyncio
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import bulk
+import summary
+from model import CategorySummary, SupplierSummary
+from tests.conftest import product_payload, supplier_payload
+
+
+def verify(client, engine):
+    async def run():
+        async with engine.begin() as conn:
+            return await summary.verify(conn)
+    return client.portal.call(run)
+
+
+def stats(client):
+    return (client.get("/stats/category-counts").json(), client.get("/stats/stock-by-supplier").json())
+
+
+def test_product_writes_keep_summaries_in_step(client, app_engine):
+    client.post("/createSupplier", json=supplier_payload(name="Acme"))
+    client.post("/createSupplier", json=supplier_payload(name="Globex"))
+    client.post("/createProduct", json=product_payload(sku="A", category="Books", stock=5, supplier_id=1))
+    client.post("/createProduct", json=product_payload(sku="B", category="Books", stock=7, supplier_id=1))
+
+    client.put("/updateProduct/2", json=product_payload(sku="B", category="Toys", stock=4, supplier_id=2))
+    assert stats(client) == (
+        [{"category": "Books", "count": 1}, {"category": "Toys", "count": 1}],
+        [{"supplier_id": 1, "supplier_name": "Acme", "stock": 5},
+         {"supplier_id": 2, "supplier_name": "Globex", "stock": 4}],
+    )
+
+    client.delete("/deleteProduct/1")
+    assert stats(client) == (
+        [{"category": "Toys", "count": 1}],
+        [{"supplier_id": 2, "supplier_name": "Globex", "stock": 4}],
+    )
+    assert verify(client, app_engine) == {"categories": [], "suppliers": []}
+
+
+def test_bulk_upsert_replaces_the_overwritten_rows_totals(client, app_engine):
+    client.post("/createProduct", json=product_payload(sku="A", category="Books", stock=5))
+    body = "name,category,price,stock,sku,supplier_id,status\n" \
+           "Lamp,Home,19.5,3,A,1,available\n" \
+           "Desk,Home,120,2,D,2,available\n"
+    assert client.post("/products/bulk", content=body, headers={"Content-Type": "text/csv"}).json()["upserted"] == 2
+
+    assert client.get("/stats/category-counts").json() == [{"category": "Home", "count": 2}]
+    assert verify(client, app_engine) == {"categories": [], "suppliers": []}
+
+
+def test_concurrent_imports_of_the_same_skus_count_each_row_once(client, app_engine):
+    rows = {sku: (n, product_payload(sku=sku, category="Home", stock=2)) for n, sku in enumerate("ABC")}
+
+    async def run(rows):
+        async with AsyncSession(app_engine) as db:
+            return await bulk.upsert_batch(db, rows, bulk.ImportReport())
+
+    async def race():
+        return await asyncio.gather(run(rows), run(dict(reversed(rows.items()))))
+    first, second = client.portal.call(race)
+
+    assert len(first) == len(second) == 3
+    assert client.get("/stats/category-counts").json() == [{"category": "Home", "count": 3}]
+    assert verify(client, app_engine) == {"categories": [], "suppliers": []}
+
+
+def test_verify_reports_drift_and_rebuild_repairs_it(client, app_engine):
+    client.post("/createProduct", json=product_payload(sku="A", category="Books", stock=5, supplier_id=3))
+
+    async def tamper():
+        async with app_engine.begin() as conn:
+            await conn.execute(update(CategorySummary).values(product_count=9))
+            await conn.execute(update(SupplierSummary).values(stock=1))
+    client.portal.call(tamper)
+
+    assert verify(client, app_engine) == {
+        "categories": [{"category": "Books", "expected": 1, "stored": 9}],
+        "suppliers": [{"supplier_id": 3, "expected": (1, 5), "stored": (1, 1)}],
+    }
+
+    async def rebuild():
+        async with app_engine.begin() as conn:
+            await summary.rebuild(conn)
+    client.portal.call(rebuild)
+    assert verify(client, app_engine) == {"categories": [], "suppliers": []}
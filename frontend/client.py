@@ -0,0 +1,71 @@
+# HTTP client shared by the Streamlit pages.
+#
+# One requests.Session per process keeps connections to the API alive between
+# calls and reruns instead of paying a TCP + TLS handshake per request.
+# Idempotent calls are retried with exponential backoff on connection errors
+# and 429/502/503/504, every call carries a timeout, and independent requests
+# can be issued concurrently over the same pool.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_URL = os.getenv("API_URL", "https://product-management-system-7.onrender.com")
+# (connect, read) seconds.
+API_TIMEOUT = (float(os.getenv("API_CONNECT_TIMEOUT", 3.05)), float(os.getenv("API_READ_TIMEOUT", 30)))
+API_RETRIES = int(os.getenv("API_RETRIES", 3))
+API_BACKOFF = float(os.getenv("API_BACKOFF", 0.3))
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", 8))
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class ApiClient:
+    def __init__(self, base_url=API_URL, timeout=API_TIMEOUT, retries=API_RETRIES,
+                 backoff=API_BACKOFF, pool_size=API_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # urllib3's default allowed_methods leaves POST out, so creates and
+        # logins are never sent twice.
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      raise_on_status=False, respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="api")
+
+    def url(self, endpoint: str) -> str:
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, self.url(endpoint), **kwargs)
+
+    def get(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("POST", endpoint, **kwargs)
+
+    def put(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("PUT", endpoint, **kwargs)
+
+    def delete(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", endpoint, **kwargs)
+
+    def gather(self, calls):
+        # Runs zero-argument callables concurrently and returns their results
+        # in order. A single call runs inline.
+        calls = list(calls)
+        if len(calls) == 1:
+            return [calls[0]()]
+        futures = [self._executor.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
@@ -1,22 +1,52 @@
+import time
+from functools import partial
+
 import streamlit as st
 import requests
 import pandas as pd
 import matplotlib.pyplot as plt
 
-API_URL = "https://product-management-system-7.onrender.com"
+from client import API_URL, ApiClient
+
+@st.cache_resource
+def get_api():
+    # One pooled client per server process, shared by every session and rerun.
+    return ApiClient(API_URL)
+
+api = get_api()
 
 if 'token' not in st.session_state:
     st.session_state.token = None
 if 'user_email' not in st.session_state:
     st.session_state.user_email = None
+if 'http_cache' not in st.session_state:
+    st.session_state.http_cache = {}
+if 'data_cache' not in st.session_state:
+    st.session_state.data_cache = None
+
+# Every widget interaction reruns the script. Within this window the pages are
+# rebuilt from session state without touching the network; after it, one
+# GET /version tells us which namespaces changed.
+VERSION_CHECK_SECONDS = 30
+# Entries kept per session in each store; the oldest are dropped first.
+MAX_CACHED_ENTRIES = 64
+PAGE_SIZES = [25, 50, 100]
+PICKER_LIMIT = 20
+# Namespaces a successful write through this frontend makes stale.
+WRITE_NAMESPACES = {"Product": ("products", "stats"), "Supplier": ("suppliers", "stats")}
+# Entries kept current from GET /changes instead of being reloaded when their
+# namespace changes: (namespace, key) -> entity. Past this many events a reload
+# is cheaper than fetching the rows one by one.
+FEED_ENTRIES = {("suppliers", "frame"): "supplier"}
+MAX_PATCH_EVENTS = 100
 
 def register_user(email, password):
-    res = requests.post(f"{API_URL}/register", json={"email": email, "password": password})
+    res = api.post("register", json={"email": email, "password": password})
     return res
 
 def login(email, password):
-    response = requests.post(
-        f"{API_URL}/login",
+    response = api.post(
+        "login",
         data={"username": email, "password": password},
         headers={"Content-Type": "application/x-www-form-urlencoded"}
     )
@@ -32,23 +62,176 @@ def login(email, password):
 def get_headers():
     return {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
 
-def get_data(endpoint):
-    res = requests.get(f"{API_URL}/{endpoint}", headers=get_headers())
-    if res.status_code == 200:
-        return res.json()
-    st.warning(f"Failed to fetch from {endpoint}")
-    return []
+def remember(store, key, value):
+    # Insertion-ordered dict capped at MAX_CACHED_ENTRIES, so paging through a
+    # large catalog does not grow session memory without bound.
+    store.pop(key, None)
+    store[key] = value
+    while len(store) > MAX_CACHED_ENTRIES:
+        del store[next(iter(store))]
+    return value
+
+def get_data(endpoint, params=None):
+    return get_many((endpoint, params))[0]
+
+def fetch(endpoint, headers, params):
+    try:
+        return api.get(endpoint, headers=headers, params=params)
+    except requests.RequestException:
+        return None
+
+def get_many(*targets):
+    # Fetches (endpoint, params) pairs concurrently over the pooled client.
+    # Each request revalidates against the copy we already hold: an unchanged
+    # resource comes back as a body-less 304 and is served from session state.
+    # Session state is only touched here, never from the worker threads.
+    prepared = []
+    for endpoint, params in targets:
+        cache_key = (endpoint, tuple(sorted((params or {}).items())))
+        cached = st.session_state.http_cache.get(cache_key)
+        headers = get_headers()
+        if cached:
+            headers["If-None-Match"] = cached["etag"]
+        prepared.append((endpoint, cache_key, cached, partial(fetch, endpoint, headers, params)))
+
+    responses = api.gather(call for *_, call in prepared)
+    results = []
+    for (endpoint, cache_key, cached, _), res in zip(prepared, responses):
+        if res is not None and res.status_code == 304 and cached:
+            results.append(cached["data"])
+        elif res is not None and res.status_code == 200:
+            data = res.json()
+            etag = res.headers.get("ETag")
+            if etag:
+                remember(st.session_state.http_cache, cache_key, {"etag": etag, "data": data})
+            results.append(data)
+        else:
+            st.warning(f"Failed to fetch from {endpoint}")
+            results.append([])
+    return results
+
+def get_frame(endpoint, page_size=1000):
+    # List endpoints are cursor-paginated; walk the pages until the server
+    # stops handing out a next_cursor. Pages come in the columnar shape
+    # ({"id": [...], "name": [...]}), which pandas takes as-is.
+    frames, cursor = [], None
+    while True:
+        params = {"limit": page_size, "format": "columns"}
+        if cursor is not None:
+            params["cursor"] = cursor
+        page = get_data(endpoint, params)
+        if not page:
+            break
+        frames.append(pd.DataFrame(page["items"]))
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def data_store():
+    # Scoped to the token, so logging in as someone else starts empty.
+    store = st.session_state.data_cache
+    if store is None or store["token"] != st.session_state.token:
+        store = {"token": st.session_state.token, "versions": {}, "checked_at": None, "entries": {}}
+        st.session_state.data_cache = store
+    return store
+
+def refresh_versions(store):
+    now = time.monotonic()
+    if store["checked_at"] is not None and now - store["checked_at"] < VERSION_CHECK_SECONDS:
+        return
+    store["checked_at"] = now
+    res = fetch("version", get_headers(), None)
+    if res is None or res.status_code != 200:
+        return
+    versions = res.json()
+    changed = [namespace for namespace, version in versions.items() if store["versions"].get(namespace) != version]
+    patched = patch_entries(store, changed)
+    drop_namespaces(store, *changed)
+    store["entries"].update(patched)
+    store["versions"] = versions
+
+def drop_namespaces(store, *namespaces):
+    for key in [key for key in store["entries"] if key[0] in namespaces]:
+        del store["entries"][key]
+
+def feed_position():
+    # The change feed's current id; loads that will be patched later start
+    # from it, so nothing written during the load is missed.
+    res = fetch("changes", get_headers(), {"limit": 1})
+    return res.json().get("last_id") if res is not None and res.status_code == 200 else None
+
+def read_changes(since, entity):
+    # Events after `since`, or None when the feed cannot tell (reset, too many
+    # to apply, request failed) and the entry has to be reloaded.
+    if since is None:
+        return None
+    res = fetch("changes", get_headers(), {"since": since, "entity": entity, "limit": MAX_PATCH_EVENTS})
+    if res is None or res.status_code != 200:
+        return None
+    page = res.json()
+    if page["reset"] or len(page["events"]) >= MAX_PATCH_EVENTS:
+        return None
+    return page
+
+def patch_entries(store, namespaces):
+    # FEED_ENTRIES in the changed namespaces, brought up to date from the feed;
+    # the caller puts them back after dropping the rest of the namespace.
+    patched = {}
+    for key, entity in FEED_ENTRIES.items():
+        if key[0] in namespaces and key in store["entries"]:
+            since, frame = store["entries"][key]
+            page = read_changes(since, entity)
+            if page is not None:
+                patched[key] = (page["last_id"], apply_changes(frame, entity, page["events"]))
+    return patched
+
+def apply_changes(frame, entity, events):
+    # Only the last event per id matters: deleted rows are dropped and the
+    # rest are fetched again by id.
+    latest = {event["id"]: event["op"] for event in events}
+    frame = frame[~frame["id"].isin(list(latest))] if "id" in frame else frame
+    changed = [entity_id for entity_id, op in latest.items() if op != "delete"]
+    rows = [row for row in get_many(*((f"{entity}s/{entity_id}", None) for entity_id in changed)) if row]
+    if rows:
+        frame = pd.concat([frame, pd.DataFrame(rows, columns=frame.columns if len(frame.columns) else None)],
+                          ignore_index=True)
+    return frame.sort_values("id", ignore_index=True) if "id" in frame else frame
+
+def cached(namespace, key, load):
+    # Returns the stored value for (namespace, key), calling load() only when
+    # there is none or the server reports the namespace changed.
+    store = data_store()
+    refresh_versions(store)
+    if (namespace, key) in FEED_ENTRIES:
+        if (namespace, key) not in store["entries"]:
+            since = feed_position()
+            remember(store["entries"], (namespace, key), (since, load()))
+        return store["entries"][(namespace, key)][1]
+    if (namespace, key) not in store["entries"]:
+        return remember(store["entries"], (namespace, key), load())
+    return store["entries"][(namespace, key)]
+
+def invalidate_after_write(endpoint, res):
+    if res.status_code >= 400:
+        return
+    for kind, namespaces in WRITE_NAMESPACES.items():
+        if kind in endpoint:
+            drop_namespaces(data_store(), *namespaces)
 
 def create_data(endpoint, data):
-    res = requests.post(f"{API_URL}/{endpoint}", json=data, headers=get_headers())
+    res = api.post(endpoint, json=data, headers=get_headers())
+    invalidate_after_write(endpoint, res)
     return res
 
 def update_data(endpoint, data):
-    res = requests.put(f"{API_URL}/{endpoint}", json=data, headers=get_headers())
+    res = api.put(endpoint, json=data, headers=get_headers())
+    invalidate_after_write(endpoint, res)
     return res
 
 def delete_data(endpoint):
-    res = requests.delete(f"{API_URL}/{endpoint}", headers=get_headers())
+    res = api.delete(endpoint, headers=get_headers())
+    invalidate_after_write(endpoint, res)
     return res
 
 # --- Login Section ---
@@ -69,10 +252,7 @@ if not st.session_state.token:
             new_password = st.text_input("New Password", type="password")
             register_btn = st.form_submit_button("Register")
             if register_btn:
-                response = requests.post(
-                    f"{API_URL}/register",
-                    json={"email": new_email, "password": new_password}
-                )
+                response = register_user(new_email, new_password)
                 if response.status_code == 200:
                     st.success("Registration successful! Please log in.")
                 else:
@@ -89,39 +269,54 @@ st.sidebar.title("Navigation")
 selection = st.sidebar.radio("Go to", ["Dashboard", "Products", "Suppliers", "Logout"])
 
 if selection == "Logout":
+    api.post("logout", headers=get_headers())
     st.session_state.token = None
+    st.session_state.http_cache = {}
+    st.session_state.data_cache = None
     st.rerun()
 
 # --- Dashboard with Charts ---
 if selection == "Dashboard":
     st.title("Dashboard Overview")
-    products = get_data("products")
-    suppliers = get_data("suppliers")
+    # Aggregates are computed by the API, so this page costs the same however
+    # large the catalog grows.
+    def load_stats():
+        return [pd.DataFrame(data) for data in get_many(
+            ("stats/category-counts", None), ("stats/stock-by-supplier", None))]
 
-    df_products = pd.DataFrame(products)
-    df_suppliers = pd.DataFrame(suppliers)
+    category_counts, stock_by_supplier = cached("stats", "dashboard", load_stats)
 
-    if not df_products.empty:
+    if not category_counts.empty:
         st.subheader("Product Categories Distribution")
-        category_counts = df_products["category"].value_counts()
         fig1, ax1 = plt.subplots()
-        ax1.pie(category_counts, labels=category_counts.index, autopct="%1.1f%%", startangle=90)
+        ax1.pie(category_counts["count"], labels=category_counts["category"], autopct="%1.1f%%", startangle=90)
         st.pyplot(fig1)
 
-    if not df_suppliers.empty and not df_products.empty:
+    if not stock_by_supplier.empty:
         st.subheader("Stock Count by Supplier")
-        df_suppliers_renamed = df_suppliers.rename(columns={"name": "supplier_name"})
-        merged = df_products.merge(df_suppliers_renamed, left_on="supplier_id", right_on="id")
-        stock_by_supplier = merged.groupby("supplier_name")["stock"].sum()
-        st.bar_chart(stock_by_supplier)
+        st.bar_chart(stock_by_supplier.set_index("supplier_name")["stock"])
 
 elif selection == "Products":
     st.title("Products")
 
-    products = get_data("products")
-    df = pd.DataFrame(products)
-
-    st.dataframe(df)
+    # One page of the grid at a time: the server seeks by cursor, and the
+    # cursors of the pages already seen are kept so "Previous" needs no offset.
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, key="product_page_size")
+    cursors = st.session_state.setdefault("product_cursors", [None])
+    params = {"limit": page_size, "format": "columns"}
+    if cursors[-1] is not None:
+        params["cursor"] = cursors[-1]
+    page = cached("products", ("page", page_size, cursors[-1]), lambda: get_data("products", params))
+    st.dataframe(pd.DataFrame(page["items"] if page else []))
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    if col_prev.button("◀ Previous", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    col_page.caption(f"Page {len(cursors)}")
+    if col_next.button("Next ▶", disabled=not page or page["next_cursor"] is None):
+        cursors.append(page["next_cursor"])
+        st.rerun()
 
     with st.expander("➕ Create New Product"):
         form_data = {
@@ -142,9 +337,22 @@ elif selection == "Products":
                 st.error(res.json().get("detail", "Error creating product"))
 
     st.subheader("Update or Delete Product")
-    selected_id = st.selectbox("Select Product ID", df["id"] if not df.empty else [])
+    query = st.text_input("Find product by name, SKU or category", key="product_query").strip()
+    matches = []
+    if query:
+        # The ranked search endpoint is index-backed; a prefix filter on
+        # /products would scan the table on every keystroke.
+        found = cached("products", ("search", query),
+                       lambda: get_data("products/search", {"q": query, "limit": PICKER_LIMIT}))
+        matches = found["items"] if found else []
+    options = {p["id"]: f'{p["id"]} · {p["name"]} ({p["sku"]})' for p in matches}
+    selected_id = st.selectbox("Select Product", list(options), format_func=options.get)
+    if query and not options:
+        st.caption("No products match.")
+    selected_row = None
     if selected_id:
-        selected_row = df[df["id"] == selected_id].iloc[0]
+        selected_row = cached("products", ("row", selected_id), lambda: get_data(f"products/{selected_id}"))
+    if selected_row:
         updated_data = {
             "name": st.text_input("Name", selected_row["name"], key=f"name_{selected_id}"),
             "category": st.text_input("Category", selected_row["category"], key=f"category_{selected_id}"),
@@ -172,8 +380,7 @@ elif selection == "Products":
 elif selection == "Suppliers":
     st.title("Suppliers")
 
-    suppliers = get_data("suppliers")
-    df = pd.DataFrame(suppliers)
+    df = cached("suppliers", "frame", lambda: get_frame("suppliers"))
     st.dataframe(df)
 
     with st.expander("Create New Supplier"):
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# main.py imports client.py by bare name (``from client import ...``), the
+# same way it does when started with ``streamlit run frontend/main.py``.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from client import ApiClient
+
+LATENCY = 0.2
+
+
+class StandIn(BaseHTTPRequestHandler):
+    # Plays the API: answers every GET after LATENCY seconds and keeps the
+    # connection open, like the real server behind a keep-alive proxy.
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.startswith("/flaky") and self.server.failures_left:
+            self.server.failures_left -= 1
+            return self.reply(503, {"detail": "busy"})
+        time.sleep(LATENCY)
+        self.reply(200, {"path": self.path})
+
+    def do_POST(self):
+        self.server.posts += 1
+        self.reply(503, {"detail": "busy"})
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    httpd.daemon_threads = True
+    httpd.connections = httpd.posts = httpd.failures_left = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_pooled_client_reuses_its_connection(server):
+    for _ in range(3):
+        requests.get(f"{base_url(server)}/products")
+    assert server.connections == 3
+
+    server.connections = 0
+    api = ApiClient(base_url(server))
+    for _ in range(3):
+        assert api.get("products").json() == {"path": "/products"}
+    assert server.connections == 1
+    api.close()
+
+
+def test_dashboard_load_before_and_after(server):
+    endpoints = ["stats/category-counts", "stats/stock-by-supplier"]
+
+    start = time.perf_counter()
+    for endpoint in endpoints:
+        requests.get(f"{base_url(server)}/{endpoint}")
+    before = time.perf_counter() - start
+
+    api = ApiClient(base_url(server))
+    start = time.perf_counter()
+    responses = api.gather(lambda e=endpoint: api.get(e) for endpoint in endpoints)
+    after = time.perf_counter() - start
+    api.close()
+
+    print(f"dashboard load: {before * 1000:.0f} ms sequential, {after * 1000:.0f} ms pooled + parallel")
+    assert [res.json()["path"] for res in responses] == ["/stats/category-counts", "/stats/stock-by-supplier"]
+    assert before >= LATENCY * len(endpoints)
+    assert after < before * 0.75
+
+
+def test_gets_are_retried_but_posts_are_not(server):
+    server.failures_left = 2
+    api = ApiClient(base_url(server), retries=3, backoff=0)
+
+    assert api.get("flaky").status_code == 200
+    assert api.post("createProduct", json={}).status_code == 503
+    assert server.posts == 1
+    api.close()
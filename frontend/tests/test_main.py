@@ -1,14 +1,16 @@
 import pytest
 from unittest.mock import patch, Mock
 import requests
+import pandas as pd
 
 # Importing your helper functions (adjust path if needed)
-from frontend.main import get_data, create_data, update_data, delete_data, login
+import streamlit as st
+from frontend.main import get_data, get_frame, create_data, update_data, delete_data, login, cached, remember
 
 API_URL = "http://localhost:8000"
 
 # ---- LOGIN TEST ----
-@patch("frontend.main.requests.post")
+@patch("frontend.main.api.post")
 def test_login_success(mock_post):
     mock_response = Mock()
     mock_response.status_code = 200
@@ -18,7 +20,7 @@ def test_login_success(mock_post):
     login("test@example.com", "securepassword")
     print("✅ Login function executed successfully")
 
-@patch("frontend.main.requests.get")
+@patch("frontend.main.api.get")
 def test_get_products(mock_get):
     sample_response = [{"id": 1, "name": "Test Product", "price": 10.0}]
     mock_get.return_value = Mock(status_code=200, json=lambda: sample_response)
@@ -28,7 +30,35 @@ def test_get_products(mock_get):
     assert result[0]["name"] == "Test Product"
     print("✅ get_data(products) returned:", result)
 
-@patch("frontend.main.requests.post")
+@patch("frontend.main.api.get")
+def test_get_data_reuses_copy_on_304(mock_get):
+    body = {"items": [{"id": 1, "name": "Cached Product"}], "next_cursor": None}
+    mock_get.side_effect = [
+        Mock(status_code=200, headers={"ETag": 'W/"v1"'}, json=lambda: body),
+        Mock(status_code=304, headers={"ETag": 'W/"v1"'}),
+    ]
+
+    first = get_data("suppliers", {"limit": 5})
+    second = get_data("suppliers", {"limit": 5})
+    assert second == first == body
+    assert mock_get.call_args.kwargs["headers"]["If-None-Match"] == 'W/"v1"'
+    print("✅ get_data revalidated with If-None-Match and reused its copy")
+
+@patch("frontend.main.api.get")
+def test_get_frame_walks_columnar_pages(mock_get):
+    pages = {
+        None: {"items": {"id": [1, 2], "name": ["A", "B"]}, "next_cursor": 2},
+        2: {"items": {"id": [3], "name": ["C"]}, "next_cursor": None},
+    }
+    mock_get.side_effect = lambda endpoint, headers, params: Mock(
+        status_code=200, headers={}, json=lambda: pages[params.get("cursor")])
+
+    df = get_frame("suppliers", page_size=2)
+    assert df.to_dict("list") == {"id": [1, 2, 3], "name": ["A", "B", "C"]}
+    assert all(call.kwargs["params"]["format"] == "columns" for call in mock_get.call_args_list)
+    print("✅ get_frame() built one DataFrame from columnar pages")
+
+@patch("frontend.main.api.post")
 def test_create_product(mock_post):
     mock_post.return_value = Mock(status_code=201, json=lambda: {"message": "Created"})
     payload = {
@@ -44,7 +74,7 @@ def test_create_product(mock_post):
     assert response.status_code == 201
     print("✅ create_data(product) called with payload:", payload)
 
-@patch("frontend.main.requests.put")
+@patch("frontend.main.api.put")
 def test_update_product(mock_put):
     mock_put.return_value = Mock(status_code=200, json=lambda: {"update": "success"})
     update_payload = {"name": "Updated Product"}
@@ -52,9 +82,81 @@ def test_update_product(mock_put):
     assert response.status_code == 200
     print("✅ update_data(product) updated with:", update_payload)
 
-@patch("frontend.main.requests.delete")
+@patch("frontend.main.api.delete")
 def test_delete_product(mock_delete):
     mock_delete.return_value = Mock(status_code=200, json=lambda: {"update": "deleted"})
     response = delete_data("deleteProduct/1")
     assert response.status_code == 200
     print("✅ delete_data(product) deleted product with ID 1")
+
+# ---- DATA CACHE TESTS ----
+def version_responses(versions):
+    return lambda endpoint, **kwargs: Mock(status_code=200, json=lambda: dict(versions))
+
+@patch("frontend.main.api.get")
+def test_cached_data_is_reused_until_the_server_version_changes(mock_get):
+    st.session_state.data_cache = None
+    versions = {"products": "a.1", "stats": "a.1"}
+    mock_get.side_effect = version_responses(versions)
+    loads = []
+    load = lambda: loads.append(1) or len(loads)
+
+    assert cached("products", "frame", load) == 1
+    assert cached("products", "frame", load) == 1
+    assert mock_get.call_count == 1  # only the version check, and only once
+
+    versions["products"] = "a.2"
+    with patch("frontend.main.VERSION_CHECK_SECONDS", 0):
+        assert cached("products", "frame", load) == 2
+    print("✅ cached() reloaded only after /version changed")
+
+@patch("frontend.main.api.get")
+@patch("frontend.main.api.put")
+def test_own_writes_drop_cached_data(mock_put, mock_get):
+    st.session_state.data_cache = None
+    mock_get.side_effect = version_responses({"products": "a.1"})
+    mock_put.return_value = Mock(status_code=200)
+    cached("products", "frame", lambda: "old")
+    cached("stats", "dashboard", lambda: "old")
+    cached("suppliers", "frame", lambda: "old")
+
+    update_data("updateProduct/1", {"name": "Updated Product"})
+
+    assert cached("products", "frame", lambda: "new") == "new"
+    assert cached("stats", "dashboard", lambda: "new") == "new"
+    assert cached("suppliers", "frame", lambda: "new") == "old"
+    print("✅ update_data dropped products and stats, kept suppliers")
+
+@patch("frontend.main.api.get")
+def test_supplier_frame_is_patched_from_the_change_feed(mock_get):
+    st.session_state.data_cache = None
+    st.session_state.http_cache = {}
+    versions = {"suppliers": "a.1"}
+    events = [{"event_id": "e.5", "entity": "supplier", "id": 1, "op": "update", "version": 2},
+              {"event_id": "e.6", "entity": "supplier", "id": 2, "op": "delete", "version": 1},
+              {"event_id": "e.7", "entity": "supplier", "id": 3, "op": "create", "version": 1}]
+    bodies = {"version": lambda params: dict(versions),
+              "changes": lambda params: ({"events": events, "last_id": "e.7", "reset": False}
+                                         if params.get("since") else {"events": [], "last_id": "e.4", "reset": False}),
+              "suppliers/1": lambda params: {"id": 1, "name": "A2"},
+              "suppliers/3": lambda params: {"id": 3, "name": "C"}}
+    mock_get.side_effect = lambda endpoint, headers, params: Mock(
+        status_code=200, headers={}, json=lambda: bodies[endpoint](params or {}))
+    frame = pd.DataFrame({"id": [1, 2], "name": ["A", "B"]})
+
+    assert cached("suppliers", "frame", lambda: frame).equals(frame)
+    versions["suppliers"] = "a.2"
+    with patch("frontend.main.VERSION_CHECK_SECONDS", 0):
+        patched = cached("suppliers", "frame", lambda: pytest.fail("reloaded instead of patched"))
+    assert patched.to_dict("list") == {"id": [1, 3], "name": ["A2", "C"]}
+    since = [call.kwargs["params"] for call in mock_get.call_args_list if call.args[0] == "changes"][-1]["since"]
+    assert since == "e.4"
+    print("✅ cached() applied /changes to the supplier frame instead of reloading it")
+
+def test_session_stores_are_bounded():
+    store = {}
+    for page in range(200):
+        remember(store, ("page", page), {"items": []})
+    assert len(store) == 64
+    assert next(iter(store)) == ("page", 136)
+    print("✅ remember() kept only the newest entries")